@@ -2,13 +2,13 @@
 import streamlit as st
 from core.db_manager import DBManager
 from core.user_manager import UserManager
-from core.db_migration import migrate_add_user_id_column
+from core.db_migration import migrate_all_databases
 
 @st.cache_resource
 def init_databases():
     """Initialize all separate databases"""
-    # 確保資料庫檔案存在後執行遷移
-    migrate_add_user_id_column()
+    # 確保資料庫檔案存在後執行遷移（每個行程只執行一次）
+    migrate_all_databases()
     return {
         'employees': DBManager('employees'),
         'reminders': DBManager('reminders'),
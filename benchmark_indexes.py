@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+"""
+次要索引效能比較
+在暫存目錄建立 10 萬名員工（每人 3 筆績效、2 筆訓練，一成有離職紀錄）與提醒資料，
+比較有無索引時常用查詢的平均耗時
+
+執行方式：python benchmark_indexes.py [員工數]
+"""
+
+import os
+import sys
+import time
+import random
+import tempfile
+
+import pandas as pd
+
+from core.db_manager import _pool
+from core.db_migration import TABLE_INDEXES
+from core.db_manager_multiuser import DBManagerMultiUser
+
+USER_ID = 1
+LOOKUPS = 500
+
+
+def build_data(db_m5, db_m6, n_employees):
+    """產生並批次匯入測試資料"""
+    emp_ids = [f'E{i:06d}' for i in range(n_employees)]
+    db_m5.import_employee_data(pd.DataFrame({
+        'emp_id': emp_ids,
+        'name': [f'員工{i}' for i in range(n_employees)],
+        'id_number': [f'A{i:09d}' for i in range(n_employees)],
+        'department': [random.choice(['研發部', '人資部', '財務部']) for _ in range(n_employees)],
+    }))
+    db_m5.import_performance_data(pd.DataFrame({
+        'emp_id': emp_ids * 3,
+        'year': [2022] * n_employees + [2023] * n_employees + [2024] * n_employees,
+        'rating': 'B',
+        'score': 80,
+    }))
+    db_m5.import_training_data(pd.DataFrame({
+        'emp_id': emp_ids * 2,
+        'course_name': ['新人訓'] * n_employees + ['資安訓練'] * n_employees,
+        'hours': 3,
+        'completion_date': '2024-01-01',
+    }))
+    db_m5.import_separation_data(pd.DataFrame({
+        'emp_id': emp_ids[::10],
+        'separation_date': '2024-06-30',
+        'separation_type': '自願離職',
+        'reason': '生涯規劃',
+    }))
+    db_m6.import_reminders(pd.DataFrame({
+        'emp_id': emp_ids,
+        'reminder_type': '試用期滿',
+        'created_date': '2024-01-01',
+        'due_date': [f'2025-{i % 12 + 1:02d}-{i % 28 + 1:02d}' for i in range(n_employees)],
+        'status': [random.choice(['pending', 'completed']) for _ in range(n_employees)],
+    }))
+    return emp_ids
+
+
+def run_queries(db_m5, db_m6, emp_ids):
+    """執行各項查詢，回傳 {查詢名稱: 平均毫秒}"""
+    sample = random.sample(emp_ids, LOOKUPS)
+    conn = db_m5._get_connection()
+    queries = {
+        'get_performance_history': lambda emp_id: db_m5.get_performance_history(emp_id),
+        'get_training_history': lambda emp_id: db_m5.get_training_history(emp_id),
+        'get_separation_record': lambda emp_id: db_m5.get_separation_record(emp_id),
+        'M5 find by name': lambda emp_id: conn.execute(
+            "SELECT * FROM employees WHERE name = ?", (f'員工{int(emp_id[1:])}',)).fetchone(),
+        'M5 find by id hash': lambda emp_id: conn.execute(
+            "SELECT * FROM employees WHERE id_number_hash = ?", (emp_id,)).fetchone(),
+        # get_reminders_by_range 的結果會進查詢快取，直接呼叫底層查詢才量得到索引的效果
+        'get_reminders_by_range': lambda emp_id: db_m6._query_reminders_by_range(
+            '2025-03-01', '2025-03-07', 'pending', USER_ID),
+    }
+
+    timings = {}
+    for name, query in queries.items():
+        rounds = sample if name != 'get_reminders_by_range' else sample[:50]
+        start = time.perf_counter()
+        for emp_id in rounds:
+            query(emp_id)
+        timings[name] = (time.perf_counter() - start) * 1000 / len(rounds)
+    conn.close()
+    return timings
+
+
+def set_indexes(enabled, *dbs):
+    """建立或移除 TABLE_INDEXES 中的所有索引"""
+    for db in dbs:
+        conn = db._get_connection()
+        tables = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+        for table_name, statements in TABLE_INDEXES.items():
+            for sql in statements:
+                if enabled and table_name in tables:
+                    conn.execute(sql)
+                elif not enabled:
+                    index_name = sql.split('EXISTS ')[1].split(' ')[0]
+                    conn.execute(f"DROP INDEX IF EXISTS {index_name}")
+        conn.commit()
+        conn.close()
+
+
+def main():
+    n_employees = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    cwd = os.getcwd()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.chdir(tmp)
+        try:
+            db_m5 = DBManagerMultiUser('m5_qualification', user_id=USER_ID)
+            db_m6 = DBManagerMultiUser('m6_reminders', user_id=USER_ID)
+
+            print(f'建立測試資料：{n_employees:,} 名員工 ...')
+            emp_ids = build_data(db_m5, db_m6, n_employees)
+
+            set_indexes(False, db_m5, db_m6)
+            before = run_queries(db_m5, db_m6, emp_ids)
+
+            set_indexes(True, db_m5, db_m6)
+            after = run_queries(db_m5, db_m6, emp_ids)
+
+            print(f"\n{'查詢':<28}{'無索引 (ms)':>14}{'有索引 (ms)':>14}{'倍數':>10}")
+            for name in before:
+                speedup = before[name] / after[name] if after[name] else float('inf')
+                print(f'{name:<28}{before[name]:>14.3f}{after[name]:>14.3f}{speedup:>9.0f}x')
+        finally:
+            _pool.close_all()
+            os.chdir(cwd)
+
+
+if __name__ == '__main__':
+    main()
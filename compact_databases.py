@@ -0,0 +1,29 @@
+# -*- coding: utf-8 -*-
+"""
+Compact all application databases (full VACUUM)
+Admin maintenance: run while the app is idle, e.g. after large purges
+"""
+
+import os
+
+from core.db_manager import DBManager
+from core.db_migration import DATABASES
+
+print("=" * 60)
+print("Compacting Databases")
+print("=" * 60)
+
+for db_name in DATABASES:
+    if not os.path.exists(f'data/{db_name}.db'):
+        continue
+
+    print(f"\nCompacting {db_name}.db...")
+    result = DBManager(db_name).compact()
+    if result['success']:
+        print(f"  + {result['size_before'] / 1024:.0f} KB -> {result['size_after'] / 1024:.0f} KB")
+    else:
+        print(f"  - Error: {result['error']}")
+
+print("\n" + "=" * 60)
+print("Compaction Complete")
+print("=" * 60)
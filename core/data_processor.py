@@ -51,42 +51,106 @@ class DataProcessor:
         }
 
     def apply_cleaning_step(self, step):
-        action = step['action']
-        column = step.get('column')
-
         self.history.append({
             'step': step,
             'before_shape': self.df.shape
         })
+        self.df = self.apply_step(self.df, step)
+        return self.df
+
+    @staticmethod
+    def apply_step(df, step, seen=None):
+        """
+        Apply one cleaning step to df and return the result
+
+        Args:
+            df: DataFrame (modified in place for column-level steps)
+            step: Cleaning step dict
+            seen: For streamed chunks, a set of row hashes already kept by earlier chunks;
+                remove_duplicates then also drops rows seen in those chunks
+        """
+        action = step['action']
+        column = step.get('column')
 
         if action == 'trim_whitespace' and column:
-            self.df[column] = self.df[column].astype(str).str.strip()
+            df[column] = df[column].astype(str).str.strip()
         elif action == 'unify_date_format' and column:
             fmt = step.get('format', '%Y-%m-%d')
-            self.df[column] = pd.to_datetime(self.df[column], errors='coerce').dt.strftime(fmt)
+            df[column] = pd.to_datetime(df[column], errors='coerce').dt.strftime(fmt)
         elif action == 'remove_duplicates':
             subset = step.get('subset')
             keep = step.get('keep', 'first')
-            self.df = self.df.drop_duplicates(subset=subset, keep=keep)
+            if seen is None:
+                df = df.drop_duplicates(subset=subset, keep=keep)
+            else:
+                df = DataProcessor.drop_seen_duplicates(df, seen, subset=subset, keep=keep)
         elif action == 'fill_na' and column:
             fill_value = step.get('value', '')
-            self.df[column] = self.df[column].fillna(fill_value)
+            df[column] = df[column].fillna(fill_value)
         elif action == 'rename_column' and column:
             new_name = step.get('new_name')
             if new_name:
-                self.df = self.df.rename(columns={column: new_name})
+                df = df.rename(columns={column: new_name})
         elif action == 'convert_type' and column:
             target_type = step.get('target_type', 'string')
             if target_type == 'numeric':
-                self.df[column] = pd.to_numeric(self.df[column], errors='coerce')
+                df[column] = pd.to_numeric(df[column], errors='coerce')
             elif target_type == 'datetime':
-                self.df[column] = pd.to_datetime(self.df[column], errors='coerce')
+                df[column] = pd.to_datetime(df[column], errors='coerce')
             elif target_type == 'string':
-                self.df[column] = self.df[column].astype(str)
+                df[column] = df[column].astype(str)
         elif action == 'drop_column' and column:
-            self.df = self.df.drop(columns=[column])
+            df = df.drop(columns=[column])
 
-        return self.df
+        return df
+
+    @staticmethod
+    def _comparable(series):
+        """
+        Values as text that compares the way pd.concat(...).drop_duplicates() would
+
+        Each chunk infers its own dtypes (a column can be int64 in one chunk and float64 with
+        NaN in the next), so whole-number floats are written like integers and missing values
+        share one marker before hashing.
+        """
+        text = series.astype('string')
+        if pd.api.types.is_float_dtype(series):
+            whole = series.notna() & (series == series.round()) & (series.abs() < 2 ** 63)
+            text[whole] = series[whole].astype('int64').astype('string')
+        return text.fillna('\0')
+
+    @staticmethod
+    def drop_seen_duplicates(df, seen, subset=None, keep='first'):
+        """
+        Drop duplicate rows of a chunk, including rows already kept from earlier chunks
+
+        Rows are compared by a 64-bit hash of their values (see _comparable), and the hashes
+        of kept rows are added to seen, so memory grows with the number of distinct rows, not
+        their width.
+        Only keep='first' can be decided chunk by chunk.
+        """
+        if keep != 'first':
+            raise ValueError('分段處理的移除重複值只支援保留第一筆')
+        frame = df[subset] if subset else df
+        hashes = pd.util.hash_pandas_object(
+            pd.DataFrame({col: DataProcessor._comparable(frame[col]) for col in frame.columns}), index=False)
+        keep_mask = ~hashes.duplicated() & ~hashes.isin(seen)
+        seen.update(hashes[keep_mask].tolist())
+        return df[keep_mask.to_numpy()]
+
+    @staticmethod
+    def clean_chunks(chunks, steps):
+        """
+        Apply cleaning steps to a stream of chunks (e.g. FileHandler.iter_chunks)
+
+        Yields:
+            Cleaned DataFrame per chunk; duplicates are removed across chunks
+        """
+        seen = {}
+        for chunk in chunks:
+            for idx, step in enumerate(steps):
+                chunk = DataProcessor.apply_step(chunk, step, seen=seen.setdefault(idx, set()))
+            yield chunk
 
     def reset(self):
         """Reset to original dataframe"""
@@ -1,10 +1,314 @@
 # -*- coding: utf-8 -*-
 import sqlite3
 import os
+import threading
 from datetime import datetime
 from typing import List, Dict, Optional
 import hashlib
 
+import pandas as pd
+
+from core.db_migration import (migrate_database, vacuum_database, NATURAL_KEYS, ROW_COUNTERS,
+                               AUTO_VACUUM_INCREMENTAL, natural_key_target)
+from core.db_writer import get_write_queue
+from core.query_cache import query_cache
+from core.query_stats import InstrumentedConnection, instrument_methods
+
+
+class _PooledConnection:
+    """
+    Borrowed handle to a pooled connection
+
+    Behaves like sqlite3.Connection, except close() only hands the connection
+    back to the pool (rolling back anything left uncommitted) instead of
+    closing the underlying file handle.
+    """
+
+    __slots__ = ('_conn',)
+
+    def __init__(self, conn):
+        self._conn = conn
+
+    def __getattr__(self, name):
+        return getattr(self._conn, name)
+
+    def __enter__(self):
+        return self._conn.__enter__()
+
+    def __exit__(self, exc_type, exc, tb):
+        return self._conn.__exit__(exc_type, exc, tb)
+
+    def close(self):
+        if self._conn.in_transaction:
+            self._conn.rollback()
+
+
+class _ThreadConnections(dict):
+    """Connections pinned to one thread; returned to the idle pool when the thread ends"""
+
+    def __init__(self, pool):
+        super().__init__()
+        self._pool = pool
+
+    def __del__(self):
+        try:
+            for db_path, conn in self.items():
+                self._pool._release(db_path, conn)
+        except Exception:
+            # Interpreter shutdown: the pool may already be torn down
+            pass
+
+
+class ConnectionPool:
+    """
+    Thread-local SQLite connection pool
+
+    Each thread keeps one long-lived connection per database file. When a thread
+    finishes (Streamlit starts a new script thread per rerun) its connections go
+    back to an idle list and are adopted by the next thread instead of reconnecting.
+
+    Every new connection is tuned once:
+    - journal_mode=WAL: readers no longer block the writer
+    - synchronous=NORMAL: safe with WAL, avoids an fsync per commit
+    - busy_timeout: wait for locks instead of failing with "database is locked"
+    - cache_size: larger page cache kept warm across method calls
+    - auto_vacuum=INCREMENTAL (new files): pages freed by deletes can be returned to the filesystem
+    - InstrumentedConnection: statements are timed into query_stats when enabled (see core/query_stats.py)
+    """
+
+    def __init__(self, busy_timeout_ms=5000, cache_size_kb=16384):
+        self.busy_timeout_ms = busy_timeout_ms
+        self.cache_size_kb = cache_size_kb
+        self._local = threading.local()
+        self._idle = {}
+        self._lock = threading.Lock()
+
+    def _open(self, db_path):
+        conn = sqlite3.connect(db_path, timeout=self.busy_timeout_ms / 1000, check_same_thread=False,
+                               factory=InstrumentedConnection)
+        conn.db_path = db_path
+        conn.row_factory = sqlite3.Row
+        # Only takes effect on a new, empty file; existing files are converted once by migrate_database
+        conn.execute(f"PRAGMA auto_vacuum={AUTO_VACUUM_INCREMENTAL}")
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(f"PRAGMA busy_timeout={int(self.busy_timeout_ms)}")
+        conn.execute(f"PRAGMA cache_size=-{int(self.cache_size_kb)}")
+        # INSERT OR REPLACE must fire DELETE triggers so employees_fts drops the replaced row
+        conn.execute("PRAGMA recursive_triggers=ON")
+        return conn
+
+    def _release(self, db_path, conn):
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            return
+        with self._lock:
+            self._idle.setdefault(db_path, []).append(conn)
+
+    def acquire(self, db_path):
+        """Borrow the calling thread's connection for db_path"""
+        db_path = os.path.abspath(db_path)
+        conns = getattr(self._local, 'conns', None)
+        if conns is None:
+            conns = self._local.conns = _ThreadConnections(self)
+
+        conn = conns.get(db_path)
+        if conn is None:
+            with self._lock:
+                idle = self._idle.get(db_path)
+                conn = idle.pop() if idle else None
+            if conn is None:
+                conn = self._open(db_path)
+            conns[db_path] = conn
+        elif conn.in_transaction:
+            # A previous caller failed before commit/close; do not inherit its transaction
+            conn.rollback()
+
+        return _PooledConnection(conn)
+
+    def close_all(self, db_path=None):
+        """Close idle connections and the calling thread's connections (all files or one file)"""
+        target = os.path.abspath(db_path) if db_path else None
+        with self._lock:
+            for path in list(self._idle):
+                if target is None or path == target:
+                    for conn in self._idle.pop(path):
+                        conn.close()
+        conns = getattr(self._local, 'conns', None) or {}
+        for path in list(conns):
+            if target is None or path == target:
+                conns.pop(path).close()
+
+
+# Process-wide pool shared by every DBManager instance
+_pool = ConnectionPool()
+
+# Database files whose schema has been created/migrated in this process
+_initialized_paths = set()
+_init_lock = threading.Lock()
+
+# Database path -> whether the employees_fts search index exists
+_search_index_paths = {}
+
+# Default maximum number of rows returned by search_employee
+SEARCH_LIMIT = 100
+
+
+# 匯入欄位別名：標準欄位 -> 可接受的欄位名稱（不區分大小寫）
+IMPORT_COLUMNS = {
+    'employees': {
+        'emp_id': ['emp_id', '工號', '員工編號', 'employee_id'],
+        'name': ['name', '姓名', '員工姓名', 'employee_name'],
+        'id_number': ['id_number', '身分證字號', '身份證', 'id_card'],
+        'department': ['department', '部門', 'dept'],
+        'hire_date': ['hire_date', '到職日', '入職日期', 'arrival_date'],
+        'status': ['status', '狀態'],
+    },
+    'performance': {
+        'emp_id': ['emp_id', '工號', '員工編號', 'employee_id'],
+        'year': ['year', '年度', '考核年度'],
+        'rating': ['rating', '考績', '等級', '評等'],
+        'score': ['score', '分數', '績效分數'],
+    },
+    'training': {
+        'emp_id': ['emp_id', '工號', '員工編號', 'employee_id'],
+        'course_name': ['course_name', '課程名稱', '訓練課程'],
+        'course_type': ['course_type', '課程類別', '課程類型', '訓練類型'],
+        'hours': ['hours', '時數', '訓練時數'],
+        'completion_date': ['completion_date', '完成日期', '完訓日期', '結訓日期'],
+    },
+    'separation': {
+        'emp_id': ['emp_id', '工號', '員工編號', 'employee_id'],
+        'separation_date': ['separation_date', '離職日期', '離職時間'],
+        'separation_type': ['separation_type', '離職類型', '離職性質'],
+        'reason': ['reason', '離職原因', '原因'],
+        'blacklist': ['blacklist', '黑名單'],
+    },
+    'reminders': {
+        'emp_id': ['emp_id', '工號', '員工編號', 'employee_id'],
+        'emp_name': ['emp_name', 'name', '姓名'],
+        'reminder_type': ['reminder_type', '提醒類型', '類型'],
+        'created_date': ['created_date', '建立日期'],
+        'due_date': ['due_date', '到期日'],
+        'notes': ['notes', '備註'],
+        'status': ['status', '狀態'],
+    },
+}
+
+# 各表匯入時不可為空的欄位
+IMPORT_REQUIRED = {
+    'employees': ['emp_id', 'name'],
+    'performance': ['emp_id', 'year'],
+    'training': ['emp_id', 'course_name'],
+    'separation': ['emp_id'],
+    'reminders': ['emp_id', 'reminder_type', 'created_date', 'due_date'],
+}
+
+_DATE_COLUMNS = {'hire_date', 'completion_date', 'separation_date', 'created_date', 'due_date'}
+_INTEGER_COLUMNS = {'year'}
+_REAL_COLUMNS = {'score', 'hours'}
+
+# Column types applied by fetch_frame: low-cardinality labels become categoricals, dates become datetimes
+FRAME_DTYPES = {
+    'department': 'category',
+    'status': 'category',
+    'reminder_type': 'category',
+    **{column: 'datetime' for column in _DATE_COLUMNS | {'completed_date'}},
+}
+
+# Tables emptied by clear_all_data for each database (m5_qualification can clear one table at a time)
+CLEAR_TABLES = {
+    'm5_qualification': ['employees', 'performance', 'training', 'separation'],
+    **{db_name: ['employees'] for db_name in ('employees', 'm4_employees', 'm5_employees')},
+    **{db_name: ['reminders', 'employees'] for db_name in ('reminders', 'm6_reminders')},
+    **{f'{prefix}{table}': [table] for prefix in ('', 'm4_', 'm5_') for table in ('performance', 'training', 'separation')},
+}
+
+# get_database_stats keys per database: stat -> row_counts counter (None is always 0)
+_EMPLOYEE_STATS = {'active_employees': 'active_employees', 'performance_records': None, 'training_records': None}
+DATABASE_STATS = {
+    **dict.fromkeys(['employees', 'm4_employees', 'm5_employees'], _EMPLOYEE_STATS),
+    'm5_qualification': {'active_employees': 'active_employees', 'performance_records': 'performance',
+                         'training_records': 'training', 'separation_records': 'separation'},
+    **dict.fromkeys(['reminders', 'm6_reminders'], {'pending_reminders': 'pending_reminders'}),
+    **dict.fromkeys(['performance', 'm4_performance', 'm5_performance'], {'performance_records': 'performance'}),
+    **dict.fromkeys(['training', 'm4_training', 'm5_training'], {'training_records': 'training'}),
+}
+
+# row_counts counter -> the table whose triggers maintain it
+_COUNTER_TABLES = {name: table for table, counters in ROW_COUNTERS.items() for name in counters}
+
+# Keys an incremental import matches uploaded rows on. Reminders have none: their status
+# changes after import, so re-uploading them would undo completed reminders.
+INCREMENTAL_KEYS = {'employees': ('emp_id',), **NATURAL_KEYS}
+
+
+def _row_hashes(frame):
+    """
+    Vectorized 64-bit content hash of each row, stored in the row_hash column.
+
+    user_id and updated_at are excluded so an unchanged row hashes the same on every import.
+    Values are reinterpreted as signed integers to fit SQLite's INTEGER.
+    """
+    content = frame[[c for c in frame.columns if c not in ('user_id', 'updated_at', 'row_hash')]]
+    hashes = pd.util.hash_pandas_object(content, index=False).to_numpy().view('int64')
+    return pd.Series(hashes, index=frame.index)
+
+
+def _upsert_sql(table, columns, select=None):
+    """
+    INSERT statement for table that upserts on its natural key.
+
+    Rows whose natural key (user_id + NATURAL_KEYS) already exists are updated in place,
+    and only when a value actually differs, so re-importing unchanged rows writes nothing.
+    Tables without a natural key get a plain INSERT (employees: INSERT OR REPLACE on emp_id).
+
+    Args:
+        table: Target table
+        columns: Inserted columns
+        select: Optional SELECT replacing the VALUES clause (must end in a WHERE clause)
+    """
+    source = select or f"VALUES ({', '.join('?' * len(columns))})"
+    if table not in NATURAL_KEYS:
+        verb = 'INSERT OR REPLACE' if table == 'employees' else 'INSERT'
+        return f"{verb} INTO {table} ({', '.join(columns)}) {source}"
+
+    key = set(NATURAL_KEYS[table]) | {'user_id'}
+    values = [c for c in columns if c not in key and c != 'updated_at']
+    sql = (f"INSERT INTO {table} ({', '.join(columns)}) {source} "
+           f"ON CONFLICT({natural_key_target(table)}) DO ")
+    if not values:
+        return sql + "NOTHING"
+    assignments = values + (['updated_at'] if 'updated_at' in columns else [])
+    return (sql + "UPDATE SET " + ', '.join(f"{c} = excluded.{c}" for c in assignments)
+            + " WHERE " + ' OR '.join(f"{c} IS NOT excluded.{c}" for c in values))
+
+
+def _as_text(series):
+    """Column to stripped strings; whole-number floats (Excel IDs) lose their '.0', blanks become NA"""
+    if pd.api.types.is_float_dtype(series):
+        values = series.dropna()
+        if (values == values.round()).all():
+            series = series.astype('Int64')
+    text = series.astype('string').str.strip()
+    return text.mask(text == '')
+
+
+def _as_date_text(series):
+    """Column of dates to 'YYYY-MM-DD' text; values that do not parse are kept as text"""
+    parsed = pd.to_datetime(series, errors='coerce', format='mixed')
+    return parsed.dt.strftime('%Y-%m-%d').fillna(_as_text(series))
+
+
+def _as_flag(series):
+    """Column of TRUE/FALSE, 1/0, 是/否 values to booleans (blank -> False)"""
+    text = series.astype('string').str.strip().str.lower()
+    return text.isin(['true', '1', '1.0', 'yes', 'y', '是', 'v']).fillna(False).astype(bool)
+
+
+@instrument_methods
 class DBManager:
     def __init__(self, db_name='employees'):
         """
@@ -19,13 +323,102 @@ class DBManager:
         """
         self.db_name = db_name
         self.db_path = f'data/{db_name}.db'
-        os.makedirs('data', exist_ok=True)
-        self._init_database()
+
+        # Schema DDL runs once per database file per process; later instances are cheap handles
+        path = os.path.abspath(self.db_path)
+        if path not in _initialized_paths:
+            with _init_lock:
+                if path not in _initialized_paths:
+                    os.makedirs('data', exist_ok=True)
+                    self._init_database()
+                    _initialized_paths.add(path)
     
     def _get_connection(self):
-        conn = sqlite3.connect(self.db_path)
-        conn.row_factory = sqlite3.Row
-        return conn
+        """Borrow this thread's pooled connection; close() returns it to the pool"""
+        return _pool.acquire(self.db_path)
+
+    def submit_write(self, func, tables=None):
+        """
+        Queue a write for this file's writer thread.
+
+        func(conn) runs inside the writer's transaction, grouped with other pending writes into a
+        single commit; it must not commit or roll back itself.
+
+        Args:
+            func: func(conn) performing the write
+            tables: Tables func writes to; cached query results on them are invalidated after the
+                commit (None invalidates every cached result for this file)
+
+        Returns:
+            concurrent.futures.Future resolving to func's return value once committed
+        """
+        db_path = self.db_path
+        return get_write_queue(db_path, _pool._open).submit(
+            func, on_commit=lambda: query_cache.bump(db_path, tables))
+
+    def _write(self, func, tables=None):
+        """Run func(conn) on the writer thread and wait until it is committed"""
+        return self.submit_write(func, tables).result()
+
+    def reclaim_space(self):
+        """
+        Return this file's free pages to the filesystem in the background.
+
+        Queues PRAGMA incremental_vacuum and a passive checkpoint (the file only shrinks once the
+        WAL is checkpointed) after the pending writes, without waiting. The data is unchanged,
+        so cached reads stay valid.
+
+        Returns:
+            concurrent.futures.Future resolving to the number of free pages left
+        """
+        def reclaim(conn):
+            # execute() stops after the first page for this pragma; executescript runs it to completion
+            conn.executescript("PRAGMA incremental_vacuum;")
+            conn.execute("PRAGMA wal_checkpoint(PASSIVE)").fetchall()
+            return conn.execute("PRAGMA freelist_count").fetchone()[0]
+
+        return get_write_queue(self.db_path, _pool._open).submit_idle(reclaim)
+
+    def compact(self):
+        """
+        Full compaction (VACUUM) of this file, for the admin maintenance script.
+
+        Rewrites the file without free pages or fragmentation and switches it to
+        auto_vacuum=INCREMENTAL. Writes to the file wait until it finishes.
+
+        Returns:
+            {'success': True, 'size_before': bytes, 'size_after': bytes} or {'success': False, 'error': ...}
+        """
+        try:
+            size_before = os.path.getsize(self.db_path)
+            get_write_queue(self.db_path, _pool._open).submit_idle(vacuum_database).result()
+            # VACUUM may renumber employees rowids; drop cached results to be safe
+            query_cache.bump(self.db_path)
+            return {'success': True, 'size_before': size_before, 'size_after': os.path.getsize(self.db_path)}
+        except Exception as e:
+            print(f"Compact error: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def _cached(self, tables, key, loader):
+        """
+        Serve loader() through the query cache.
+
+        The result is reused (as a copy) until a write to one of tables commits.
+        key must identify the query, its parameters and the user_id it is scoped to.
+        """
+        self._sync_external_writes()
+        return query_cache.get_or_load(self.db_path, tables, key, loader)
+
+    def _sync_external_writes(self):
+        """
+        Drop this file's cached results if another connection has committed to it.
+
+        Other Streamlit worker processes share the data/ files but not this process's
+        write queue. The check polls PRAGMA data_version on the writer connection,
+        which is a cheap in-memory read that ignores the writer's own commits.
+        """
+        if get_write_queue(self.db_path, _pool._open).poll_external():
+            query_cache.bump(self.db_path)
     
     def _init_database(self):
         conn = self._get_connection()
@@ -129,91 +522,149 @@ class DBManager:
         tables = table_schemas.get(self.db_name, [])
         for table_sql in tables:
             cursor.execute(table_sql)
+
         conn.commit()
         conn.close()
+
+        # Bring existing files up to the current schema version (no-op once migrated)
+        migrate_database(self.db_path)
     
     def add_employee(self, emp_id, name, id_number=None, department=None, hire_date=None, status='active'):
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            def write(conn):
+                cursor = conn.cursor()
 
-            # Hash id_number if provided for privacy
-            id_number_hash = None
-            if id_number:
-                id_number_hash = hashlib.sha256(id_number.encode()).hexdigest()
+                # Hash id_number if provided for privacy
+                id_number_hash = None
+                if id_number:
+                    id_number_hash = hashlib.sha256(id_number.encode()).hexdigest()
 
-            cursor.execute(
-                "INSERT OR REPLACE INTO employees (emp_id, name, id_number_hash, department, hire_date, status) VALUES (?, ?, ?, ?, ?, ?)",
-                (emp_id, name, id_number_hash, department, hire_date, status))
-            conn.commit()
-            conn.close()
+                cursor.execute(
+                    "INSERT OR REPLACE INTO employees (emp_id, name, id_number_hash, department, hire_date, status) VALUES (?, ?, ?, ?, ?, ?)",
+                    (emp_id, name, id_number_hash, department, hire_date, status))
+
+            self._write(write, ('employees',))
             return True
         except Exception as e:
             print(f"Error adding employee: {e}")
             return False
     
-    def search_employee(self, keyword):
+    def search_employee(self, keyword, limit=SEARCH_LIMIT):
+        return self._search_employees(keyword, None, limit)
+
+    def _has_search_index(self, conn):
+        """Whether this file has the employees_fts trigram index (missing on SQLite < 3.34)"""
+        path = os.path.abspath(self.db_path)
+        if path not in _search_index_paths:
+            row = conn.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'employees_fts'").fetchone()
+            _search_index_paths[path] = row is not None
+        return _search_index_paths[path]
+
+    def _search_employees(self, keyword, uid, limit):
+        """
+        Search employees by emp_id, name or department substring.
+
+        Keywords of 3+ characters go through the employees_fts trigram index and are ranked
+        by exact emp_id/name match first, then bm25. Shorter keywords cannot form a trigram
+        and fall back to exact matches followed by a LIKE scan. An empty keyword lists every
+        employee without a limit. Results are cached until the employees table is written.
+        """
+        keyword = (keyword or '').strip()
+        return self._cached(('employees',), ('search_employee', keyword, limit, uid),
+                            lambda: self._query_employees(keyword, uid, limit))
+
+    def _query_employees(self, keyword, uid, limit):
         conn = self._get_connection()
         cursor = conn.cursor()
-        cursor.execute(
-            "SELECT emp_id, name, department, hire_date, status FROM employees WHERE emp_id LIKE ? OR name LIKE ?",
-            (f'%{keyword}%', f'%{keyword}%'))
+
+        columns = "e.emp_id, e.name, e.department, e.hire_date, e.status"
+        user_filter = " AND e.user_id = ?" if uid is not None else ""
+        user_params = (uid,) if uid is not None else ()
+
+        if not keyword:
+            cursor.execute(
+                f"SELECT {columns} FROM employees e WHERE 1 = 1{user_filter} ORDER BY e.emp_id",
+                user_params)
+        elif len(keyword) >= 3 and self._has_search_index(conn):
+            phrase = '"' + keyword.replace('"', '""') + '"'
+            cursor.execute(
+                f"""SELECT {columns} FROM employees_fts f JOIN employees e ON e.rowid = f.rowid
+                    WHERE employees_fts MATCH ?{user_filter}
+                    ORDER BY (e.emp_id = ? OR e.name = ?) DESC, f.rank LIMIT ?""",
+                ('{emp_id name department}: ' + phrase, *user_params, keyword, keyword, limit))
+        else:
+            pattern = '%' + keyword.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+            # Exact matches come first through the primary key / name index (the unary + keeps
+            # the planner off the user_id index); the LIKE scan after them stops once the limit is filled
+            exact_user_filter = " AND +e.user_id = ?" if uid is not None else ""
+            cursor.execute(
+                f"""SELECT {columns} FROM employees e
+                    WHERE (e.emp_id = ? OR e.name = ?){exact_user_filter}
+                    UNION ALL
+                    SELECT {columns} FROM employees e
+                    WHERE (e.emp_id LIKE ? ESCAPE '\\' OR e.name LIKE ? ESCAPE '\\' OR e.department LIKE ? ESCAPE '\\')
+                      AND NOT (e.emp_id = ? OR e.name = ?){user_filter}
+                    LIMIT ?""",
+                (keyword, keyword, *user_params,
+                 pattern, pattern, pattern, keyword, keyword, *user_params, limit))
+
         results = [dict(row) for row in cursor.fetchall()]
         conn.close()
         return results
     
-    def get_database_stats(self):
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        stats = {}
-
-        # Check which tables exist in this database and provide appropriate stats
-        if self.db_name in ['employees', 'm4_employees', 'm5_employees']:
-            cursor.execute("SELECT COUNT(*) as count FROM employees WHERE status = 'active'")
-            stats['active_employees'] = cursor.fetchone()['count']
-            stats['performance_records'] = 0
-            stats['training_records'] = 0
-        elif self.db_name == 'm5_qualification':
-            # M5 single database with all 4 tables
-            cursor.execute("SELECT COUNT(*) as count FROM employees WHERE status = 'active'")
-            stats['active_employees'] = cursor.fetchone()['count']
-            cursor.execute("SELECT COUNT(*) as count FROM performance")
-            stats['performance_records'] = cursor.fetchone()['count']
-            cursor.execute("SELECT COUNT(*) as count FROM training")
-            stats['training_records'] = cursor.fetchone()['count']
-            cursor.execute("SELECT COUNT(*) as count FROM separation")
-            stats['separation_records'] = cursor.fetchone()['count']
-        elif self.db_name in ['reminders', 'm6_reminders']:
-            cursor.execute("SELECT COUNT(*) as count FROM reminders WHERE status = 'pending'")
-            stats['pending_reminders'] = cursor.fetchone()['count']
-        elif self.db_name in ['performance', 'm4_performance', 'm5_performance']:
-            cursor.execute("SELECT COUNT(*) as count FROM performance")
-            stats['performance_records'] = cursor.fetchone()['count']
-        elif self.db_name in ['training', 'm4_training', 'm5_training']:
-            cursor.execute("SELECT COUNT(*) as count FROM training")
-            stats['training_records'] = cursor.fetchone()['count']
+    def get_database_stats(self, user_id=None):
+        """
+        Row counts for the stats widgets, read from the trigger-maintained row_counts table.
 
-        conn.close()
-        return stats
-    
-    # Reminder system methods
-    def add_reminder(self, emp_id, emp_name, reminder_type, created_date, due_date, notes=''):
-        try:
+        One indexed lookup instead of a COUNT(*) scan per table. user_id=None sums the
+        counters of every user.
+        """
+        stat_counters = DATABASE_STATS.get(self.db_name, {})
+        counters = sorted({name for name in stat_counters.values() if name})
+        if not counters:
+            return dict.fromkeys(stat_counters, 0)
+
+        def load():
             conn = self._get_connection()
             cursor = conn.cursor()
-            cursor.execute(
-                """INSERT INTO reminders (emp_id, emp_name, reminder_type, created_date, due_date, notes, status)
-                   VALUES (?, ?, ?, ?, ?, ?, 'pending')""",
-                (emp_id, emp_name, reminder_type, created_date, due_date, notes)
-            )
-            conn.commit()
+            placeholders = ', '.join('?' * len(counters))
+            if user_id is not None:
+                cursor.execute(
+                    f"SELECT name, count FROM row_counts WHERE IFNULL(user_id, -1) = ? AND name IN ({placeholders})",
+                    (user_id, *counters))
+            else:
+                cursor.execute(
+                    f"SELECT name, SUM(count) FROM row_counts WHERE name IN ({placeholders}) GROUP BY name", counters)
+            counts = {row[0]: row[1] for row in cursor.fetchall()}
             conn.close()
+            return {key: counts.get(name, 0) if name else 0 for key, name in stat_counters.items()}
+
+        tables = tuple(sorted({_COUNTER_TABLES[name] for name in counters}))
+        return self._cached(tables, ('get_database_stats', user_id), load)
+
+    # Reminder system methods
+    def add_reminder(self, emp_id, emp_name, reminder_type, created_date, due_date, notes=''):
+        try:
+            def write(conn):
+                cursor = conn.cursor()
+                cursor.execute(
+                    """INSERT INTO reminders (emp_id, emp_name, reminder_type, created_date, due_date, notes, status)
+                       VALUES (?, ?, ?, ?, ?, ?, 'pending')""",
+                    (emp_id, emp_name, reminder_type, created_date, due_date, notes)
+                )
+
+            self._write(write, ('reminders',))
             return True
         except Exception as e:
             print(f"Error adding reminder: {e}")
             return False
 
     def get_reminders_by_range(self, start_date, end_date, status=None):
+        return self._cached(('reminders',), ('get_reminders_by_range', start_date, end_date, status, None),
+                            lambda: self._query_reminders_by_range(start_date, end_date, status))
+
+    def _query_reminders_by_range(self, start_date, end_date, status):
         conn = self._get_connection()
         cursor = conn.cursor()
 
@@ -242,16 +693,16 @@ class DBManager:
 
     def mark_reminder_completed(self, reminder_id):
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                """UPDATE reminders
-                   SET status = 'completed', completed_date = ?
-                   WHERE id = ?""",
-                (datetime.now().strftime('%Y-%m-%d'), reminder_id)
-            )
-            conn.commit()
-            conn.close()
+            def write(conn):
+                cursor = conn.cursor()
+                cursor.execute(
+                    """UPDATE reminders
+                       SET status = 'completed', completed_date = ?
+                       WHERE id = ?""",
+                    (datetime.now().strftime('%Y-%m-%d'), reminder_id)
+                )
+
+            self._write(write, ('reminders',))
             return True
         except:
             return False
@@ -290,68 +741,335 @@ class DBManager:
         conn.close()
         return dict(result) if result else None
 
-    def import_employee_data(self, df):
+    # ========== Bulk Import ==========
+
+    def import_employee_data(self, df, column_map=None, defaults=None, incremental=False):
         """Import employee master data from dataframe"""
-        try:
-            conn = self._get_connection()
-            for _, row in df.iterrows():
-                emp_id = row.get('emp_id') or row.get('工號')
-                name = row.get('name') or row.get('姓名')
-                department = row.get('department') or row.get('部門')
-                hire_date = row.get('hire_date') or row.get('到職日')
-
-                if emp_id and name:
-                    self.add_employee(emp_id, name, None, department, hire_date)
-            conn.close()
-            return {'success': True, 'count': len(df)}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
+        return self.bulk_import('employees', df, column_map, defaults, incremental=incremental)
 
-    def import_performance_data(self, df):
+    def import_performance_data(self, df, column_map=None, defaults=None, incremental=False):
         """Import performance data from dataframe"""
+        return self.bulk_import('performance', df, column_map, defaults, incremental=incremental)
+
+    def import_training_data(self, df, column_map=None, defaults=None, incremental=False):
+        """Import training data from dataframe"""
+        return self.bulk_import('training', df, column_map, defaults, incremental=incremental)
+
+    def import_separation_data(self, df, column_map=None, defaults=None, incremental=False):
+        """Import separation data from dataframe"""
+        return self.bulk_import('separation', df, column_map, defaults, incremental=incremental)
+
+    def import_reminders(self, df, column_map=None, defaults=None):
+        """Import reminders from dataframe"""
+        return self.bulk_import('reminders', df, column_map, defaults)
+
+    @staticmethod
+    def resolve_import_columns(df, table, column_map=None):
+        """
+        Resolve dataframe headers to canonical column names, once per column
+
+        Args:
+            df: Source dataframe
+            table: Target table name (key of IMPORT_COLUMNS)
+            column_map: Optional explicit {canonical: df column} overrides
+
+        Returns:
+            Dict of {canonical column: df column} for every column found
+        """
+        df_columns = {str(col).lower().strip(): col for col in df.columns}
+        resolved = {}
+        for canonical, aliases in IMPORT_COLUMNS[table].items():
+            for alias in aliases:
+                if alias.lower() in df_columns:
+                    resolved[canonical] = df_columns[alias.lower()]
+                    break
+        for canonical, col in (column_map or {}).items():
+            if col is not None and col in df.columns:
+                resolved[canonical] = col
+        return resolved
+
+    @staticmethod
+    def hash_id_numbers(series):
+        """SHA-256 hash a column of ID numbers (each distinct value is hashed once)"""
+        text = _as_text(series)
+        uniques = text.dropna().unique()
+        hashes = {value: hashlib.sha256(value.encode()).hexdigest() for value in uniques}
+        return text.map(hashes)
+
+    def _prepare_import_frame(self, table, df, column_map=None, defaults=None, user_id=None):
+        """Turn an uploaded dataframe into the typed column frame that is written to `table`"""
+        resolved = self.resolve_import_columns(df, table, column_map)
+        frame = pd.DataFrame(index=df.index)
+
+        for canonical in IMPORT_COLUMNS[table]:
+            if canonical in resolved:
+                frame[canonical] = df[resolved[canonical]]
+            elif defaults and canonical in defaults:
+                frame[canonical] = defaults[canonical]
+
+        for column in frame.columns:
+            if column in _DATE_COLUMNS:
+                frame[column] = _as_date_text(frame[column])
+            elif column in _INTEGER_COLUMNS:
+                frame[column] = pd.to_numeric(frame[column], errors='coerce').astype('Int64')
+            elif column in _REAL_COLUMNS:
+                frame[column] = pd.to_numeric(frame[column], errors='coerce')
+            elif column == 'blacklist':
+                frame[column] = _as_flag(frame[column])
+            else:
+                frame[column] = _as_text(frame[column])
+
+        required = [col for col in IMPORT_REQUIRED[table] if col in frame.columns]
+        missing = [col for col in IMPORT_REQUIRED[table] if col not in frame.columns]
+        if missing:
+            raise ValueError(f"缺少必填欄位: {', '.join(missing)}")
+        frame = frame.dropna(subset=required)
+
+        if 'id_number' in frame.columns:
+            frame['id_number_hash'] = self.hash_id_numbers(frame.pop('id_number'))
+        if table == 'employees' and 'status' not in frame.columns:
+            frame['status'] = 'active'
+        if table == 'reminders' and 'status' not in frame.columns:
+            frame['status'] = 'pending'
+
+        frame['user_id'] = user_id
+        if table != 'reminders':
+            frame['updated_at'] = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        return frame
+
+    def bulk_import(self, table, df, column_map=None, defaults=None, user_id=None, incremental=False):
+        """
+        Set-based import of a dataframe into one table
+
+        Column aliases (Chinese/English) are resolved once per column, IDs are hashed
+        per distinct value, and all rows are written with a single executemany in
+        one transaction. Rows missing a required column value are skipped.
+
+        df may also be an iterable of dataframe chunks (e.g. FileHandler.iter_chunks): each
+        chunk is prepared and written in turn inside the same transaction, so memory follows
+        the chunk size rather than the file size.
+
+        Args:
+            table: 'employees', 'performance', 'training', 'separation' or 'reminders'
+            df: Source dataframe, or an iterable of dataframes
+            column_map: Optional explicit {canonical: df column} overrides
+            defaults: Optional {canonical: value} for columns absent from df
+            user_id: Owner written to the user_id column
+            incremental: Treat df as the complete set of user_id's rows and write only the
+                difference (see _incremental_import); not available for reminders
+
+        Returns:
+            Dict with 'success', 'count', 'skipped' (or 'error'); incremental imports add
+            'added', 'changed', 'unchanged' and 'removed'
+        """
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            count = 0
-            for _, row in df.iterrows():
-                emp_id = row.get('emp_id') or row.get('工號')
-                year = row.get('year') or row.get('年度')
-                rating = row.get('rating') or row.get('考績')
-                score = row.get('score') or row.get('分數')
-
-                if emp_id and year:
-                    cursor.execute(
-                        "INSERT OR REPLACE INTO performance (emp_id, year, rating, score, updated_at) VALUES (?, ?, ?, ?, ?)",
-                        (emp_id, year, rating, score, datetime.now())
-                    )
-                    count += 1
-            conn.commit()
-            conn.close()
-            return {'success': True, 'count': count}
+            if not isinstance(df, pd.DataFrame):
+                if incremental:
+                    raise ValueError('增量匯入需要完整的資料，不支援分段匯入')
+                return self._bulk_import_chunks(table, df, column_map, defaults, user_id)
+
+            frame = self._prepare_import_frame(table, df, column_map, defaults, user_id)
+            if table in INCREMENTAL_KEYS:
+                frame['row_hash'] = _row_hashes(frame)
+            if incremental:
+                return self._incremental_import(table, frame, len(df) - len(frame), user_id)
+
+            columns = list(frame.columns)
+            rows = list(frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None))
+
+            sql = _upsert_sql(table, columns)
+
+            self._write(lambda conn: conn.executemany(sql, rows), (table,))
+            return {'success': True, 'count': len(rows), 'skipped': len(df) - len(rows)}
         except Exception as e:
             return {'success': False, 'error': str(e)}
 
-    def import_training_data(self, df):
-        """Import training data from dataframe"""
+    def _bulk_import_chunks(self, table, chunks, column_map, defaults, user_id):
+        """
+        Import an iterable of dataframe chunks in one transaction.
+
+        The chunks are consumed on the writer thread inside the write job, so a failure in any
+        chunk (including a read error) rolls back the whole import. The writer is busy for the
+        whole stream; other writes queue behind it.
+        """
+        def write(conn):
+            count = skipped = 0
+            for chunk in chunks:
+                frame = self._prepare_import_frame(table, chunk, column_map, defaults, user_id)
+                if table in INCREMENTAL_KEYS:
+                    frame['row_hash'] = _row_hashes(frame)
+                rows = frame.astype(object).where(frame.notna(), None).itertuples(index=False, name=None)
+                conn.executemany(_upsert_sql(table, list(frame.columns)), rows)
+                count += len(frame)
+                skipped += len(chunk) - len(frame)
+            return count, skipped
+
+        count, skipped = self._write(write, (table,))
+        return {'success': True, 'count': count, 'skipped': skipped}
+
+    def _incremental_import(self, table, frame, skipped, user_id):
+        """
+        Write only the rows of frame that differ from what user_id already has in table.
+
+        Uploaded rows are matched to stored rows on INCREMENTAL_KEYS with a vectorized merge,
+        then compared by row_hash. New rows are inserted. Changed rows replace the stored row.
+        Stored rows missing from the upload are deleted. Unchanged rows are not touched, so
+        the write cost follows the churn rather than the file size. Rows stored before
+        row_hash existed count as changed once.
+        """
+        if table not in INCREMENTAL_KEYS:
+            raise ValueError(f'不支援增量匯入的資料表: {table}')
+        keys = list(INCREMENTAL_KEYS[table])
+        frame = frame.drop_duplicates(subset=keys, keep='last')
+
+        # NULL hashes read as 0 (never produced in practice), so they always differ
+        existing = self.fetch_frame(
+            f"SELECT rowid AS row_id, {', '.join(keys)}, IFNULL(row_hash, 0) AS row_hash "
+            f"FROM {table} WHERE user_id IS ? ORDER BY rowid",
+            (user_id,), dtypes={key: None for key in keys})
+        duplicated = existing.duplicated(subset=keys, keep='last')
+        delete_ids = existing.loc[duplicated, 'row_id'].tolist()
+        existing = existing[~duplicated]
+
+        # Nullable Int64 keeps the 64-bit hashes exact through the outer merge (int64 + NaN would become float)
+        uploaded = frame[keys].astype('string').assign(
+            new_hash=pd.array(frame['row_hash'], dtype='Int64'), position=range(len(frame)))
+        stored = existing[keys].astype('string').assign(
+            old_hash=pd.array(existing['row_hash'], dtype='Int64'), row_id=existing['row_id'].to_numpy())
+        merged = uploaded.merge(stored, on=keys, how='outer', indicator=True)
+
+        added = merged['_merge'] == 'left_only'
+        removed = merged['_merge'] == 'right_only'
+        changed = ((merged['_merge'] == 'both') & (merged['new_hash'] != merged['old_hash'])).fillna(False)
+
+        delete_ids += merged.loc[changed | removed, 'row_id'].astype('int64').tolist()
+        to_write = frame.iloc[merged.loc[added | changed, 'position'].astype('int64')]
+        columns = list(frame.columns)
+        rows = list(to_write.astype(object).where(to_write.notna(), None).itertuples(index=False, name=None))
+        sql = _upsert_sql(table, columns)
+
+        def write(conn):
+            conn.executemany(f"DELETE FROM {table} WHERE rowid = ?", [(row_id,) for row_id in delete_ids])
+            conn.executemany(sql, rows)
+
+        if delete_ids or rows:
+            self._write(write, (table,))
+        return {
+            'success': True,
+            'count': len(rows),
+            'skipped': skipped,
+            'added': int(added.sum()),
+            'changed': int(changed.sum()),
+            'unchanged': int((merged['_merge'] == 'both').sum() - changed.sum()),
+            'removed': int(removed.sum()) + int(duplicated.sum()),
+        }
+
+    def fetch_frame(self, sql, params=(), dtypes=None, attach=None):
+        """
+        Run a query and build a DataFrame straight from the cursor's tuples.
+
+        Skips the sqlite3.Row -> dict -> DataFrame round trip. Columns listed in FRAME_DTYPES are
+        typed on the way in (categorical department/status, datetime dates; unparseable dates
+        become NaT).
+
+        Args:
+            sql: SELECT statement
+            params: Query parameters
+            dtypes: Per-column dtype overrides merged over FRAME_DTYPES ('datetime' parses dates,
+                None leaves the column as returned by SQLite)
+            attach: Optional {alias: db_name} of other module databases the query reads as alias.table
+
+        Returns:
+            DataFrame with one column per result column, in cursor order
+        """
+        conn = self._get_connection()
         try:
-            conn = self._get_connection()
+            if attach:
+                self._attach(conn, attach)
             cursor = conn.cursor()
-            count = 0
-            for _, row in df.iterrows():
-                emp_id = row.get('emp_id') or row.get('工號')
-                course_name = row.get('course_name') or row.get('課程名稱')
-                course_type = row.get('course_type') or row.get('課程類別')
-                hours = row.get('hours') or row.get('時數')
-                completion_date = row.get('completion_date') or row.get('完成日期')
-
-                if emp_id and course_name:
-                    cursor.execute(
-                        "INSERT INTO training (emp_id, course_name, course_type, hours, completion_date, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
-                        (emp_id, course_name, course_type, hours, completion_date, datetime.now())
-                    )
-                    count += 1
-            conn.commit()
+            cursor.row_factory = None
+            cursor.execute(sql, params)
+            columns = [description[0] for description in cursor.description]
+            rows = cursor.fetchall()
+        finally:
             conn.close()
+
+        df = pd.DataFrame.from_records(rows, columns=columns)
+        types = {**FRAME_DTYPES, **(dtypes or {})}
+        for column in columns:
+            dtype = types.get(column)
+            if dtype is None:
+                continue
+            if dtype == 'datetime':
+                df[column] = pd.to_datetime(df[column], errors='coerce', format='ISO8601')
+            else:
+                df[column] = df[column].astype(dtype)
+        return df
+
+    # === 跨模組查詢（ATTACH） ===
+
+    @staticmethod
+    def _attached_db_path(db_name):
+        """Path of another module database, created and migrated on first use"""
+        if not db_name.replace('_', '').isalnum():
+            raise ValueError(f'Invalid database name: {db_name}')
+        return os.path.abspath(DBManager(db_name).db_path)
+
+    def _attach(self, conn, databases):
+        """
+        ATTACH {alias: db_name} onto this thread's pooled connection.
+
+        Attachments stay on the pooled connection, so later calls only check PRAGMA database_list.
+        """
+        attached = {row[1]: row[2] for row in conn.execute("PRAGMA database_list")}
+        for alias, db_name in databases.items():
+            if not alias.isidentifier():
+                raise ValueError(f'Invalid alias: {alias}')
+            path = self._attached_db_path(db_name)
+            if alias in attached:
+                if attached[alias] == path:
+                    continue
+                conn.execute(f"DETACH DATABASE {alias}")
+            conn.execute(f"ATTACH DATABASE ? AS {alias}", (path,))
+
+    def copy_from(self, source_db, table, user_id=None):
+        """
+        Copy a table's rows from another module database with a single INSERT ... SELECT.
+
+        The source file is ATTACHed to the writer connection for this one job only (attach,
+        copy, commit, then DETACH), so the copy runs inside SQLite without moving rows through
+        Python and later writes to this file do not also lock the source file. Columns present in both tables are copied
+        (the autoincrement id is left to the target). employees rows replace existing rows
+        with the same emp_id; history tables upsert on their natural key.
+
+        Args:
+            source_db: Source database name (e.g. 'm4_employees')
+            table: Table present in both databases
+            user_id: Only copy rows owned by this user (None copies every row)
+
+        Returns:
+            Dict with 'success', 'count' (or 'error')
+        """
+        try:
+            self._page_key(table)
+            path = self._attached_db_path(source_db)
+
+            def write(conn):
+                target_columns = [row[1] for row in conn.execute(f"PRAGMA main.table_info({table})")]
+                source_columns = {row[1] for row in conn.execute(f"PRAGMA source.table_info({table})")}
+                columns = [c for c in target_columns if c in source_columns and c != 'id']
+
+                # The WHERE keeps SQLite from reading ON CONFLICT as a join constraint
+                where = " WHERE user_id = ?" if user_id is not None else " WHERE 1"
+                params = (user_id,) if user_id is not None else ()
+                select = f"SELECT {', '.join(columns)} FROM source.{table}{where}"
+                # Unqualified names resolve to the main database before attached ones
+                cursor = conn.execute(_upsert_sql(table, columns, select), params)
+                return cursor.rowcount
+
+            db_path = self.db_path
+            count = get_write_queue(db_path, _pool._open).submit_attached(
+                {'source': path}, write, on_commit=lambda: query_cache.bump(db_path, (table,))).result()
             return {'success': True, 'count': count}
         except Exception as e:
             return {'success': False, 'error': str(e)}
@@ -359,13 +1077,16 @@ class DBManager:
     # === 資料庫管理方法 ===
 
     def get_all_employees(self):
-        """取得所有員工資料"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-        cursor.execute("SELECT * FROM employees ORDER BY emp_id")
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        """取得所有員工資料（結果快取至 employees 下次寫入）"""
+        def load():
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            cursor.execute("SELECT * FROM employees ORDER BY emp_id")
+            rows = cursor.fetchall()
+            conn.close()
+            return [dict(row) for row in rows]
+
+        return self._cached(('employees',), ('get_all_employees', None), load)
 
     def get_all_records(self, table_name=None):
         """取得資料庫的所有記錄（適用於非 employees 資料庫）
@@ -402,14 +1123,97 @@ class DBManager:
         conn.close()
         return [dict(row) for row in rows]
 
+    # 分頁鍵：employees 以 emp_id，其餘資料表以自動遞增的 id
+    PAGE_KEYS = {
+        'employees': 'emp_id',
+        'performance': 'id',
+        'training': 'id',
+        'separation': 'id',
+        'reminders': 'id',
+    }
+
+    def get_page(self, table_name, page_size=100, after=None):
+        """取得一頁資料（keyset 分頁），回傳 {'records': [...], 'next_cursor': 下一頁游標或 None}"""
+        return self._get_page(table_name, page_size, after, None)
+
+    def count_records(self, table_name):
+        """取得資料表筆數"""
+        return self._count_records(table_name, None)
+
+    def iter_records(self, table_name, batch_size=1000):
+        """逐批串流整個資料表的記錄，不會一次載入全部資料"""
+        return self._iter_records(table_name, batch_size, None)
+
+    def _page_key(self, table_name):
+        if table_name not in self.PAGE_KEYS:
+            raise ValueError(f'不支援分頁的資料表: {table_name}')
+        return self.PAGE_KEYS[table_name]
+
+    def _get_page(self, table_name, page_size, after, uid):
+        """
+        以分頁鍵做 keyset 分頁：WHERE key > 游標 ORDER BY key LIMIT n，
+        每一頁都直接從索引定位，不需要像 OFFSET 一樣略過前面的資料列
+        """
+        self._page_key(table_name)
+        return self._cached((table_name,), ('get_page', table_name, page_size, after, uid),
+                            lambda: self._query_page(table_name, page_size, after, uid))
+
+    def _query_page(self, table_name, page_size, after, uid):
+        key = self._page_key(table_name)
+        conditions, params = [], []
+        if uid is not None:
+            conditions.append("user_id = ?")
+            params.append(uid)
+        if after is not None:
+            conditions.append(f"{key} > ?")
+            params.append(after)
+        where = f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        # 多取一筆用來判斷是否還有下一頁
+        cursor.execute(f"SELECT * FROM {table_name}{where} ORDER BY {key} LIMIT ?", (*params, page_size + 1))
+        rows = cursor.fetchall()
+        conn.close()
+
+        records = [dict(row) for row in rows[:page_size]]
+        next_cursor = records[-1][key] if len(rows) > page_size else None
+        return {'records': records, 'next_cursor': next_cursor}
+
+    def _count_records(self, table_name, uid):
+        self._page_key(table_name)
+        return self._cached((table_name,), ('count_records', table_name, uid),
+                            lambda: self._query_count(table_name, uid))
+
+    def _query_count(self, table_name, uid):
+        conn = self._get_connection()
+        cursor = conn.cursor()
+        if uid is not None:
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name} WHERE user_id = ?", (uid,))
+        else:
+            cursor.execute(f"SELECT COUNT(*) FROM {table_name}")
+        count = cursor.fetchone()[0]
+        conn.close()
+        return count
+
+    def _iter_records(self, table_name, batch_size, uid):
+        # 每批各自查詢，產生器暫停期間不會佔住讀取交易；匯出只讀一次，不經過查詢快取
+        after = None
+        while True:
+            page = self._query_page(table_name, batch_size, after, uid)
+            yield from page['records']
+            after = page['next_cursor']
+            if after is None:
+                return
+
     def delete_employee(self, emp_id):
         """刪除員工（僅適用於 employees 資料庫）"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM employees WHERE emp_id = ?", (emp_id,))
-            conn.commit()
-            conn.close()
+            def write(conn):
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM employees WHERE emp_id = ?", (emp_id,))
+
+            self._write(write, ('employees',))
             return True
         except Exception as e:
             print(f"Delete error: {e}")
@@ -423,28 +1227,27 @@ class DBManager:
             table_name: 指定要刪除的表格名稱 (for m5_qualification only)
         """
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-
-            # For m5_qualification, need to specify which table
-            if self.db_name == 'm5_qualification':
-                if table_name == 'performance':
+            def write(conn):
+                cursor = conn.cursor()
+
+                # For m5_qualification, need to specify which table
+                if self.db_name == 'm5_qualification':
+                    if table_name == 'performance':
+                        cursor.execute("DELETE FROM performance WHERE emp_id = ?", (emp_id,))
+                    elif table_name == 'training':
+                        cursor.execute("DELETE FROM training WHERE emp_id = ?", (emp_id,))
+                    elif table_name == 'separation':
+                        cursor.execute("DELETE FROM separation WHERE emp_id = ?", (emp_id,))
+                elif self.db_name in ['reminders', 'm6_reminders']:
+                    cursor.execute("DELETE FROM reminders WHERE emp_id = ?", (emp_id,))
+                elif self.db_name in ['performance', 'm4_performance', 'm5_performance']:
                     cursor.execute("DELETE FROM performance WHERE emp_id = ?", (emp_id,))
-                elif table_name == 'training':
+                elif self.db_name in ['training', 'm4_training', 'm5_training']:
                     cursor.execute("DELETE FROM training WHERE emp_id = ?", (emp_id,))
-                elif table_name == 'separation':
+                elif self.db_name in ['separation', 'm4_separation', 'm5_separation']:
                     cursor.execute("DELETE FROM separation WHERE emp_id = ?", (emp_id,))
-            elif self.db_name in ['reminders', 'm6_reminders']:
-                cursor.execute("DELETE FROM reminders WHERE emp_id = ?", (emp_id,))
-            elif self.db_name in ['performance', 'm4_performance', 'm5_performance']:
-                cursor.execute("DELETE FROM performance WHERE emp_id = ?", (emp_id,))
-            elif self.db_name in ['training', 'm4_training', 'm5_training']:
-                cursor.execute("DELETE FROM training WHERE emp_id = ?", (emp_id,))
-            elif self.db_name in ['separation', 'm4_separation', 'm5_separation']:
-                cursor.execute("DELETE FROM separation WHERE emp_id = ?", (emp_id,))
-
-            conn.commit()
-            conn.close()
+
+            self._write(write)
             return True
         except Exception as e:
             print(f"Delete error: {e}")
@@ -453,83 +1256,40 @@ class DBManager:
     def delete_reminder_by_id(self, reminder_id):
         """根據提醒ID刪除提醒"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
-            conn.commit()
-            conn.close()
+            def write(conn):
+                cursor = conn.cursor()
+                cursor.execute("DELETE FROM reminders WHERE id = ?", (reminder_id,))
+
+            self._write(write, ('reminders',))
             return True
         except Exception as e:
             print(f"Delete error: {e}")
             return False
 
-    def clear_all_data(self, table_name=None):
+    def clear_all_data(self, table_name=None, user_id=None):
         """清空整個資料庫
 
+        刪除後在背景執行 incremental_vacuum，讓檔案縮回實際資料的大小。
+
         Args:
             table_name: 指定要清空的表格名稱 (for m5_qualification only, None = 清空所有表)
+            user_id: 只刪除該使用者的資料（以 user_id 開頭的索引定位），None = 刪除所有使用者的資料
         """
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+        tables = CLEAR_TABLES.get(self.db_name, [])
+        if self.db_name == 'm5_qualification' and table_name is not None:
+            tables = [table_name] if table_name in tables else []
 
-            # Handle M5 single qualification database
-            if self.db_name == 'm5_qualification':
-                if table_name is None:
-                    # Clear all tables
-                    cursor.execute("DELETE FROM employees")
-                    cursor.execute("DELETE FROM performance")
-                    cursor.execute("DELETE FROM training")
-                    cursor.execute("DELETE FROM separation")
-                elif table_name == 'employees':
-                    cursor.execute("DELETE FROM employees")
-                elif table_name == 'performance':
-                    cursor.execute("DELETE FROM performance")
-                elif table_name == 'training':
-                    cursor.execute("DELETE FROM training")
-                elif table_name == 'separation':
-                    cursor.execute("DELETE FROM separation")
-
-            # Handle legacy databases
-            elif self.db_name == 'employees':
-                cursor.execute("DELETE FROM employees")
-            elif self.db_name == 'reminders':
-                cursor.execute("DELETE FROM reminders")
-                cursor.execute("DELETE FROM employees")  # reminders 資料庫也有 employees 表
-            elif self.db_name == 'performance':
-                cursor.execute("DELETE FROM performance")
-            elif self.db_name == 'training':
-                cursor.execute("DELETE FROM training")
-            elif self.db_name == 'separation':
-                cursor.execute("DELETE FROM separation")
-
-            # Handle M4 module databases
-            elif self.db_name == 'm4_employees':
-                cursor.execute("DELETE FROM employees")
-            elif self.db_name == 'm4_performance':
-                cursor.execute("DELETE FROM performance")
-            elif self.db_name == 'm4_training':
-                cursor.execute("DELETE FROM training")
-            elif self.db_name == 'm4_separation':
-                cursor.execute("DELETE FROM separation")
-
-            # Handle M5 legacy databases (backward compatibility)
-            elif self.db_name == 'm5_employees':
-                cursor.execute("DELETE FROM employees")
-            elif self.db_name == 'm5_performance':
-                cursor.execute("DELETE FROM performance")
-            elif self.db_name == 'm5_training':
-                cursor.execute("DELETE FROM training")
-            elif self.db_name == 'm5_separation':
-                cursor.execute("DELETE FROM separation")
-
-            # Handle M6 module databases
-            elif self.db_name == 'm6_reminders':
-                cursor.execute("DELETE FROM reminders")
-                cursor.execute("DELETE FROM employees")  # m6_reminders 資料庫也有 employees 表
-
-            conn.commit()
-            conn.close()
+        try:
+            def write(conn):
+                cursor = conn.cursor()
+                for table in tables:
+                    if user_id is not None:
+                        cursor.execute(f"DELETE FROM {table} WHERE user_id = ?", (user_id,))
+                    else:
+                        cursor.execute(f"DELETE FROM {table}")
+
+            self._write(write, tuple(tables))
+            self.reclaim_space()
             return True
         except Exception as e:
             print(f"Clear error: {e}")
@@ -538,14 +1298,14 @@ class DBManager:
     def add_performance_record(self, emp_id, year, rating, score):
         """Add a performance record"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO performance (emp_id, year, rating, score, updated_at) VALUES (?, ?, ?, ?, ?)",
-                (emp_id, year, rating, score, datetime.now())
-            )
-            conn.commit()
-            conn.close()
+            def write(conn):
+                cursor = conn.cursor()
+                cursor.execute(
+                    _upsert_sql('performance', ['emp_id', 'year', 'rating', 'score', 'updated_at']),
+                    (emp_id, year, rating, score, datetime.now())
+                )
+
+            self._write(write, ('performance',))
             return True
         except Exception as e:
             print(f"Error adding performance record: {e}")
@@ -554,14 +1314,14 @@ class DBManager:
     def add_training_record(self, emp_id, course_name, course_type, hours, completion_date):
         """Add a training record"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO training (emp_id, course_name, course_type, hours, completion_date, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (emp_id, course_name, course_type, hours, completion_date, datetime.now())
-            )
-            conn.commit()
-            conn.close()
+            def write(conn):
+                cursor = conn.cursor()
+                cursor.execute(
+                    _upsert_sql('training', ['emp_id', 'course_name', 'course_type', 'hours', 'completion_date', 'updated_at']),
+                    (emp_id, course_name, course_type, hours, completion_date, datetime.now())
+                )
+
+            self._write(write, ('training',))
             return True
         except Exception as e:
             print(f"Error adding training record: {e}")
@@ -570,14 +1330,14 @@ class DBManager:
     def add_separation_record(self, emp_id, separation_date, separation_type, reason, blacklist=False):
         """Add a separation record"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-            cursor.execute(
-                "INSERT INTO separation (emp_id, separation_date, separation_type, reason, blacklist, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (emp_id, separation_date, separation_type, reason, blacklist, datetime.now())
-            )
-            conn.commit()
-            conn.close()
+            def write(conn):
+                cursor = conn.cursor()
+                cursor.execute(
+                    _upsert_sql('separation', ['emp_id', 'separation_date', 'separation_type', 'reason', 'blacklist', 'updated_at']),
+                    (emp_id, separation_date, separation_type, reason, blacklist, datetime.now())
+                )
+
+            self._write(write, ('separation',))
             return True
         except Exception as e:
             print(f"Error adding separation record: {e}")
@@ -601,23 +1361,22 @@ class DBManager:
         import json
 
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            def write(conn):
+                cursor = conn.cursor()
 
-            config_json = json.dumps(config, ensure_ascii=False, indent=2)
+                config_json = json.dumps(config, ensure_ascii=False, indent=2)
 
-            cursor.execute("""
-                INSERT INTO workflow_templates (module, template_name, description, config_json, updated_at)
-                VALUES (?, ?, ?, ?, ?)
-                ON CONFLICT(module, template_name)
-                DO UPDATE SET
-                    description = excluded.description,
-                    config_json = excluded.config_json,
-                    updated_at = excluded.updated_at
-            """, (module, template_name, description, config_json, datetime.now()))
-
-            conn.commit()
-            conn.close()
+                cursor.execute("""
+                    INSERT INTO workflow_templates (module, template_name, description, config_json, updated_at)
+                    VALUES (?, ?, ?, ?, ?)
+                    ON CONFLICT(module, template_name)
+                    DO UPDATE SET
+                        description = excluded.description,
+                        config_json = excluded.config_json,
+                        updated_at = excluded.updated_at
+                """, (module, template_name, description, config_json, datetime.now()))
+
+            self._write(write, ('workflow_templates',))
 
             return {'success': True, 'message': f'範本「{template_name}」已儲存'}
         except Exception as e:
@@ -673,7 +1432,7 @@ class DBManager:
         Returns:
             List of template metadata (without full config)
         """
-        try:
+        def load():
             conn = self._get_connection()
             cursor = conn.cursor()
 
@@ -694,6 +1453,9 @@ class DBManager:
                 'created_at': row[3],
                 'updated_at': row[4]
             } for row in rows]
+
+        try:
+            return self._cached(('workflow_templates',), ('get_all_templates', module, None), load)
         except Exception as e:
             print(f"Error getting templates: {e}")
             return []
@@ -710,17 +1472,17 @@ class DBManager:
             Dict with 'success' and 'message'
         """
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            def write(conn):
+                cursor = conn.cursor()
 
-            cursor.execute("""
-                DELETE FROM workflow_templates
-                WHERE module = ? AND template_name = ?
-            """, (module, template_name))
+                cursor.execute("""
+                    DELETE FROM workflow_templates
+                    WHERE module = ? AND template_name = ?
+                """, (module, template_name))
 
-            deleted_count = cursor.rowcount
-            conn.commit()
-            conn.close()
+                return cursor.rowcount
+
+            deleted_count = self._write(write, ('workflow_templates',))
 
             if deleted_count > 0:
                 return {'success': True, 'message': f'範本「{template_name}」已刪除'}
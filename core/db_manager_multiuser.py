@@ -4,9 +4,16 @@ DBManager 多用戶支援擴展
 為 DBManager 添加 user_id 篩選功能
 """
 
-from core.db_manager import DBManager as BaseDBManager
+import os
+import threading
 
+import pandas as pd
 
+from core.db_manager import DBManager as BaseDBManager, SEARCH_LIMIT, FRAME_DTYPES, _upsert_sql
+from core.query_stats import instrument_methods
+
+
+@instrument_methods
 class DBManagerMultiUser(BaseDBManager):
     """支援多用戶資料隔離的 DBManager"""
 
@@ -22,78 +29,65 @@ class DBManagerMultiUser(BaseDBManager):
             import hashlib
             from datetime import datetime
 
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            def write(conn):
+                cursor = conn.cursor()
 
-            # Hash id_number if provided for privacy
-            id_number_hash = None
-            if id_number:
-                id_number_hash = hashlib.sha256(id_number.encode()).hexdigest()
+                # Hash id_number if provided for privacy
+                id_number_hash = None
+                if id_number:
+                    id_number_hash = hashlib.sha256(id_number.encode()).hexdigest()
 
-            # 使用傳入的 user_id 或實例的 user_id
-            uid = user_id if user_id is not None else self.user_id
+                # 使用傳入的 user_id 或實例的 user_id
+                uid = user_id if user_id is not None else self.user_id
 
-            cursor.execute(
-                "INSERT OR REPLACE INTO employees (emp_id, name, id_number_hash, department, hire_date, status, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (emp_id, name, id_number_hash, department, hire_date, status, uid))
-            conn.commit()
-            conn.close()
+                cursor.execute(
+                    "INSERT OR REPLACE INTO employees (emp_id, name, id_number_hash, department, hire_date, status, user_id) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (emp_id, name, id_number_hash, department, hire_date, status, uid))
+
+            self._write(write, ('employees',))
             return True
         except Exception as e:
             print(f"Error adding employee: {e}")
             return False
 
     def get_all_employees(self, user_id=None):
-        """取得所有員工資料（依 user_id 篩選）"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
-
+        """取得所有員工資料（依 user_id 篩選，結果快取至 employees 下次寫入）"""
         uid = user_id if user_id is not None else self.user_id
 
-        if uid is not None:
-            cursor.execute("SELECT * FROM employees WHERE user_id = ? ORDER BY emp_id", (uid,))
-        else:
-            cursor.execute("SELECT * FROM employees ORDER BY emp_id")
-
-        rows = cursor.fetchall()
-        conn.close()
-        return [dict(row) for row in rows]
+        def load():
+            conn = self._get_connection()
+            cursor = conn.cursor()
 
-    def search_employee(self, keyword, user_id=None):
-        """搜尋員工（依 user_id 篩選）"""
-        conn = self._get_connection()
-        cursor = conn.cursor()
+            if uid is not None:
+                cursor.execute("SELECT * FROM employees WHERE user_id = ? ORDER BY emp_id", (uid,))
+            else:
+                cursor.execute("SELECT * FROM employees ORDER BY emp_id")
 
-        uid = user_id if user_id is not None else self.user_id
+            rows = cursor.fetchall()
+            conn.close()
+            return [dict(row) for row in rows]
 
-        if uid is not None:
-            cursor.execute(
-                "SELECT emp_id, name, department, hire_date, status FROM employees WHERE (emp_id LIKE ? OR name LIKE ?) AND user_id = ?",
-                (f'%{keyword}%', f'%{keyword}%', uid))
-        else:
-            cursor.execute(
-                "SELECT emp_id, name, department, hire_date, status FROM employees WHERE emp_id LIKE ? OR name LIKE ?",
-                (f'%{keyword}%', f'%{keyword}%'))
+        return self._cached(('employees',), ('get_all_employees', uid), load)
 
-        results = [dict(row) for row in cursor.fetchall()]
-        conn.close()
-        return results
+    def search_employee(self, keyword, user_id=None, limit=SEARCH_LIMIT):
+        """搜尋員工（依 user_id 篩選，使用全文檢索索引並依相關度排序）"""
+        uid = user_id if user_id is not None else self.user_id
+        return self._search_employees(keyword, uid, limit)
 
     def delete_employee(self, emp_id, user_id=None):
         """刪除員工（依 user_id 篩選，確保只刪除自己的資料）"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            def write(conn):
+                cursor = conn.cursor()
 
-            uid = user_id if user_id is not None else self.user_id
+                uid = user_id if user_id is not None else self.user_id
 
-            if uid is not None:
-                cursor.execute("DELETE FROM employees WHERE emp_id = ? AND user_id = ?", (emp_id, uid))
-            else:
-                cursor.execute("DELETE FROM employees WHERE emp_id = ?", (emp_id,))
+                if uid is not None:
+                    cursor.execute("DELETE FROM employees WHERE emp_id = ? AND user_id = ?", (emp_id, uid))
+                else:
+                    cursor.execute("DELETE FROM employees WHERE emp_id = ?", (emp_id,))
 
-            conn.commit()
-            conn.close()
+            self._write(write, ('employees',))
             return True
         except Exception as e:
             print(f"Delete error: {e}")
@@ -127,50 +121,23 @@ class DBManagerMultiUser(BaseDBManager):
         """新增績效記錄（支援 user_id）"""
         try:
             from datetime import datetime
-            conn = self._get_connection()
-            cursor = conn.cursor()
 
-            uid = user_id if user_id is not None else self.user_id
+            def write(conn):
+                cursor = conn.cursor()
 
-            cursor.execute(
-                "INSERT INTO performance (emp_id, year, rating, score, user_id, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
-                (emp_id, year, rating, score, uid, datetime.now())
-            )
-            conn.commit()
-            conn.close()
+                uid = user_id if user_id is not None else self.user_id
+
+                cursor.execute(
+                    _upsert_sql('performance', ['emp_id', 'year', 'rating', 'score', 'user_id', 'updated_at']),
+                    (emp_id, year, rating, score, uid, datetime.now())
+                )
+
+            self._write(write, ('performance',))
             return True
         except Exception as e:
             print(f"Error adding performance record: {e}")
             return False
 
-    def import_performance_data(self, df, user_id=None):
-        """匯入績效資料（支援 user_id）"""
-        try:
-            from datetime import datetime
-            conn = self._get_connection()
-            cursor = conn.cursor()
-
-            uid = user_id if user_id is not None else self.user_id
-
-            count = 0
-            for _, row in df.iterrows():
-                emp_id = row.get('emp_id') or row.get('工號')
-                year = row.get('year') or row.get('年度')
-                rating = row.get('rating') or row.get('考績')
-                score = row.get('score') or row.get('分數')
-
-                if emp_id and year:
-                    cursor.execute(
-                        "INSERT OR REPLACE INTO performance (emp_id, year, rating, score, user_id, updated_at) VALUES (?, ?, ?, ?, ?, ?)",
-                        (emp_id, year, rating, score, uid, datetime.now())
-                    )
-                    count += 1
-            conn.commit()
-            conn.close()
-            return {'success': True, 'count': count}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-
     # ========== 訓練相關方法（加入 user_id 篩選） ==========
 
     def get_training_history(self, emp_id, user_id=None):
@@ -199,51 +166,23 @@ class DBManagerMultiUser(BaseDBManager):
         """新增訓練記錄（支援 user_id）"""
         try:
             from datetime import datetime
-            conn = self._get_connection()
-            cursor = conn.cursor()
 
-            uid = user_id if user_id is not None else self.user_id
+            def write(conn):
+                cursor = conn.cursor()
 
-            cursor.execute(
-                "INSERT INTO training (emp_id, course_name, course_type, hours, completion_date, user_id, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (emp_id, course_name, course_type, hours, completion_date, uid, datetime.now())
-            )
-            conn.commit()
-            conn.close()
+                uid = user_id if user_id is not None else self.user_id
+
+                cursor.execute(
+                    _upsert_sql('training', ['emp_id', 'course_name', 'course_type', 'hours', 'completion_date', 'user_id', 'updated_at']),
+                    (emp_id, course_name, course_type, hours, completion_date, uid, datetime.now())
+                )
+
+            self._write(write, ('training',))
             return True
         except Exception as e:
             print(f"Error adding training record: {e}")
             return False
 
-    def import_training_data(self, df, user_id=None):
-        """匯入訓練資料（支援 user_id）"""
-        try:
-            from datetime import datetime
-            conn = self._get_connection()
-            cursor = conn.cursor()
-
-            uid = user_id if user_id is not None else self.user_id
-
-            count = 0
-            for _, row in df.iterrows():
-                emp_id = row.get('emp_id') or row.get('工號')
-                course_name = row.get('course_name') or row.get('課程名稱')
-                course_type = row.get('course_type') or row.get('課程類別')
-                hours = row.get('hours') or row.get('時數')
-                completion_date = row.get('completion_date') or row.get('完成日期')
-
-                if emp_id and course_name:
-                    cursor.execute(
-                        "INSERT INTO training (emp_id, course_name, course_type, hours, completion_date, user_id, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                        (emp_id, course_name, course_type, hours, completion_date, uid, datetime.now())
-                    )
-                    count += 1
-            conn.commit()
-            conn.close()
-            return {'success': True, 'count': count}
-        except Exception as e:
-            return {'success': False, 'error': str(e)}
-
     # ========== 離職相關方法（加入 user_id 篩選） ==========
 
     def get_separation_record(self, emp_id, user_id=None):
@@ -272,51 +211,395 @@ class DBManagerMultiUser(BaseDBManager):
         """新增離職記錄（支援 user_id）"""
         try:
             from datetime import datetime
-            conn = self._get_connection()
-            cursor = conn.cursor()
 
-            uid = user_id if user_id is not None else self.user_id
+            def write(conn):
+                cursor = conn.cursor()
 
-            cursor.execute(
-                "INSERT INTO separation (emp_id, separation_date, separation_type, reason, blacklist, user_id, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (emp_id, separation_date, separation_type, reason, blacklist, uid, datetime.now())
-            )
-            conn.commit()
-            conn.close()
+                uid = user_id if user_id is not None else self.user_id
+
+                cursor.execute(
+                    _upsert_sql('separation', ['emp_id', 'separation_date', 'separation_type', 'reason', 'blacklist', 'user_id', 'updated_at']),
+                    (emp_id, separation_date, separation_type, reason, blacklist, uid, datetime.now())
+                )
+
+            self._write(write, ('separation',))
             return True
         except Exception as e:
             print(f"Error adding separation record: {e}")
             return False
 
+    # ========== 多員工批次查詢（加入 user_id 篩選） ==========
+
+    # 每次 IN 查詢帶入的工號數量上限（低於 SQLite 舊版 999 個參數的限制）
+    BATCH_FETCH_CHUNK = 500
+
+    def _fetch_grouped(self, table, emp_ids, order_by, user_id=None):
+        """
+        以分段 IN 查詢一次取回多位員工的資料，依工號分組
+
+        Returns:
+            {emp_id: [紀錄, ...]}，每位員工內的順序依 order_by；查無資料者為空列表
+        """
+        uid = user_id if user_id is not None else self.user_id
+
+        ids = list(dict.fromkeys(emp_ids))
+        grouped = {emp_id: [] for emp_id in ids}
+        if not ids:
+            return grouped
+
+        conn = self._get_connection()
+        cursor = conn.cursor()
+
+        for start in range(0, len(ids), self.BATCH_FETCH_CHUNK):
+            chunk = ids[start:start + self.BATCH_FETCH_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+
+            if uid is not None:
+                cursor.execute(
+                    f"SELECT * FROM {table} WHERE emp_id IN ({placeholders}) AND user_id = ? ORDER BY {order_by}",
+                    (*chunk, uid)
+                )
+            else:
+                cursor.execute(
+                    f"SELECT * FROM {table} WHERE emp_id IN ({placeholders}) ORDER BY {order_by}",
+                    chunk
+                )
+
+            for row in cursor.fetchall():
+                grouped[row['emp_id']].append(dict(row))
+
+        conn.close()
+        return grouped
+
+    def get_performance_history_many(self, emp_ids, user_id=None):
+        """取得多位員工的績效歷程（依 user_id 篩選），回傳 {emp_id: [紀錄]}"""
+        return self._fetch_grouped('performance', emp_ids, 'year DESC', user_id)
+
+    def get_training_history_many(self, emp_ids, user_id=None):
+        """取得多位員工的訓練歷程（依 user_id 篩選），回傳 {emp_id: [紀錄]}"""
+        return self._fetch_grouped('training', emp_ids, 'completion_date DESC', user_id)
+
+    def get_separation_record_many(self, emp_ids, user_id=None):
+        """取得多位員工最近一筆離職記錄（依 user_id 篩選），回傳 {emp_id: 紀錄或 None}"""
+        grouped = self._fetch_grouped('separation', emp_ids, 'separation_date DESC', user_id)
+        return {emp_id: records[0] if records else None for emp_id, records in grouped.items()}
+
+    def get_summary_many(self, emp_ids, user_id=None):
+        """
+        取得多位員工的歷程摘要（依 user_id 篩選）
+
+        摘要由觸發器隨績效、訓練、離職資料的寫入維護，讀取時每位員工只讀一列，不需彙總歷程。
+        M4 分檔時只會有所在資料庫擁有的歷程欄位有值。
+
+        Returns:
+            {emp_id: 摘要或 None}；摘要含 performance_count、avg_score（無分數時為 None）、low_rating_count、
+            training_count、training_hours、separation_count 與最近一筆離職的
+            separation_date / separation_type / separation_reason / blacklist
+        """
+        uid = user_id if user_id is not None else self.user_id
+        ids = list(dict.fromkeys(emp_ids))
+
+        def load():
+            summaries = dict.fromkeys(ids)
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            for start in range(0, len(ids), self.BATCH_FETCH_CHUNK):
+                chunk = ids[start:start + self.BATCH_FETCH_CHUNK]
+                placeholders = ', '.join('?' * len(chunk))
+                if uid is not None:
+                    cursor.execute(
+                        f"SELECT * FROM employee_summary WHERE emp_id IN ({placeholders}) AND IFNULL(user_id, -1) = ?",
+                        (*chunk, uid))
+                else:
+                    cursor.execute(f"SELECT * FROM employee_summary WHERE emp_id IN ({placeholders})", chunk)
+                for row in cursor.fetchall():
+                    summary = dict(row)
+                    score_total, score_count = summary.pop('score_total'), summary.pop('score_count')
+                    summary['avg_score'] = score_total / score_count if score_count else None
+                    summaries[summary['emp_id']] = summary
+            conn.close()
+            return summaries
+
+        return self._cached(('performance', 'training', 'separation'), ('get_summary_many', tuple(ids), uid), load)
+
+    # 各歷程資料表的排序（與單筆查詢相同）
+    HISTORY_ORDER = {
+        'performance': 'year DESC',
+        'training': 'completion_date DESC',
+        'separation': 'separation_date DESC',
+    }
+
+    def get_history_frame(self, table_name, emp_ids, user_id=None):
+        """
+        以 DataFrame 取得多位員工的歷程資料（依 user_id 篩選）
+
+        Args:
+            table_name: performance / training / separation
+            emp_ids: 工號列表
+
+        Returns:
+            DataFrame（欄位與資料表相同，日期為 datetime）；查無資料時為空的 DataFrame
+        """
+        if table_name not in self.HISTORY_ORDER:
+            raise ValueError(f'不支援的歷程資料表: {table_name}')
+
+        uid = user_id if user_id is not None else self.user_id
+        ids = list(dict.fromkeys(emp_ids))
+        user_filter = " AND user_id = ?" if uid is not None else ""
+        user_params = (uid,) if uid is not None else ()
+
+        frames = []
+        for start in range(0, max(len(ids), 1), self.BATCH_FETCH_CHUNK):
+            chunk = ids[start:start + self.BATCH_FETCH_CHUNK]
+            placeholders = ', '.join('?' * len(chunk))
+            frames.append(self.fetch_frame(
+                f"SELECT * FROM {table_name} WHERE emp_id IN ({placeholders}){user_filter} "
+                f"ORDER BY {self.HISTORY_ORDER[table_name]}",
+                (*chunk, *user_params)
+            ))
+        if len(frames) == 1:
+            return frames[0]
+
+        # 各段的類別欄位類別集合不同，合併後會退回 object，需重新轉型
+        df = pd.concat(frames, ignore_index=True)
+        for column in df.columns:
+            if FRAME_DTYPES.get(column) == 'category':
+                df[column] = df[column].astype('category')
+        return df
+
+    def get_reminders_frame(self, start_date, end_date, status=None, user_id=None):
+        """以 DataFrame 取得指定日期範圍的提醒（依 user_id 篩選），due_date 為 datetime；結果快取至 reminders 下次寫入"""
+        uid = user_id if user_id is not None else self.user_id
+
+        conditions, params = ["due_date BETWEEN ? AND ?"], [start_date, end_date]
+        if status:
+            conditions.append("status = ?")
+            params.append(status)
+        if uid is not None:
+            conditions.append("user_id = ?")
+            params.append(uid)
+
+        return self._cached(
+            ('reminders',), ('get_reminders_frame', start_date, end_date, status, uid),
+            lambda: self.fetch_frame(
+                f"""SELECT id, emp_id, emp_name, reminder_type, due_date, notes, status, completed_date
+                    FROM reminders WHERE {' AND '.join(conditions)} ORDER BY due_date""",
+                params
+            ))
+
+    def get_database_stats(self, user_id=None):
+        """取得資料庫統計（依 user_id 篩選，讀取觸發器維護的計數）"""
+        uid = user_id if user_id is not None else self.user_id
+        return super().get_database_stats(user_id=uid)
+
+    # ========== 跨模組查詢（ATTACH，加入 user_id 篩選） ==========
+
+    def get_employee_profiles(self, emp_ids, sources, user_id=None):
+        """
+        以單一連線 ATTACH 各模組資料庫，一次組出員工概況與歷程
+
+        Args:
+            emp_ids: 工號列表（查詢本資料庫的 employees 表）
+            sources: {'performance': 資料庫名稱, 'training': ..., 'separation': ...}，
+                     各歷程資料表所在的模組資料庫
+
+        Returns:
+            {'employees': 每位員工一列（含績效筆數、平均分數、總時數、離職筆數與最近一筆離職記錄）,
+             'performance': 績效歷程, 'training': 訓練歷程}，皆為 DataFrame
+        """
+        uid = user_id if user_id is not None else self.user_id
+        attach = {f'src_{table}': db_name for table, db_name in sources.items()
+                  if table in self.HISTORY_ORDER}
+        ids = list(dict.fromkeys(emp_ids)) or [None]
+        placeholders = ', '.join('?' * len(ids))
+        user_params = (uid,) if uid is not None else ()
+
+        def scoped(alias):
+            return f" AND {alias}.user_id = ?" if uid is not None else ""
+
+        def summary(alias):
+            # 每位員工只讀取一列歷程摘要（由觸發器維護），不彙總歷程資料
+            return (f" LEFT JOIN {alias}.employee_summary {alias} ON {alias}.emp_id = e.emp_id"
+                    f" AND IFNULL({alias}.user_id, -1) = IFNULL(e.user_id, -1)")
+
+        columns = ["e.emp_id", "e.name", "e.department", "e.hire_date", "e.status"]
+        joins = ""
+        if 'src_performance' in attach:
+            columns += ["IFNULL(src_performance.performance_count, 0) AS performance_count",
+                        "src_performance.score_total / NULLIF(src_performance.score_count, 0) AS avg_score"]
+            joins += summary('src_performance')
+        if 'src_training' in attach:
+            columns.append("IFNULL(src_training.training_hours, 0) AS training_hours")
+            joins += summary('src_training')
+        if 'src_separation' in attach:
+            columns += ["IFNULL(src_separation.separation_count, 0) AS separation_count",
+                        "src_separation.separation_date", "src_separation.separation_type",
+                        "src_separation.separation_reason AS reason", "src_separation.blacklist"]
+            joins += summary('src_separation')
+
+        profiles = {'employees': self.fetch_frame(
+            f"SELECT {', '.join(columns)} FROM employees e{joins} "
+            f"WHERE e.emp_id IN ({placeholders}){scoped('e')} ORDER BY e.emp_id",
+            (*ids, *user_params),
+            dtypes={'separation_date': 'datetime'},
+            attach=attach
+        )}
+        for table in ('performance', 'training'):
+            alias = f'src_{table}'
+            if alias in attach:
+                profiles[table] = self.fetch_frame(
+                    f"SELECT h.* FROM {alias}.{table} h WHERE h.emp_id IN ({placeholders}){scoped('h')} "
+                    f"ORDER BY {self.HISTORY_ORDER[table]}",
+                    (*ids, *user_params),
+                    attach=attach
+                )
+        return profiles
+
+    def copy_from(self, source_db, table, user_id=None):
+        """以 INSERT ... SELECT 從其他模組資料庫複製資料（只複製該 user_id 的資料）"""
+        uid = user_id if user_id is not None else self.user_id
+        return super().copy_from(source_db, table, user_id=uid)
+
+    # ========== 批次匯入（加入 user_id） ==========
+
+    def bulk_import(self, table, df, column_map=None, defaults=None, user_id=None, incremental=False):
+        """批次匯入（支援 user_id，所有列一次寫入同一個交易；incremental=True 時只寫入該使用者資料的差異）"""
+        uid = user_id if user_id is not None else self.user_id
+        return super().bulk_import(table, df, column_map, defaults, user_id=uid, incremental=incremental)
+
+    # ========== 批次刪除與狀態更新（加入 user_id 篩選） ==========
+
+    # 批次操作以哪個欄位比對傳入的 id：員工與歷程資料表為工號，提醒為提醒 ID
+    BULK_KEYS = {
+        'employees': 'emp_id',
+        'performance': 'emp_id',
+        'training': 'emp_id',
+        'separation': 'emp_id',
+        'reminders': 'id',
+    }
+
+    # 有 status 欄位、可批次更新狀態的資料表
+    STATUS_TABLES = ('employees', 'reminders')
+
+    def _bulk_write(self, table_name, ids, user_id, statement, params, tables):
+        """在單一交易中以分段的 IN 子句對 ids 執行 statement，回傳影響的列數"""
+        uid = user_id if user_id is not None else self.user_id
+        user_filter = " AND user_id = ?" if uid is not None else ""
+        user_params = (uid,) if uid is not None else ()
+        key = self.BULK_KEYS[table_name]
+        ids = list(dict.fromkeys(ids))
+
+        def write(conn):
+            existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+            count = 0
+            for start in range(0, len(ids), self.BATCH_FETCH_CHUNK):
+                chunk = ids[start:start + self.BATCH_FETCH_CHUNK]
+                placeholders = ', '.join('?' * len(chunk))
+                for target in (t for t in tables if t in existing):
+                    cursor = conn.execute(
+                        statement.format(table=target, key=key, placeholders=placeholders, user_filter=user_filter),
+                        (*params, *chunk, *user_params))
+                    if target == table_name:
+                        count += cursor.rowcount
+            return count
+
+        return self._write(write, tables)
+
+    def delete_many(self, table_name, ids, user_id=None, cascade=True):
+        """
+        批次刪除（依 user_id 篩選，單一交易）
+
+        Args:
+            table_name: employees / performance / training / separation / reminders
+            ids: 工號列表（reminders 為提醒 ID 列表）
+            cascade: 刪除員工時，一併刪除同一資料庫中這些員工的績效、訓練、離職記錄
+
+        Returns:
+            {'success': True, 'count': 刪除的 table_name 列數} 或 {'success': False, 'error': 錯誤訊息}
+        """
+        try:
+            if table_name not in self.BULK_KEYS:
+                raise ValueError(f"不支援批次刪除的資料表: {table_name}")
+            tables = (table_name,)
+            if table_name == 'employees' and cascade:
+                tables += tuple(self.HISTORY_ORDER)
+            count = self._bulk_write(
+                table_name, ids, user_id,
+                "DELETE FROM {table} WHERE {key} IN ({placeholders}){user_filter}", (), tables)
+            return {'success': True, 'count': count}
+        except Exception as e:
+            print(f"Delete error: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def update_status_many(self, table_name, ids, status, user_id=None):
+        """
+        批次更新狀態（依 user_id 篩選，單一交易）
+
+        提醒標記為 completed 時同時填入完成日期，改回其他狀態時清除完成日期。
+
+        Args:
+            table_name: employees / reminders
+            ids: 工號列表（reminders 為提醒 ID 列表）
+            status: 新狀態
+
+        Returns:
+            {'success': True, 'count': 更新的列數} 或 {'success': False, 'error': 錯誤訊息}
+        """
+        try:
+            from datetime import datetime
+
+            if table_name not in self.STATUS_TABLES:
+                raise ValueError(f"不支援批次更新狀態的資料表: {table_name}")
+            assignments, params = "status = ?", (status,)
+            if table_name == 'reminders':
+                completed_date = datetime.now().strftime('%Y-%m-%d') if status == 'completed' else None
+                assignments, params = "status = ?, completed_date = ?", (status, completed_date)
+            count = self._bulk_write(
+                table_name, ids, user_id,
+                f"UPDATE {{table}} SET {assignments} WHERE {{key}} IN ({{placeholders}}){{user_filter}}",
+                params, (table_name,))
+            return {'success': True, 'count': count}
+        except Exception as e:
+            print(f"Update error: {e}")
+            return {'success': False, 'error': str(e)}
+
+    def clear_all_data(self, table_name=None, user_id=None):
+        """清空目前使用者的資料（依 user_id 篩選，不影響其他使用者）"""
+        uid = user_id if user_id is not None else self.user_id
+        return super().clear_all_data(table_name, user_id=uid)
+
     # ========== 提醒相關方法（加入 user_id 篩選） ==========
 
     def add_reminder(self, emp_id, emp_name, reminder_type, created_date, due_date, notes='', user_id=None):
         """新增提醒（支援 user_id）"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            def write(conn):
+                cursor = conn.cursor()
 
-            uid = user_id if user_id is not None else self.user_id
+                uid = user_id if user_id is not None else self.user_id
 
-            cursor.execute(
-                """INSERT INTO reminders (emp_id, emp_name, reminder_type, created_date, due_date, notes, status, user_id)
-                   VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)""",
-                (emp_id, emp_name, reminder_type, created_date, due_date, notes, uid)
-            )
-            conn.commit()
-            conn.close()
+                cursor.execute(
+                    """INSERT INTO reminders (emp_id, emp_name, reminder_type, created_date, due_date, notes, status, user_id)
+                       VALUES (?, ?, ?, ?, ?, ?, 'pending', ?)""",
+                    (emp_id, emp_name, reminder_type, created_date, due_date, notes, uid)
+                )
+
+            self._write(write, ('reminders',))
             return True
         except Exception as e:
             print(f"Error adding reminder: {e}")
             return False
 
     def get_reminders_by_range(self, start_date, end_date, status=None, user_id=None):
-        """取得指定日期範圍的提醒（依 user_id 篩選）"""
+        """取得指定日期範圍的提醒（依 user_id 篩選，結果快取至 reminders 下次寫入）"""
+        uid = user_id if user_id is not None else self.user_id
+        return self._cached(('reminders',), ('get_reminders_by_range', start_date, end_date, status, uid),
+                            lambda: self._query_reminders_by_range(start_date, end_date, status, uid))
+
+    def _query_reminders_by_range(self, start_date, end_date, status, uid=None):
         conn = self._get_connection()
         cursor = conn.cursor()
 
-        uid = user_id if user_id is not None else self.user_id
-
         if uid is not None:
             if status:
                 cursor.execute(
@@ -360,6 +643,46 @@ class DBManagerMultiUser(BaseDBManager):
         conn.close()
         return results
 
+    def count_reminders_by_status(self, status, user_id=None):
+        """取得指定狀態的提醒筆數（依 user_id 篩選，結果快取至 reminders 下次寫入）"""
+        uid = user_id if user_id is not None else self.user_id
+
+        def load():
+            conn = self._get_connection()
+            cursor = conn.cursor()
+            if uid is not None:
+                cursor.execute(
+                    "SELECT COUNT(*) FROM reminders WHERE status = ? AND IFNULL(user_id, -1) = ?", (status, uid))
+            else:
+                cursor.execute("SELECT COUNT(*) FROM reminders WHERE status = ?", (status,))
+            count = cursor.fetchone()[0]
+            conn.close()
+            return count
+
+        return self._cached(('reminders',), ('count_reminders_by_status', status, uid), load)
+
+    def delete_by_status(self, status, user_id=None):
+        """
+        刪除指定狀態的提醒（依 user_id 篩選，單一寫入工作）
+
+        Returns:
+            {'success': True, 'count': 刪除的列數} 或 {'success': False, 'error': 錯誤訊息}
+        """
+        uid = user_id if user_id is not None else self.user_id
+        try:
+            def write(conn):
+                if uid is not None:
+                    cursor = conn.execute(
+                        "DELETE FROM reminders WHERE status = ? AND IFNULL(user_id, -1) = ?", (status, uid))
+                else:
+                    cursor = conn.execute("DELETE FROM reminders WHERE status = ?", (status,))
+                return cursor.rowcount
+
+            return {'success': True, 'count': self._write(write, ('reminders',))}
+        except Exception as e:
+            print(f"Delete error: {e}")
+            return {'success': False, 'error': str(e)}
+
     def get_all_records(self, table_name=None, user_id=None):
         """取得所有記錄（依 user_id 篩選）"""
         conn = self._get_connection()
@@ -414,6 +737,23 @@ class DBManagerMultiUser(BaseDBManager):
         conn.close()
         return [dict(row) for row in rows]
 
+    # ========== 分頁與串流讀取（加入 user_id 篩選） ==========
+
+    def get_page(self, table_name, page_size=100, after=None, user_id=None):
+        """取得一頁資料（依 user_id 篩選），回傳 {'records': [...], 'next_cursor': 下一頁游標或 None}"""
+        uid = user_id if user_id is not None else self.user_id
+        return self._get_page(table_name, page_size, after, uid)
+
+    def count_records(self, table_name, user_id=None):
+        """取得資料表筆數（依 user_id 篩選）"""
+        uid = user_id if user_id is not None else self.user_id
+        return self._count_records(table_name, uid)
+
+    def iter_records(self, table_name, batch_size=1000, user_id=None):
+        """逐批串流資料表記錄（依 user_id 篩選）"""
+        uid = user_id if user_id is not None else self.user_id
+        return self._iter_records(table_name, batch_size, uid)
+
     # ========== 範本相關方法（加入 user_id 篩選） ==========
 
     def save_template(self, module: str, template_name: str, config: dict, description: str = None, user_id=None):
@@ -422,35 +762,34 @@ class DBManagerMultiUser(BaseDBManager):
         from datetime import datetime
 
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            def write(conn):
+                cursor = conn.cursor()
 
-            # 確保 uid 存在
-            uid = user_id if user_id is not None else self.user_id
+                # 確保 uid 存在
+                uid = user_id if user_id is not None else self.user_id
             
-            # 如果 uid 還是 None，嘗試從 session_state 拿
-            if uid is None:
-                try:
-                    import streamlit as st
-                    if 'user_info' in st.session_state:
-                        uid = st.session_state.user_info.get('user_id')
-                except:
-                    pass
+                # 如果 uid 還是 None，嘗試從 session_state 拿
+                if uid is None:
+                    try:
+                        import streamlit as st
+                        if 'user_info' in st.session_state:
+                            uid = st.session_state.user_info.get('user_id')
+                    except:
+                        pass
 
-            config_json = json.dumps(config, ensure_ascii=False, indent=2)
+                config_json = json.dumps(config, ensure_ascii=False, indent=2)
 
-            cursor.execute("""
-                INSERT INTO workflow_templates (module, template_name, description, config_json, user_id, updated_at)
-                VALUES (?, ?, ?, ?, ?, ?)
-                ON CONFLICT(module, template_name, user_id)
-                DO UPDATE SET
-                    description = excluded.description,
-                    config_json = excluded.config_json,
-                    updated_at = excluded.updated_at
-            """, (module, template_name, description, config_json, uid, datetime.now()))
-
-            conn.commit()
-            conn.close()
+                cursor.execute("""
+                    INSERT INTO workflow_templates (module, template_name, description, config_json, user_id, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?)
+                    ON CONFLICT(module, template_name, user_id)
+                    DO UPDATE SET
+                        description = excluded.description,
+                        config_json = excluded.config_json,
+                        updated_at = excluded.updated_at
+                """, (module, template_name, description, config_json, uid, datetime.now()))
+
+            self._write(write, ('workflow_templates',))
 
             return {'success': True, 'message': f'範本「{template_name}」已儲存'}
         except Exception as e:
@@ -458,51 +797,55 @@ class DBManagerMultiUser(BaseDBManager):
             return {'success': False, 'message': f'儲存失敗: {str(e)}'}
 
     def get_all_templates(self, module: str, user_id=None):
-        """取得所有範本（依 user_id 篩選）"""
-        try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
-
-            uid = user_id if user_id is not None else self.user_id
-            
-            # 如果 uid 為 None 且在 Streamlit 環境，嘗試自動補齊
-            if uid is None:
-                try:
-                    import streamlit as st
-                    if 'user_info' in st.session_state:
-                        uid = st.session_state.user_info.get('user_id')
-                except:
-                    pass
+        """取得所有範本（依 user_id 篩選，結果快取至範本下次寫入）"""
+        uid = user_id if user_id is not None else self.user_id
 
-            if uid is not None:
-                cursor.execute("""
-                    SELECT id, template_name, description, created_at, updated_at
-                    FROM workflow_templates
-                    WHERE module = ? AND (user_id = ? OR user_id IS NULL)
-                    ORDER BY updated_at DESC
-                """, (module, uid))
-            else:
-                cursor.execute("""
-                    SELECT id, template_name, description, created_at, updated_at
-                    FROM workflow_templates
-                    WHERE module = ?
-                    ORDER BY updated_at DESC
-                """, (module,))
+        # 如果 uid 為 None 且在 Streamlit 環境，嘗試自動補齊
+        if uid is None:
+            try:
+                import streamlit as st
+                if 'user_info' in st.session_state:
+                    uid = st.session_state.user_info.get('user_id')
+            except:
+                pass
 
-            rows = cursor.fetchall()
-            conn.close()
-
-            return [{
-                'id': row[0],
-                'template_name': row[1],
-                'description': row[2],
-                'created_at': row[3],
-                'updated_at': row[4]
-            } for row in rows]
+        try:
+            return self._cached(('workflow_templates',), ('get_all_templates', module, uid),
+                                lambda: self._query_templates(module, uid))
         except Exception as e:
             print(f"Error getting templates: {e}")
             return []
 
+    def _query_templates(self, module, uid):
+        conn = self._get_connection()
+        cursor = conn.cursor()
+
+        if uid is not None:
+            cursor.execute("""
+                SELECT id, template_name, description, created_at, updated_at
+                FROM workflow_templates
+                WHERE module = ? AND (user_id = ? OR user_id IS NULL)
+                ORDER BY updated_at DESC
+            """, (module, uid))
+        else:
+            cursor.execute("""
+                SELECT id, template_name, description, created_at, updated_at
+                FROM workflow_templates
+                WHERE module = ?
+                ORDER BY updated_at DESC
+            """, (module,))
+
+        rows = cursor.fetchall()
+        conn.close()
+
+        return [{
+            'id': row[0],
+            'template_name': row[1],
+            'description': row[2],
+            'created_at': row[3],
+            'updated_at': row[4]
+        } for row in rows]
+
     def load_template(self, module: str, template_name: str, user_id=None):
         """載入範本（依 user_id 篩選）"""
         import json
@@ -554,25 +897,25 @@ class DBManagerMultiUser(BaseDBManager):
     def delete_template(self, module: str, template_name: str, user_id=None):
         """刪除範本（依 user_id 篩選，確保只刪除自己的範本）"""
         try:
-            conn = self._get_connection()
-            cursor = conn.cursor()
+            def write(conn):
+                cursor = conn.cursor()
 
-            uid = user_id if user_id is not None else self.user_id
+                uid = user_id if user_id is not None else self.user_id
 
-            if uid is not None:
-                cursor.execute("""
-                    DELETE FROM workflow_templates
-                    WHERE module = ? AND template_name = ? AND user_id = ?
-                """, (module, template_name, uid))
-            else:
-                cursor.execute("""
-                    DELETE FROM workflow_templates
-                    WHERE module = ? AND template_name = ?
-                """, (module, template_name))
+                if uid is not None:
+                    cursor.execute("""
+                        DELETE FROM workflow_templates
+                        WHERE module = ? AND template_name = ? AND user_id = ?
+                    """, (module, template_name, uid))
+                else:
+                    cursor.execute("""
+                        DELETE FROM workflow_templates
+                        WHERE module = ? AND template_name = ?
+                    """, (module, template_name))
 
-            deleted_count = cursor.rowcount
-            conn.commit()
-            conn.close()
+                return cursor.rowcount
+
+            deleted_count = self._write(write, ('workflow_templates',))
 
             if deleted_count > 0:
                 return {'success': True, 'message': f'範本「{template_name}」已刪除'}
@@ -580,3 +923,31 @@ class DBManagerMultiUser(BaseDBManager):
                 return {'success': False, 'message': '找不到該範本'}
         except Exception as e:
             return {'success': False, 'message': f'刪除失敗: {str(e)}'}
+
+
+_handles = {}
+_handles_lock = threading.Lock()
+
+
+def get_db_manager(db_name='employees', user_id=None):
+    """
+    取得共用的 DBManagerMultiUser（依 (db_name, user_id) 快取）
+
+    每個資料庫檔案在每個行程只初始化一次，之後每次 rerun 都拿到同一個物件，
+    不再重複執行 CREATE TABLE 或佔用寫入鎖。
+
+    Args:
+        db_name: 資料庫名稱
+        user_id: 使用者 ID
+
+    Returns:
+        DBManagerMultiUser
+    """
+    key = (os.path.abspath(f'data/{db_name}.db'), user_id)
+    handle = _handles.get(key)
+    if handle is None:
+        with _handles_lock:
+            handle = _handles.get(key)
+            if handle is None:
+                handle = _handles[key] = DBManagerMultiUser(db_name, user_id=user_id)
+    return handle
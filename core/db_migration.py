@@ -1,126 +1,472 @@
 # -*- coding: utf-8 -*-
 """
-資料庫遷移腳本
-為所有現有資料表添加 user_id 欄位以支援多用戶資料隔離
+資料庫版本化遷移引擎
+
+每個資料庫檔案的結構版本記錄在 PRAGMA user_version。
+遷移步驟依版本號依序執行，每個檔案在每個行程只檢查一次：
+- 已是最新版本：直接返回（只查一次記憶體中的集合）
+- 需要遷移：以 BEGIN IMMEDIATE 取得資料庫檔案的寫入鎖，重新讀取版本後
+  在同一個交易中套用尚未執行的步驟，多個行程同時啟動時只會有一個執行遷移
 """
 
 import sqlite3
 import os
+import threading
+
+
+# 次要索引：多用戶查詢一律先以 user_id 篩選，所以複合索引以 user_id 開頭
+TABLE_INDEXES = {
+    'employees': [
+        "CREATE INDEX IF NOT EXISTS idx_employees_user_emp ON employees (user_id, emp_id)",
+        "CREATE INDEX IF NOT EXISTS idx_employees_name ON employees (name)",
+        "CREATE INDEX IF NOT EXISTS idx_employees_id_hash ON employees (id_number_hash)",
+    ],
+    'performance': [
+        "CREATE INDEX IF NOT EXISTS idx_performance_user_emp ON performance (user_id, emp_id, year)",
+        "CREATE INDEX IF NOT EXISTS idx_performance_emp ON performance (emp_id)",
+    ],
+    'training': [
+        "CREATE INDEX IF NOT EXISTS idx_training_user_emp ON training (user_id, emp_id, completion_date)",
+        "CREATE INDEX IF NOT EXISTS idx_training_emp ON training (emp_id)",
+    ],
+    'separation': [
+        "CREATE INDEX IF NOT EXISTS idx_separation_user_emp ON separation (user_id, emp_id, separation_date)",
+        "CREATE INDEX IF NOT EXISTS idx_separation_emp ON separation (emp_id)",
+    ],
+    'reminders': [
+        "CREATE INDEX IF NOT EXISTS idx_reminders_user_status_due ON reminders (user_id, status, due_date)",
+        "CREATE INDEX IF NOT EXISTS idx_reminders_user_due ON reminders (user_id, due_date)",
+        "CREATE INDEX IF NOT EXISTS idx_reminders_user_emp ON reminders (user_id, emp_id)",
+    ],
+}
+
+# 自然鍵：同一使用者的同一筆紀錄只保留一列，重複匯入改為更新
+NATURAL_KEYS = {
+    'performance': ('emp_id', 'year'),
+    'training': ('emp_id', 'course_name', 'completion_date'),
+    'separation': ('emp_id', 'separation_date'),
+}
+
+
+def natural_key_target(table_name):
+    """
+    自然鍵唯一索引的欄位運算式（也是 ON CONFLICT 的目標）
+
+    UNIQUE 索引中 NULL 彼此不相等，user_id 以 IFNULL 轉換，未指定使用者的舊資料才會被視為同一個擁有者
+    """
+    return ', '.join(('IFNULL(user_id, -1)',) + NATURAL_KEYS[table_name])
+
+
+# 需要 user_id 欄位的資料表
+USER_SCOPED_TABLES = ['employees', 'performance', 'training', 'separation', 'reminders', 'workflow_templates']
+
+# 應用程式使用的資料庫
+DATABASES = [
+    # M4 資料庫
+    'm4_employees', 'm4_performance', 'm4_training', 'm4_separation',
+    # M5 資料庫
+    'm5_qualification',
+    # M6 資料庫
+    'm6_reminders',
+    # 範本資料庫
+    'workflow_templates'
+]
+
+
+def _existing_tables(conn):
+    cursor = conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+    return {row[0] for row in cursor.fetchall()}
+
+
+def _columns(conn, table_name):
+    return {col[1] for col in conn.execute(f"PRAGMA table_info({table_name})").fetchall()}
+
+
+# ========== 遷移步驟 ==========
+
+def _add_user_id_columns(conn):
+    """為所有資料表添加 user_id 欄位（預設為 NULL，允許現有資料）"""
+    tables = _existing_tables(conn)
+    for table_name in USER_SCOPED_TABLES:
+        if table_name in tables and 'user_id' not in _columns(conn, table_name):
+            conn.execute(f"ALTER TABLE {table_name} ADD COLUMN user_id INTEGER")
+
+
+def _create_indexes(conn):
+    """建立次要索引"""
+    tables = _existing_tables(conn)
+    for table_name, statements in TABLE_INDEXES.items():
+        if table_name in tables:
+            for index_sql in statements:
+                conn.execute(index_sql)
+
+
+# 員工搜尋用的 FTS5 外部內容索引：trigram 分詞可對中文姓名做子字串比對，由觸發器與 employees 同步
+EMPLOYEE_SEARCH_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS employees_fts USING fts5(
+        emp_id, name, department,
+        content='employees', content_rowid='rowid', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS employees_fts_ai AFTER INSERT ON employees BEGIN
+        INSERT INTO employees_fts (rowid, emp_id, name, department)
+        VALUES (new.rowid, new.emp_id, new.name, new.department);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS employees_fts_ad AFTER DELETE ON employees BEGIN
+        INSERT INTO employees_fts (employees_fts, rowid, emp_id, name, department)
+        VALUES ('delete', old.rowid, old.emp_id, old.name, old.department);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS employees_fts_au AFTER UPDATE OF emp_id, name, department ON employees BEGIN
+        INSERT INTO employees_fts (employees_fts, rowid, emp_id, name, department)
+        VALUES ('delete', old.rowid, old.emp_id, old.name, old.department);
+        INSERT INTO employees_fts (rowid, emp_id, name, department)
+        VALUES (new.rowid, new.emp_id, new.name, new.department);
+    END""",
+]
+
+
+def _create_employee_search_index(conn):
+    """建立員工全文檢索索引並以現有資料重建"""
+    if 'employees' not in _existing_tables(conn):
+        return
+    try:
+        conn.execute(EMPLOYEE_SEARCH_INDEX[0])
+    except sqlite3.OperationalError:
+        # SQLite 3.34 以前沒有 trigram 分詞器：不建立索引，搜尋退回 LIKE
+        return
+    for trigger_sql in EMPLOYEE_SEARCH_INDEX[1:]:
+        conn.execute(trigger_sql)
+    conn.execute("INSERT INTO employees_fts (employees_fts) VALUES ('rebuild')")
+
+
+def _dedupe_natural_keys(conn):
+    """刪除自然鍵重複的資料（保留最後寫入的一列）並建立唯一索引"""
+    tables = _existing_tables(conn)
+    for table_name, key_columns in NATURAL_KEYS.items():
+        if table_name not in tables:
+            continue
+        key = natural_key_target(table_name)
+        # 鍵欄位含 NULL 的列不受唯一索引限制，也不去重
+        not_null = ' AND '.join(f"{column} IS NOT NULL" for column in key_columns)
+        conn.execute(f"""
+            DELETE FROM {table_name}
+            WHERE {not_null}
+              AND id NOT IN (SELECT MAX(id) FROM {table_name} WHERE {not_null} GROUP BY {key})
+        """)
+        conn.execute(f"CREATE UNIQUE INDEX IF NOT EXISTS uq_{table_name}_natural_key ON {table_name} ({key})")
+
+
+# 增量匯入比對內容用的雜湊欄位
+ROW_HASH_TABLES = ['employees', 'performance', 'training', 'separation']
+
+
+def _add_row_hash_columns(conn):
+    """為可增量匯入的資料表添加 row_hash 欄位（舊資料為 NULL，下次增量匯入時視為已變更）"""
+    tables = _existing_tables(conn)
+    for table_name in ROW_HASH_TABLES:
+        if table_name in tables and 'row_hash' not in _columns(conn, table_name):
+            conn.execute(f"ALTER TABLE {table_name} ADD COLUMN row_hash INTEGER")
+
+
+# 每位員工（依 user_id）一列的歷程摘要，由觸發器隨 performance / training / separation 的寫入維護。
+# 各模組資料庫只維護自己擁有的歷程資料表對應的欄位（M4 分檔時，績效摘要在 m4_performance 中）。
+EMPLOYEE_SUMMARY_TABLE = """
+    CREATE TABLE IF NOT EXISTS employee_summary (
+        user_id INTEGER,
+        emp_id TEXT NOT NULL,
+        performance_count INTEGER NOT NULL DEFAULT 0,
+        score_total REAL NOT NULL DEFAULT 0,
+        score_count INTEGER NOT NULL DEFAULT 0,
+        low_rating_count INTEGER NOT NULL DEFAULT 0,
+        training_count INTEGER NOT NULL DEFAULT 0,
+        training_hours REAL NOT NULL DEFAULT 0,
+        separation_count INTEGER NOT NULL DEFAULT 0,
+        separation_date DATE,
+        separation_type TEXT,
+        separation_reason TEXT,
+        blacklist BOOLEAN
+    )
+"""
+EMPLOYEE_SUMMARY_INDEX = (
+    "CREATE UNIQUE INDEX IF NOT EXISTS uq_employee_summary ON employee_summary (IFNULL(user_id, -1), emp_id)")
+
+# 低績效考績（與 M5 資格檢核相同）
+LOW_RATINGS = "('C', 'D', 'E')"
+
+# 各歷程資料表對摘要的更新：{row} 為 new / old，{op} 為 + / -；最近一筆離職記錄無法增減計算，每次重新取得
+SUMMARY_UPDATES = {
+    'performance': f"""
+        performance_count = performance_count {{op}} 1,
+        score_total = score_total {{op}} IFNULL({{row}}.score, 0),
+        score_count = score_count {{op}} ({{row}}.score IS NOT NULL),
+        low_rating_count = low_rating_count {{op}} IFNULL({{row}}.rating IN {LOW_RATINGS}, 0)""",
+    'training': """
+        training_count = training_count {op} 1,
+        training_hours = training_hours {op} IFNULL({row}.hours, 0)""",
+    'separation': """
+        separation_count = separation_count {op} 1,
+        (separation_date, separation_type, separation_reason, blacklist) = (
+            SELECT s.separation_date, s.separation_type, s.reason, s.blacklist FROM separation s
+            WHERE IFNULL(s.user_id, -1) = IFNULL({row}.user_id, -1) AND s.emp_id = {row}.emp_id
+            ORDER BY s.separation_date DESC LIMIT 1)""",
+}
+
+# 由現有資料重建摘要（遷移時使用）
+SUMMARY_BACKFILL = {
+    'performance': f"""
+        (performance_count, score_total, score_count, low_rating_count) = (
+            SELECT COUNT(*), IFNULL(SUM(p.score), 0), COUNT(p.score), IFNULL(SUM(p.rating IN {LOW_RATINGS}), 0)
+            FROM performance p
+            WHERE IFNULL(p.user_id, -1) = IFNULL(employee_summary.user_id, -1) AND p.emp_id = employee_summary.emp_id)""",
+    'training': """
+        (training_count, training_hours) = (
+            SELECT COUNT(*), IFNULL(SUM(t.hours), 0) FROM training t
+            WHERE IFNULL(t.user_id, -1) = IFNULL(employee_summary.user_id, -1) AND t.emp_id = employee_summary.emp_id)""",
+    'separation': """
+        separation_count = (
+            SELECT COUNT(*) FROM separation s
+            WHERE IFNULL(s.user_id, -1) = IFNULL(employee_summary.user_id, -1) AND s.emp_id = employee_summary.emp_id),
+        (separation_date, separation_type, separation_reason, blacklist) = (
+            SELECT s.separation_date, s.separation_type, s.reason, s.blacklist FROM separation s
+            WHERE IFNULL(s.user_id, -1) = IFNULL(employee_summary.user_id, -1) AND s.emp_id = employee_summary.emp_id
+            ORDER BY s.separation_date DESC LIMIT 1)""",
+}
+
+
+def _summary_triggers(table_name):
+    """歷程資料表新增、刪除、更新時維護 employee_summary 的觸發器"""
+    ensure = ("INSERT INTO employee_summary (user_id, emp_id) SELECT {row}.user_id, {row}.emp_id "
+              "WHERE {row}.emp_id IS NOT NULL ON CONFLICT DO NOTHING;")
+    update = ("UPDATE employee_summary SET " + SUMMARY_UPDATES[table_name] +
+              " WHERE IFNULL(user_id, -1) = IFNULL({row}.user_id, -1) AND emp_id = {row}.emp_id;")
+
+    def body(*steps):
+        return ' '.join(step.format(row=row, op=op) for step, row, op in steps)
+
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table_name}_summary_ai AFTER INSERT ON {table_name}
+            WHEN new.emp_id IS NOT NULL BEGIN
+            {body((ensure, 'new', ''), (update, 'new', '+'))}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table_name}_summary_ad AFTER DELETE ON {table_name}
+            WHEN old.emp_id IS NOT NULL BEGIN
+            {body((update, 'old', '-'))}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table_name}_summary_au AFTER UPDATE ON {table_name} BEGIN
+            {body((update, 'old', '-'), (ensure, 'new', ''), (update, 'new', '+'))}
+        END""",
+    ]
 
 
-def migrate_add_user_id_column():
-    """為所有資料庫的資料表添加 user_id 欄位"""
-
-    # 所有需要遷移的資料庫
-    databases = [
-        # M4 資料庫
-        'm4_employees', 'm4_performance', 'm4_training', 'm4_separation',
-        # M5 資料庫
-        'm5_qualification',
-        # M6 資料庫
-        'm6_reminders',
-        # 範本資料庫
-        'workflow_templates'
+def _create_employee_summary(conn):
+    """建立員工歷程摘要表、維護觸發器，並以現有資料回填"""
+    tables = [table for table in SUMMARY_UPDATES if table in _existing_tables(conn)]
+    if not tables:
+        return
+    conn.execute(EMPLOYEE_SUMMARY_TABLE)
+    conn.execute(EMPLOYEE_SUMMARY_INDEX)
+    for table_name in tables:
+        for trigger_sql in _summary_triggers(table_name):
+            conn.execute(trigger_sql)
+        conn.execute(f"""
+            INSERT INTO employee_summary (user_id, emp_id)
+            SELECT DISTINCT user_id, emp_id FROM {table_name} WHERE emp_id IS NOT NULL
+            ON CONFLICT DO NOTHING
+        """)
+        conn.execute(f"UPDATE employee_summary SET {SUMMARY_BACKFILL[table_name]}")
+
+
+# 依 user_id 分開的資料列計數，由觸發器維護，統計時不需 COUNT(*) 掃描整個資料表
+ROW_COUNTS_TABLE = """
+    CREATE TABLE IF NOT EXISTS row_counts (
+        user_id INTEGER,
+        name TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0
+    )
+"""
+ROW_COUNTS_INDEX = "CREATE UNIQUE INDEX IF NOT EXISTS uq_row_counts ON row_counts (IFNULL(user_id, -1), name)"
+
+# 各資料表維護的計數：{資料表: {計數名稱: 計入條件}}，條件中的 {row} 為 new / old / 資料表名稱
+ROW_COUNTERS = {
+    'employees': {'employees': '1', 'active_employees': "{row}.status = 'active'"},
+    'performance': {'performance': '1'},
+    'training': {'training': '1'},
+    'separation': {'separation': '1'},
+    'reminders': {'reminders': '1', 'pending_reminders': "{row}.status = 'pending'"},
+}
+
+
+def _row_count_triggers(table_name):
+    """資料表新增、刪除、更新 user_id / status 時維護 row_counts 的觸發器"""
+    counters = ROW_COUNTERS[table_name]
+    increment = ("INSERT INTO row_counts (user_id, name, count) SELECT {row}.user_id, '{name}', 1 WHERE {condition} "
+                 "ON CONFLICT(IFNULL(user_id, -1), name) DO UPDATE SET count = count + 1;")
+    decrement = ("UPDATE row_counts SET count = count - 1 "
+                 "WHERE IFNULL(user_id, -1) = IFNULL({row}.user_id, -1) AND name = '{name}' AND {condition};")
+
+    def body(step, row):
+        return ' '.join(step.format(row=row, name=name, condition=condition.format(row=row))
+                        for name, condition in counters.items())
+
+    update_columns = ', '.join(['user_id'] + (['status'] if len(counters) > 1 else []))
+    return [
+        f"""CREATE TRIGGER IF NOT EXISTS {table_name}_counts_ai AFTER INSERT ON {table_name} BEGIN
+            {body(increment, 'new')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table_name}_counts_ad AFTER DELETE ON {table_name} BEGIN
+            {body(decrement, 'old')}
+        END""",
+        f"""CREATE TRIGGER IF NOT EXISTS {table_name}_counts_au AFTER UPDATE OF {update_columns} ON {table_name} BEGIN
+            {body(decrement, 'old')} {body(increment, 'new')}
+        END""",
     ]
 
-    # 每個資料庫中的資料表
-    tables_map = {
-        'm4_employees': ['employees'],
-        'm4_performance': ['performance'],
-        'm4_training': ['training'],
-        'm4_separation': ['separation'],
-        'm5_qualification': ['employees', 'performance', 'training', 'separation'],
-        'm6_reminders': ['employees', 'reminders'],
-        'workflow_templates': ['workflow_templates']
-    }
-
-    for db_name in databases:
+
+def _create_row_counters(conn):
+    """建立資料列計數表、維護觸發器，並以現有資料回填"""
+    tables = [table for table in ROW_COUNTERS if table in _existing_tables(conn)]
+    if not tables:
+        return
+    conn.execute(ROW_COUNTS_TABLE)
+    conn.execute(ROW_COUNTS_INDEX)
+    for table_name in tables:
+        for trigger_sql in _row_count_triggers(table_name):
+            conn.execute(trigger_sql)
+        for name, condition in ROW_COUNTERS[table_name].items():
+            conn.execute(f"""
+                INSERT INTO row_counts (user_id, name, count)
+                SELECT user_id, '{name}', COUNT(*) FROM {table_name} WHERE {condition.format(row=table_name)}
+                GROUP BY user_id
+            """)
+
+
+# PRAGMA auto_vacuum 的 INCREMENTAL 模式：刪除後的空頁由 incremental_vacuum 歸還檔案系統
+AUTO_VACUUM_INCREMENTAL = 2
+
+
+def vacuum_database(conn, checkpoint='TRUNCATE'):
+    """
+    全量重整資料庫檔案並切換為 auto_vacuum=INCREMENTAL
+
+    VACUUM 可能改變沒有 INTEGER PRIMARY KEY 的資料表（employees）的 rowid，
+    因此之後重建以 rowid 對應的全文檢索索引。WAL 模式下檔案在 checkpoint 後才會縮小。
+    conn 必須是自動提交模式且不在交易中。
+    """
+    conn.execute(f"PRAGMA auto_vacuum = {AUTO_VACUUM_INCREMENTAL}")
+    conn.execute("VACUUM")
+    if 'employees_fts' in _existing_tables(conn):
+        conn.execute("INSERT INTO employees_fts (employees_fts) VALUES ('rebuild')")
+    conn.execute(f"PRAGMA wal_checkpoint({checkpoint})").fetchall()
+
+
+# (版本, 說明, 步驟)；新增步驟時只能附加在最後
+MIGRATIONS = [
+    (1, '添加 user_id 欄位', _add_user_id_columns),
+    (2, '建立次要索引', _create_indexes),
+    (3, '建立員工全文檢索索引', _create_employee_search_index),
+    (4, '自然鍵去重並建立唯一索引', _dedupe_natural_keys),
+    (5, '添加 row_hash 欄位', _add_row_hash_columns),
+    (6, '建立員工歷程摘要表', _create_employee_summary),
+    (7, '建立資料列計數表', _create_row_counters),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+_migrated = set()
+_migrate_lock = threading.Lock()
+
+
+def get_schema_version(db_path):
+    """讀取資料庫檔案的結構版本"""
+    conn = sqlite3.connect(db_path)
+    try:
+        return conn.execute("PRAGMA user_version").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def migrate_database(db_path):
+    """
+    將單一資料庫檔案遷移到最新結構版本
+
+    auto_vacuum 只能在全量 VACUUM 時切換，開啟檔案時不做；建立於 INCREMENTAL 之前的檔案
+    維持原狀，由 DBManager.compact()（compact_databases.py）轉換。
+
+    Args:
+        db_path: 資料庫檔案路徑
+
+    Returns:
+        本次套用的步驟數（已是最新版本則為 0）
+    """
+    path = os.path.abspath(db_path)
+    if path in _migrated:
+        return 0
+
+    with _migrate_lock:
+        if path in _migrated:
+            return 0
+
+        applied = 0
+        conn = sqlite3.connect(path, timeout=30, isolation_level=None)
+        try:
+            if conn.execute("PRAGMA user_version").fetchone()[0] < SCHEMA_VERSION:
+                # 取得寫入鎖後重新讀取版本：其他行程可能已完成遷移
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    version = conn.execute("PRAGMA user_version").fetchone()[0]
+                    for step_version, _, step in MIGRATIONS:
+                        if step_version > version:
+                            step(conn)
+                            applied += 1
+                    conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+                    conn.execute("COMMIT")
+                except Exception:
+                    conn.execute("ROLLBACK")
+                    raise
+        finally:
+            conn.close()
+
+        _migrated.add(path)
+        return applied
+
+
+def migrate_all_databases():
+    """遷移 data/ 下所有已存在的應用程式資料庫"""
+    for db_name in DATABASES:
         db_path = f'data/{db_name}.db'
 
         # 如果資料庫不存在，跳過
         if not os.path.exists(db_path):
-            print(f'⏭️  {db_name}.db 不存在，跳過')
             continue
 
         try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-
-            tables = tables_map.get(db_name, [])
-
-            for table_name in tables:
-                # 檢查表是否存在
-                cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'")
-                if not cursor.fetchone():
-                    print(f'⏭️  {db_name}.{table_name} 表不存在，跳過')
-                    continue
-
-                # 檢查 user_id 欄位是否已存在
-                cursor.execute(f"PRAGMA table_info({table_name})")
-                columns = [col[1] for col in cursor.fetchall()]
-
-                if 'user_id' in columns:
-                    print(f'✅ {db_name}.{table_name} 已有 user_id 欄位')
-                else:
-                    # 添加 user_id 欄位（預設為 NULL，允許現有資料）
-                    cursor.execute(f"ALTER TABLE {table_name} ADD COLUMN user_id INTEGER")
-                    print(f'✅ {db_name}.{table_name} 添加 user_id 欄位成功')
-
-            conn.commit()
-            conn.close()
-
+            migrate_database(db_path)
         except Exception as e:
             print(f'❌ {db_name} 遷移失敗: {e}')
 
 
+def migrate_add_user_id_column():
+    """向後相容：舊呼叫點改為執行完整的版本化遷移"""
+    migrate_all_databases()
+
+
 def verify_migration():
     """驗證遷移是否成功"""
     print('\n📊 驗證遷移結果...\n')
 
-    databases = [
-        'm4_employees', 'm4_performance', 'm4_training', 'm4_separation',
-        'm5_qualification', 'm6_reminders', 'workflow_templates'
-    ]
-
-    tables_map = {
-        'm4_employees': ['employees'],
-        'm4_performance': ['performance'],
-        'm4_training': ['training'],
-        'm4_separation': ['separation'],
-        'm5_qualification': ['employees', 'performance', 'training', 'separation'],
-        'm6_reminders': ['employees', 'reminders'],
-        'workflow_templates': ['workflow_templates']
-    }
-
     all_ok = True
 
-    for db_name in databases:
+    for db_name in DATABASES:
         db_path = f'data/{db_name}.db'
 
         if not os.path.exists(db_path):
             continue
 
         try:
-            conn = sqlite3.connect(db_path)
-            cursor = conn.cursor()
-
-            tables = tables_map.get(db_name, [])
-
-            for table_name in tables:
-                cursor.execute(f"SELECT name FROM sqlite_master WHERE type='table' AND name='{table_name}'")
-                if not cursor.fetchone():
-                    continue
-
-                cursor.execute(f"PRAGMA table_info({table_name})")
-                columns = [col[1] for col in cursor.fetchall()]
-
-                if 'user_id' in columns:
-                    print(f'✅ {db_name}.{table_name} - user_id 欄位存在')
-                else:
-                    print(f'❌ {db_name}.{table_name} - user_id 欄位缺失')
-                    all_ok = False
-
-            conn.close()
+            version = get_schema_version(db_path)
+            if version >= SCHEMA_VERSION:
+                print(f'✅ {db_name} - 結構版本 {version}')
+            else:
+                print(f'❌ {db_name} - 結構版本 {version}（最新為 {SCHEMA_VERSION}）')
+                all_ok = False
 
         except Exception as e:
             print(f'❌ {db_name} 驗證失敗: {e}')
@@ -140,6 +486,6 @@ if __name__ == '__main__':
     sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
     print('🚀 開始資料庫遷移...\n')
-    migrate_add_user_id_column()
+    migrate_all_databases()
     verify_migration()
     print('\n✅ 遷移完成！')
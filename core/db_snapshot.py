@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+"""
+資料庫的唯讀記憶體快照
+
+資格檢核等只讀取資料的流程，每次查詢都回到磁碟上的資料庫檔案。快照在記憶體資料庫中建立相同的
+結構，再 ATTACH 資料庫檔案以 INSERT ... SELECT 只複製目前使用者的資料列，之後的查詢都由記憶體回答：
+- 讀取前以專用連線的 PRAGMA data_version 檢查檔案是否有其他連線 COMMIT（含本行程的寫入執行緒）
+- 有變更才重新複製，沒有變更時不碰檔案鎖；複製量取決於該使用者的資料量，而非整個檔案
+- 讀取方法與 DBManagerMultiUser 相同；快照不接受寫入
+"""
+
+import os
+import sqlite3
+import threading
+
+from core.db_manager import _PooledConnection
+from core.db_manager_multiuser import DBManagerMultiUser
+from core.query_stats import InstrumentedConnection, instrument_methods
+
+
+@instrument_methods
+class DBSnapshot(DBManagerMultiUser):
+    """以記憶體快照回答查詢的唯讀 DBManagerMultiUser"""
+
+    def __init__(self, db_name='employees', user_id=None):
+        """
+        Args:
+            db_name: 資料庫名稱
+            user_id: 只保留此使用者的資料（None 保留全部）
+        """
+        super().__init__(db_name, user_id=user_id)
+        self._source = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._memory = None
+        self._data_version = None
+        self.refreshes = 0
+
+    def refresh(self, force=False):
+        """
+        磁碟上的資料有變更時重新建立快照
+
+        Returns:
+            是否重新建立
+        """
+        with self._lock:
+            version = self._source.execute("PRAGMA data_version").fetchone()[0]
+            if self._memory is not None and version == self._data_version and not force:
+                return False
+
+            memory = sqlite3.connect(':memory:', check_same_thread=False, factory=InstrumentedConnection)
+            memory.db_path = f'{self.db_path} (snapshot)'
+            memory.row_factory = sqlite3.Row
+            self._copy_user_rows(memory, self.db_path, self.user_id)
+
+            # 正在使用舊快照的讀取不受影響，舊連線在沒有參照後自動關閉
+            self._memory = memory
+            self._data_version = version
+            self.refreshes += 1
+            return True
+
+    @staticmethod
+    def _copy_user_rows(memory, db_path, user_id):
+        """
+        在 memory 建立與 db_path 相同的資料表與索引，只複製 user_id 的資料列（None 複製全部）
+
+        快照不會寫入，因此不建立觸發器；FTS 影子表由虛擬表自動建立，內容複製後重建索引。
+        所有資料表在同一個讀取交易中複製，彼此一致。
+        """
+        memory.execute("ATTACH DATABASE ? AS src", (db_path,))
+        try:
+            memory.execute("BEGIN")
+            schema = memory.execute(
+                "SELECT type, name, sql FROM src.sqlite_master "
+                "WHERE sql IS NOT NULL AND name NOT LIKE 'sqlite_%' ORDER BY rowid").fetchall()
+            virtual = [name for kind, name, sql in schema
+                       if kind == 'table' and sql.upper().startswith('CREATE VIRTUAL TABLE')]
+            tables = [(name, sql) for kind, name, sql in schema if kind == 'table'
+                      and not any(name.startswith(f'{v}_') for v in virtual)]
+
+            for name, sql in tables:
+                memory.execute(sql)
+            for name, sql in tables:
+                if name in virtual:
+                    continue
+                info = memory.execute(f"PRAGMA main.table_info({name})").fetchall()
+                columns = [row[1] for row in info]
+                # 沒有 INTEGER PRIMARY KEY 的資料表一併保留 rowid（keyset 分頁與 FTS 以 rowid 對應）
+                if 'WITHOUT ROWID' not in sql.upper() and not any(row[5] and row[2].upper() == 'INTEGER' for row in info):
+                    columns = ['rowid'] + columns
+                column_list = ', '.join(columns)
+                select = f"INSERT INTO main.{name} ({column_list}) SELECT {column_list} FROM src.{name}"
+                if user_id is not None and 'user_id' in columns:
+                    memory.execute(f"{select} WHERE user_id IS ?", (user_id,))
+                else:
+                    memory.execute(select)
+            for kind, name, sql in schema:
+                if kind in ('index', 'view'):
+                    memory.execute(sql)
+            version = memory.execute("PRAGMA src.user_version").fetchone()[0]
+            memory.execute("COMMIT")
+        finally:
+            if memory.in_transaction:
+                memory.execute("ROLLBACK")
+            memory.execute("DETACH DATABASE src")
+
+        memory.execute(f"PRAGMA user_version = {int(version)}")
+        for name in virtual:
+            memory.execute(f"INSERT INTO {name} ({name}) VALUES ('rebuild')")
+        memory.commit()
+
+    def _get_connection(self):
+        """借用快照連線（必要時先重新建立）；close() 不會關閉快照"""
+        self.refresh()
+        return _PooledConnection(self._memory)
+
+    def _cached(self, tables, key, loader):
+        """快照本身就在記憶體中，不再經過查詢快取"""
+        return loader()
+
+    def submit_write(self, func, tables=None):
+        raise RuntimeError('快照為唯讀，請改用 DBManagerMultiUser 寫入')
+
+    def close(self):
+        """關閉快照與來源連線"""
+        with self._lock:
+            self._source.close()
+            self._memory = None
+
+
+_snapshots = {}
+_snapshots_lock = threading.Lock()
+
+
+def get_db_snapshot(db_name, user_id=None):
+    """取得共用的唯讀快照（依 (db_name, user_id) 快取，同一使用者的工作階段共用一份記憶體）"""
+    key = (os.path.abspath(f'data/{db_name}.db'), user_id)
+    snapshot = _snapshots.get(key)
+    if snapshot is None:
+        with _snapshots_lock:
+            snapshot = _snapshots.get(key)
+            if snapshot is None:
+                snapshot = _snapshots[key] = DBSnapshot(db_name, user_id=user_id)
+    return snapshot
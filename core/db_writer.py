@@ -0,0 +1,308 @@
+# -*- coding: utf-8 -*-
+"""
+單一寫入者佇列（每個資料庫檔案一條寫入執行緒）
+
+SQLite 同一時間只允許一個寫入者。多個 Streamlit 工作階段同時寫入同一個檔案時，
+各自搶寫入鎖容易出現 "database is locked"。改由每個檔案專屬的寫入執行緒依序執行：
+- 呼叫端以 submit(func) 送出寫入工作，取得 Future
+- 寫入執行緒一次取出佇列中所有待處理的工作，在同一個交易中執行後一次 COMMIT（group commit）
+- 每個工作包在自己的 SAVEPOINT 中，單一工作失敗只回滾該工作，不影響同批其他工作
+- Future 在 COMMIT 完成後才回報結果，呼叫端拿到結果時資料已寫入
+- on_commit 回呼在 COMMIT 後、Future 回報前執行（用於查詢快取失效）
+- submit_idle(func) 送出不能在交易中執行的維護工作（VACUUM、checkpoint），在同批寫入 COMMIT 後執行
+- submit_attached() 在單一工作中 ATTACH 其他檔案、寫入並 COMMIT，結束時一定 DETACH
+- poll_external() 以寫入連線的 PRAGMA data_version 偵測其他行程（或佇列外的連線）是否已 COMMIT；
+  data_version 不會因這條連線自己的 COMMIT 改變，因此佇列內的寫入不會被誤判
+"""
+
+import os
+import atexit
+import threading
+import queue
+import functools
+import contextvars
+from concurrent.futures import Future
+
+
+_STOP = object()
+_IDLE = object()  # 佇列中維護工作的標記（取代 on_commit 欄位）
+
+
+def _in_caller_context(func):
+    """在送出端的 contextvars 中執行工作（查詢紀錄以此對應到呼叫的 DBManager 方法）"""
+    return functools.partial(contextvars.copy_context().run, func)
+
+
+class WriteQueue:
+    """單一資料庫檔案的寫入佇列與寫入執行緒"""
+
+    def __init__(self, db_path, connect, max_batch=256, busy_timeout_ms=30000):
+        """
+        Args:
+            db_path: 資料庫檔案路徑
+            connect: 開啟連線的函式 connect(db_path) -> sqlite3.Connection（需允許跨執行緒使用）
+            max_batch: 單次 group commit 最多合併的工作數
+            busy_timeout_ms: 等待其他行程釋放寫入鎖的時間
+        """
+        self.db_path = os.path.abspath(db_path)
+        self.max_batch = max_batch
+        self._jobs = queue.Queue()
+        self._after_commit = []  # 寫入工作中巢狀送出的 on_commit，隨外層交易 COMMIT 執行
+
+        # 連線在建立佇列時開啟，開啟失敗直接拋給呼叫端；之後只由寫入執行緒使用
+        self._conn = connect(self.db_path)
+        self._conn.isolation_level = None  # 交易由寫入執行緒明確控制
+        self._conn.execute(f"PRAGMA busy_timeout={int(busy_timeout_ms)}")
+
+        # 寫入執行緒執行批次時持有 _conn_lock；其他執行緒只在連線空閒時讀取 data_version
+        self._conn_lock = threading.Lock()
+        self._flag_lock = threading.Lock()
+        self._data_version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        self._external_change = False
+
+        self._thread = threading.Thread(
+            target=self._run, name=f'db-writer:{os.path.basename(self.db_path)}', daemon=True)
+        self._thread.start()
+
+    def submit(self, func, on_commit=None):
+        """
+        送出寫入工作
+
+        Args:
+            func: func(conn) 在寫入交易中執行，回傳值即為 Future 結果；
+                  不可自行 commit / rollback
+            on_commit: 工作成功且 COMMIT 後呼叫的無參數函式
+
+        Returns:
+            concurrent.futures.Future
+        """
+        future = Future()
+        if threading.current_thread() is self._thread:
+            # 寫入工作中再送出寫入：直接在目前的交易內執行，避免等待自己
+            future.set_running_or_notify_cancel()
+            try:
+                result = func(self._conn)
+            except BaseException as e:
+                future.set_exception(e)
+            else:
+                if on_commit is not None:
+                    self._after_commit.append(on_commit)
+                future.set_result(result)
+            return future
+
+        self._jobs.put((future, _in_caller_context(func), on_commit))
+        return future
+
+    def submit_idle(self, func):
+        """
+        送出在交易外執行的維護工作
+
+        寫入執行緒處理完同批寫入並 COMMIT 後，以自動提交模式執行 func(conn)，
+        供 VACUUM、incremental_vacuum、wal_checkpoint 等不能包在寫入交易中的操作使用。
+
+        Returns:
+            concurrent.futures.Future
+        """
+        if threading.current_thread() is self._thread:
+            raise RuntimeError('維護工作不能在寫入工作中送出')
+        future = Future()
+        self._jobs.put((future, _in_caller_context(func), _IDLE))
+        return future
+
+    def poll_external(self):
+        """
+        自上次呼叫後，是否有其他連線對這個檔案 COMMIT 過
+
+        寫入執行緒忙碌時不等待：批次以 BEGIN IMMEDIATE 取得寫入鎖後會先檢查一次，
+        之後到 COMMIT 前其他行程無法寫入，因此不會漏掉變更。
+        """
+        if self._conn_lock.acquire(blocking=False):
+            try:
+                self._check_data_version()
+            finally:
+                self._conn_lock.release()
+        with self._flag_lock:
+            changed, self._external_change = self._external_change, False
+        return changed
+
+    def _check_data_version(self):
+        version = self._conn.execute("PRAGMA data_version").fetchone()[0]
+        if version != self._data_version:
+            self._data_version = version
+            with self._flag_lock:
+                self._external_change = True
+
+    def submit_attached(self, databases, func, on_commit=None):
+        """
+        送出需要讀取其他資料庫檔案的寫入工作（例如 INSERT ... SELECT）
+
+        ATTACH 不能在交易中執行，而且附加後 BEGIN IMMEDIATE 也會取得被附加檔案的寫入鎖，
+        因此與 submit_idle 一樣在同批寫入 COMMIT 後執行：ATTACH → BEGIN IMMEDIATE → func(conn)
+        → COMMIT → on_commit，最後一定 DETACH，之後的 group commit 只鎖定自己的檔案。
+
+        Args:
+            databases: {alias: 資料庫檔案路徑}；func 以 alias.table 讀取
+            func: func(conn) 在寫入交易中執行；失敗時整個工作回滾
+            on_commit: COMMIT 後呼叫的無參數函式
+
+        Returns:
+            concurrent.futures.Future
+        """
+        def run(conn):
+            attached = []
+            try:
+                for alias, db_path in databases.items():
+                    conn.execute(f"ATTACH DATABASE ? AS {alias}", (db_path,))
+                    attached.append(alias)
+                conn.execute("BEGIN IMMEDIATE")
+                try:
+                    result = func(conn)
+                    conn.execute("COMMIT")
+                except BaseException:
+                    if conn.in_transaction:
+                        conn.execute("ROLLBACK")
+                    raise
+            finally:
+                for alias in attached:
+                    conn.execute(f"DETACH DATABASE {alias}")
+
+            if on_commit is not None:
+                try:
+                    on_commit()
+                except Exception as e:
+                    print(f"寫入後回呼失敗: {e}")
+            return result
+
+        return self.submit_idle(run)
+
+    def close(self):
+        """處理完已送出的工作後停止寫入執行緒"""
+        self._jobs.put(_STOP)
+        self._thread.join()
+
+    def _run(self):
+        try:
+            while True:
+                batch = [self._jobs.get()]
+                # 取出目前累積的所有工作（上一批 COMMIT 期間進來的工作會在這裡合併）
+                while len(batch) < self.max_batch and batch[-1] is not _STOP:
+                    try:
+                        batch.append(self._jobs.get_nowait())
+                    except queue.Empty:
+                        break
+
+                stop = batch[-1] is _STOP
+                jobs = [job for job in batch if job is not _STOP and job[2] is not _IDLE]
+                idle_jobs = [job for job in batch if job is not _STOP and job[2] is _IDLE]
+                if jobs:
+                    with self._conn_lock:
+                        try:
+                            self._commit(jobs)
+                        except BaseException as e:
+                            # 連線層級的錯誤：未回報的工作全部以例外結束，寫入執行緒繼續服務
+                            for future, _, _ in jobs:
+                                if not future.done():
+                                    future.set_exception(e)
+                            if self._conn.in_transaction:
+                                self._conn.execute("ROLLBACK")
+                for future, func, _ in idle_jobs:
+                    if future.set_running_or_notify_cancel():
+                        with self._conn_lock:
+                            try:
+                                future.set_result(func(self._conn))
+                            except BaseException as e:
+                                future.set_exception(e)
+                if stop:
+                    return
+        finally:
+            self._conn.close()
+
+    def _commit(self, jobs):
+        """在單一交易中執行一批工作，COMMIT 後才回報各 Future"""
+        jobs = [job for job in jobs if job[0].set_running_or_notify_cancel()]
+        if not jobs:
+            return
+
+        conn = self._conn
+        self._after_commit = []
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+        except Exception as e:
+            for future, _, _ in jobs:
+                future.set_exception(e)
+            return
+
+        # 持有寫入鎖後，其他連線在 COMMIT 前都無法寫入；在此記下之前的外部變更
+        self._check_data_version()
+
+        outcomes = []
+        for future, func, on_commit in jobs:
+            conn.execute("SAVEPOINT write_job")
+            try:
+                result = func(conn)
+                conn.execute("RELEASE write_job")
+                outcomes.append((future, result, None))
+                if on_commit is not None:
+                    self._after_commit.append(on_commit)
+            except BaseException as e:
+                if not conn.in_transaction:
+                    # 錯誤已讓 SQLite 回滾整個交易，同批已執行的工作也一併失效
+                    future.set_exception(e)
+                    raise
+                conn.execute("ROLLBACK TO write_job")
+                conn.execute("RELEASE write_job")
+                outcomes.append((future, None, e))
+
+        try:
+            conn.execute("COMMIT")
+        except Exception as e:
+            if conn.in_transaction:
+                conn.execute("ROLLBACK")
+            for future, _, _ in outcomes:
+                future.set_exception(e)
+            return
+
+        # 先執行回呼再回報 Future：呼叫端拿到結果時，快取已經失效
+        for on_commit in self._after_commit:
+            try:
+                on_commit()
+            except Exception as e:
+                print(f"寫入後回呼失敗: {e}")
+        self._after_commit = []
+
+        for future, result, error in outcomes:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(result)
+
+
+_queues = {}
+_queues_lock = threading.Lock()
+
+
+def get_write_queue(db_path, connect):
+    """取得資料庫檔案的寫入佇列（每個檔案在每個行程只有一個）"""
+    path = os.path.abspath(db_path)
+    write_queue = _queues.get(path)
+    if write_queue is None:
+        with _queues_lock:
+            write_queue = _queues.get(path)
+            if write_queue is None:
+                write_queue = _queues[path] = WriteQueue(path, connect)
+    return write_queue
+
+
+def shutdown_write_queues(db_path=None):
+    """停止寫入執行緒（db_path 為 None 時停止全部）"""
+    with _queues_lock:
+        if db_path is None:
+            paths = list(_queues)
+        else:
+            paths = [os.path.abspath(db_path)]
+        stopping = [_queues.pop(path) for path in paths if path in _queues]
+    for write_queue in stopping:
+        write_queue.close()
+
+
+atexit.register(shutdown_write_queues)
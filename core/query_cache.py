@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+查詢結果快取（依資料表世代失效）
+
+Streamlit 每次 rerun 都會重複執行相同的讀取。快取以
+(資料庫檔案, 查詢, 參數, user_id) 為鍵，並記錄讀取當下相關資料表的世代編號：
+- 每個寫入方法在 COMMIT 後遞增被寫入資料表的世代
+- 讀取時世代不同即視為過期，重新查詢
+- 以 LRU 淘汰，總大小（鍵與結果）不超過記憶體上限
+"""
+
+import os
+import sys
+import threading
+from collections import OrderedDict
+
+import pandas as pd
+
+
+# 未指定資料表的寫入會遞增此世代，使該檔案所有快取失效
+ALL_TABLES = '*'
+
+
+def _estimate_size(value):
+    """估算快取值佔用的記憶體（位元組）"""
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(index=True, deep=True).sum())
+    if isinstance(value, dict):
+        return sys.getsizeof(value) + sum(sys.getsizeof(k) + _estimate_size(v) for k, v in value.items())
+    if isinstance(value, (list, tuple)):
+        return sys.getsizeof(value) + sum(_estimate_size(v) for v in value)
+    return sys.getsizeof(value)
+
+
+def _copy(value):
+    """回傳給呼叫端的副本，避免呼叫端修改到快取內容"""
+    if isinstance(value, pd.DataFrame):
+        return value.copy()
+    if isinstance(value, dict):
+        return {k: _copy(v) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_copy(v) for v in value]
+    return value
+
+
+class QueryCache:
+    """以資料表世代判斷是否過期的 LRU 查詢結果快取"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: 快取總大小上限；超過上限的單一結果不會被快取
+        """
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> (tag, value, size)
+        self._generations = {}  # (db_path, table) -> int
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def _tag(self, db_path, tables):
+        return (self._generations.get((db_path, ALL_TABLES), 0),) + tuple(
+            self._generations.get((db_path, table), 0) for table in tables)
+
+    def bump(self, db_path, tables=None):
+        """
+        遞增資料表世代（寫入 COMMIT 後呼叫）
+
+        Args:
+            db_path: 資料庫檔案路徑
+            tables: 被寫入的資料表；None 表示整個檔案
+        """
+        db_path = os.path.abspath(db_path)
+        with self._lock:
+            for table in (tables or (ALL_TABLES,)):
+                key = (db_path, table)
+                self._generations[key] = self._generations.get(key, 0) + 1
+
+    def get_or_load(self, db_path, tables, key, loader):
+        """
+        取得快取結果，過期或不存在時呼叫 loader() 重新讀取
+
+        Args:
+            db_path: 資料庫檔案路徑
+            tables: 查詢讀取的資料表
+            key: 查詢鍵（查詢名稱、參數、user_id）
+            loader: 無參數的讀取函式
+
+        Returns:
+            查詢結果的副本
+        """
+        db_path = os.path.abspath(db_path)
+        key = (db_path, key)
+
+        with self._lock:
+            # 世代在查詢前取得：查詢期間若有寫入，存入的結果會帶著舊世代而在下次讀取時失效
+            tag = self._tag(db_path, tables)
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == tag:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return _copy(entry[1])
+            self.misses += 1
+
+        value = loader()
+        # 鍵也計入大小：批次查詢的鍵含整份工號列表，可能比結果本身還大
+        size = _estimate_size(key) + _estimate_size(value)
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._size -= old[2]
+            if size <= self.max_bytes:
+                self._entries[key] = (tag, value, size)
+                self._size += size
+                while self._size > self.max_bytes:
+                    _, (_, _, evicted_size) = self._entries.popitem(last=False)
+                    self._size -= evicted_size
+
+        return _copy(value)
+
+    def clear(self):
+        """清除所有快取結果（世代保留）"""
+        with self._lock:
+            self._entries.clear()
+            self._size = 0
+
+    def stats(self):
+        """快取統計"""
+        with self._lock:
+            return {'entries': len(self._entries), 'bytes': self._size, 'max_bytes': self.max_bytes,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+# 行程共用的快取
+query_cache = QueryCache()
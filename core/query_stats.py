@@ -0,0 +1,359 @@
+# -*- coding: utf-8 -*-
+"""
+查詢效能紀錄（連線/游標層級的量測）
+
+連線池與寫入佇列的連線都以 InstrumentedConnection 開啟，每個 SQL 陳述式執行完
+（取完結果、游標關閉或執行下一個陳述式時）記錄一筆：
+- 耗時（含取回結果）、回傳列數、資料庫檔案、呼叫的 DBManager 方法與 user_id
+- 依 (資料庫, 方法, SQL) 彙總次數、總耗時與最近 window 次的 p50 / p95 / p99
+- 超過 slow_ms 的查詢自動擷取 EXPLAIN QUERY PLAN，並附加寫入慢查詢 JSONL 檔
+
+以 query_stats.summary() / slow_queries() 讀取，dump() 輸出成 JSONL，
+用來找出全表掃描（計畫中的 SCAN）與 N+1（同一方法中大量重複的查詢）。
+
+量測預設關閉，以環境變數 HR_QUERY_STATS 開啟：1 記錄每個陳述式，0 到 1 之間的數字為抽樣比例
+（例如 0.05 只記錄約 5% 的陳述式）；執行中也可設定 query_stats.sample_rate。
+呼叫的方法與 user_id 由 instrument_methods 包裝的 DBManager 方法在最外層記下一次，
+不在每個陳述式時走訪呼叫堆疊。
+"""
+
+import os
+import sys
+import json
+import random
+import sqlite3
+import inspect
+import threading
+import functools
+import contextvars
+import time
+from collections import deque
+from datetime import datetime
+
+
+_THIS_FILE = os.path.abspath(__file__)
+
+# 目前執行中的 (方法名稱, user_id)：最外層的 DBManager 方法設定（例如 get_summary_many 而非其內部的 load）
+_current_call = contextvars.ContextVar('query_stats_call', default=None)
+
+# 會擷取查詢計畫的陳述式
+_EXPLAINABLE = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE', 'REPLACE')
+
+
+def _percentile(sorted_values, pct):
+    if not sorted_values:
+        return None
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def _caller():
+    """回傳 (方法名稱, user_id)：目前的 DBManager 方法；不是經由 DBManager 方法執行時為第一個外部函式"""
+    call = _current_call.get()
+    if call is not None:
+        return call
+    frame = sys._getframe(2)
+    while frame is not None and frame.f_code.co_filename == _THIS_FILE:
+        frame = frame.f_back
+    if frame is None:
+        return None, None
+    code = frame.f_code
+    return getattr(code, 'co_qualname', code.co_name).split('.<locals>')[0], None
+
+
+def _sample_rate_from_env():
+    """HR_QUERY_STATS：未設定為 0（關閉），1 為全部記錄，0 到 1 之間為抽樣比例"""
+    value = os.environ.get('HR_QUERY_STATS', '').strip()
+    if not value:
+        return 0.0
+    try:
+        return min(max(float(value), 0.0), 1.0)
+    except ValueError:
+        return 1.0 if value.lower() in ('true', 'yes', 'on') else 0.0
+
+
+def _tracked(func):
+    """包裝 DBManager 方法：量測開啟時，在最外層的方法記下方法名稱與 user_id"""
+    method = func.__qualname__
+    params = list(inspect.signature(func).parameters)
+    # user_id 在參數列中的位置（扣掉 self）
+    position = params.index('user_id') - 1 if 'user_id' in params else None
+
+    @functools.wraps(func)
+    def wrapper(self, *args, **kwargs):
+        if not query_stats.sample_rate or _current_call.get() is not None:
+            return func(self, *args, **kwargs)
+        uid = kwargs.get('user_id')
+        if uid is None and position is not None and position < len(args):
+            uid = args[position]
+        if uid is None:
+            uid = getattr(self, 'user_id', None)
+        token = _current_call.set((method, uid))
+        try:
+            return func(self, *args, **kwargs)
+        finally:
+            _current_call.reset(token)
+
+    return wrapper
+
+
+def instrument_methods(cls):
+    """類別裝飾器：類別中定義的方法（不含 __init__ 等特殊方法）在查詢紀錄中以方法名稱彙總"""
+    for name, value in list(vars(cls).items()):
+        if inspect.isfunction(value) and not name.startswith('__'):
+            setattr(cls, name, _tracked(value))
+    return cls
+
+
+class QueryStats:
+    """查詢耗時統計、慢查詢紀錄與查詢計畫擷取"""
+
+    def __init__(self, slow_ms=100, window=1000, slow_log='data/slow_queries.jsonl', max_slow=200,
+                 sample_rate=None):
+        """
+        Args:
+            slow_ms: 慢查詢門檻（毫秒）；None 表示不記錄慢查詢
+            window: 每個查詢保留最近幾次的耗時計算百分位數
+            slow_log: 慢查詢附加寫入的 JSONL 檔案；None 表示只保留在記憶體
+            max_slow: 記憶體中保留的慢查詢筆數
+            sample_rate: 記錄的陳述式比例（0 關閉、1 全部）；None 表示依 HR_QUERY_STATS 環境變數
+        """
+        self.slow_ms = slow_ms
+        self.window = window
+        self.slow_log = slow_log
+        self.sample_rate = _sample_rate_from_env() if sample_rate is None else sample_rate
+        self._stats = {}  # (db, method, sql) -> 彙總
+        self._slow = deque(maxlen=max_slow)
+        self._lock = threading.Lock()
+
+    def sampled(self):
+        """這個陳述式是否要記錄"""
+        rate = self.sample_rate
+        return rate >= 1 or (rate > 0 and random.random() < rate)
+
+    def record(self, conn, sql, params, elapsed, rows, method=None, user_id=None):
+        """
+        記錄一次陳述式執行
+
+        Args:
+            conn: 執行的連線（慢查詢時以同一連線擷取查詢計畫）
+            sql: SQL 陳述式
+            params: 參數（executemany 時為 None，不擷取查詢計畫）
+            elapsed: 耗時（秒）
+            rows: 回傳列數（非查詢陳述式為影響列數）
+        """
+        db = os.path.basename(getattr(conn, 'db_path', '') or '')
+        elapsed_ms = elapsed * 1000
+        key = (db, method, sql)
+
+        with self._lock:
+            entry = self._stats.get(key)
+            if entry is None:
+                entry = self._stats[key] = {
+                    'count': 0, 'total_ms': 0.0, 'max_ms': 0.0, 'rows': 0,
+                    'durations': deque(maxlen=self.window), 'users': set(), 'plan': None,
+                }
+            entry['count'] += 1
+            entry['total_ms'] += elapsed_ms
+            entry['max_ms'] = max(entry['max_ms'], elapsed_ms)
+            entry['rows'] += max(rows, 0)
+            entry['durations'].append(elapsed_ms)
+            entry['users'].add(user_id)
+
+        if self.slow_ms is None or elapsed_ms < self.slow_ms:
+            return
+
+        plan = self._explain(conn, sql, params)
+        slow = {
+            'timestamp': datetime.now().isoformat(timespec='milliseconds'),
+            'db': db, 'method': method, 'user_id': user_id,
+            'sql': sql, 'duration_ms': round(elapsed_ms, 3), 'rows': rows, 'plan': plan,
+        }
+        with self._lock:
+            self._slow.append(slow)
+            if plan is not None and key in self._stats:
+                self._stats[key]['plan'] = plan
+            if self.slow_log:
+                try:
+                    os.makedirs(os.path.dirname(self.slow_log) or '.', exist_ok=True)
+                    with open(self.slow_log, 'a', encoding='utf-8') as f:
+                        f.write(json.dumps(slow, ensure_ascii=False, default=str) + '\n')
+                except OSError as e:
+                    print(f"慢查詢紀錄寫入失敗: {e}")
+
+    @staticmethod
+    def _explain(conn, sql, params):
+        if params is None or not sql.lstrip().upper().startswith(_EXPLAINABLE):
+            return None
+        try:
+            # 以一般游標執行，避免 EXPLAIN 本身也被記錄
+            cursor = sqlite3.Connection.cursor(conn, sqlite3.Cursor)
+            cursor.row_factory = None
+            rows = cursor.execute(f"EXPLAIN QUERY PLAN {sql}", params).fetchall()
+            cursor.close()
+            return [row[-1] for row in rows]
+        except sqlite3.Error:
+            return None
+
+    def summary(self, top=None):
+        """
+        各查詢的彙總（依總耗時由高到低）
+
+        Returns:
+            [{'db', 'method', 'sql', 'count', 'total_ms', 'mean_ms', 'p50_ms', 'p95_ms', 'p99_ms',
+              'max_ms', 'rows', 'users', 'plan', 'full_scan'}, ...]；plan 為最近一次慢查詢的查詢計畫
+        """
+        with self._lock:
+            items = [(key, dict(entry, durations=sorted(entry['durations']), users=sorted(entry['users'], key=str)))
+                     for key, entry in self._stats.items()]
+
+        result = []
+        for (db, method, sql), entry in items:
+            durations = entry['durations']
+            plan = entry['plan']
+            result.append({
+                'db': db, 'method': method, 'sql': sql,
+                'count': entry['count'],
+                'total_ms': round(entry['total_ms'], 3),
+                'mean_ms': round(entry['total_ms'] / entry['count'], 3),
+                'p50_ms': round(_percentile(durations, 50), 3),
+                'p95_ms': round(_percentile(durations, 95), 3),
+                'p99_ms': round(_percentile(durations, 99), 3),
+                'max_ms': round(entry['max_ms'], 3),
+                'rows': entry['rows'],
+                'users': entry['users'],
+                'plan': plan,
+                # 計畫中沒有使用索引的 SCAN 即為全表掃描
+                'full_scan': bool(plan) and any(
+                    step.startswith('SCAN') and 'INDEX' not in step for step in plan),
+            })
+        result.sort(key=lambda item: item['total_ms'], reverse=True)
+        return result[:top] if top else result
+
+    def slow_queries(self, limit=None):
+        """最近的慢查詢（新到舊）"""
+        with self._lock:
+            slow = list(reversed(self._slow))
+        return slow[:limit] if limit else slow
+
+    def dump(self, path='data/query_stats.jsonl'):
+        """將目前的彙總寫入 JSONL 檔案（每行一個查詢），回傳檔案路徑"""
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        with open(path, 'w', encoding='utf-8') as f:
+            for item in self.summary():
+                f.write(json.dumps(item, ensure_ascii=False, default=str) + '\n')
+        return path
+
+    def reset(self):
+        """清除統計與記憶體中的慢查詢"""
+        with self._lock:
+            self._stats.clear()
+            self._slow.clear()
+
+
+# 行程共用的統計
+query_stats = QueryStats()
+
+
+class InstrumentedCursor(sqlite3.Cursor):
+    """記錄每個陳述式耗時與列數的游標；SELECT 在取完結果（或游標關閉、再次執行）時才記錄"""
+
+    _pending = None  # [sql, params, 耗時, 列數, 方法, user_id]
+
+    def execute(self, sql, parameters=()):
+        self._finish()
+        if not query_stats.sampled():
+            return super().execute(sql, parameters)
+        method, uid = _caller()
+        start = time.perf_counter()
+        super().execute(sql, parameters)
+        self._pending = [sql, parameters, time.perf_counter() - start, 0, method, uid]
+        if self.description is None:
+            self._pending[3] = self.rowcount
+            self._finish()
+        return self
+
+    def executemany(self, sql, seq_of_parameters):
+        self._finish()
+        if not query_stats.sampled():
+            return super().executemany(sql, seq_of_parameters)
+        method, uid = _caller()
+        start = time.perf_counter()
+        super().executemany(sql, seq_of_parameters)
+        self._pending = [sql, None, time.perf_counter() - start, self.rowcount, method, uid]
+        self._finish()
+        return self
+
+    def _timed(self, fetch, *args):
+        if self._pending is None:
+            return fetch(*args)
+        start = time.perf_counter()
+        result = fetch(*args)
+        self._pending[2] += time.perf_counter() - start
+        return result
+
+    def fetchone(self):
+        row = self._timed(super().fetchone)
+        if self._pending is not None:
+            if row is None:
+                self._finish()
+            else:
+                self._pending[3] += 1
+        return row
+
+    def fetchmany(self, size=None):
+        rows = self._timed(super().fetchmany, self.arraysize if size is None else size)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+            if not rows:
+                self._finish()
+        return rows
+
+    def fetchall(self):
+        rows = self._timed(super().fetchall)
+        if self._pending is not None:
+            self._pending[3] += len(rows)
+            self._finish()
+        return rows
+
+    def __next__(self):
+        try:
+            row = self._timed(super().__next__)
+        except StopIteration:
+            self._finish()
+            raise
+        if self._pending is not None:
+            self._pending[3] += 1
+        return row
+
+    def close(self):
+        self._finish()
+        super().close()
+
+    def __del__(self):
+        try:
+            self._finish()
+        except Exception:
+            pass
+
+    def _finish(self):
+        pending, self._pending = self._pending, None
+        if pending is not None:
+            sql, params, elapsed, rows, method, uid = pending
+            query_stats.record(self.connection, sql, params, elapsed, rows, method, uid)
+
+
+class InstrumentedConnection(sqlite3.Connection):
+    """cursor() / execute() 都使用 InstrumentedCursor 的連線；db_path 記錄資料庫檔案"""
+
+    db_path = None
+
+    def cursor(self, factory=InstrumentedCursor):
+        return super().cursor(factory)
+
+    # sqlite3.Connection.execute 不經過 Cursor.execute，需改由 InstrumentedCursor 執行
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
@@ -2,8 +2,9 @@
 import streamlit as st
 import pandas as pd
 from core.column_matcher import ColumnMatcher
-from core.db_manager_multiuser import DBManagerMultiUser
-from utils.file_handler import FileHandler
+from core.data_processor import DataProcessor
+from core.db_manager_multiuser import get_db_manager
+from utils.file_handler import FileHandler, STREAM_ROWS
 from datetime import datetime
 from io import BytesIO
 
@@ -20,7 +21,7 @@ def render():
         st.session_state.uploader_id = 0
 
     # 初始化範本資料庫（支援多用戶）
-    template_db = DBManagerMultiUser('workflow_templates', user_id=user_id)
+    template_db = get_db_manager('workflow_templates', user_id=user_id)
 
     # ========== 範本管理區 ==========
     st.divider()
@@ -122,31 +123,30 @@ def render():
         st.info('📂 請上傳至少一個檔案開始使用')
         return
 
-    # 載入檔案（每次都重新載入，不保存）
+    # 欄位對齊只需要標題列：先讀取標題與樣本，完整讀取延後到執行合併
     try:
-        dataframes = {}
+        probes = {}
         for file in uploaded_files:
-            df = FileHandler.load_file(file)
-            dataframes[file.name] = df
+            probes[file.name] = FileHandler.probe(file)
     except Exception as e:
         st.error(f'載入檔案失敗: {e}')
         return
 
-    st.success(f'已載入 {len(dataframes)} 個檔案')
+    st.success(f'已載入 {len(probes)} 個檔案')
 
     # 顯示檔案預覽
-    for filename, df in dataframes.items():
+    for filename, probe in probes.items():
         with st.expander(f'📄 {filename}'):
             col1, col2 = st.columns([1, 3])
             with col1:
-                st.metric('資料筆數', df.shape[0])
-                st.metric('欄位數量', df.shape[1])
+                estimated_rows = probe['estimated_rows']
+                st.metric('資料筆數', '-' if estimated_rows is None else f"{'' if probe['exact'] else '約 '}{estimated_rows}")
+                st.metric('欄位數量', len(probe['columns']))
             with col2:
                 st.write('**欄位列表:**')
-                st.code(', '.join(df.columns.tolist()))
-            st.write('**資料預覽:**')
-            st.caption('💡 點擊右上角全螢幕按鈕可查看完整資料')
-            st.dataframe(df, width='stretch')
+                st.code(', '.join(map(str, probe['columns'])))
+            st.write(f"**資料預覽** (前 {len(probe['sample'])} 筆):")
+            st.dataframe(probe['sample'], width='stretch')
 
     st.divider()
     st.subheader('步驟 2: 智慧欄位對齊')
@@ -157,8 +157,8 @@ def render():
 
     # 收集所有欄位
     all_columns = {}
-    for filename, df in dataframes.items():
-        for col in df.columns:
+    for filename, probe in probes.items():
+        for col in probe['columns']:
             if col not in all_columns:
                 all_columns[col] = []
             all_columns[col].append(filename)
@@ -385,9 +385,8 @@ def render():
                     for col in similar_cols:
                         unified_mapping[col] = unified_name
 
-                # 即時處理：重命名並清理所有 DataFrame
-                cleaned_dfs = []
-                for filename, df in dataframes.items():
+                def unify_columns(df):
+                    """重命名為統一欄位名稱，同一檔案中對應到相同名稱的欄位只保留第一個"""
                     new_columns = []
                     col_positions = []
                     seen = set()
@@ -399,7 +398,43 @@ def render():
                             seen.add(unified_col)
                     df_clean = df.iloc[:, col_positions].copy()
                     df_clean.columns = new_columns
-                    cleaned_dfs.append(df_clean.reset_index(drop=True))
+                    return df_clean
+
+                estimated_rows = [probe['estimated_rows'] for probe in probes.values()]
+                streaming = (merge_method == '垂直堆疊' and None not in estimated_rows
+                             and sum(estimated_rows) > STREAM_ROWS)
+
+                if streaming:
+                    # 大型檔案：逐段讀取、重命名後直接寫成 CSV，不在記憶體中保留完整結果
+                    result_columns = list(dict.fromkeys(
+                        unified_mapping.get(col, col) for probe in probes.values() for col in probe['columns']))
+                    kept_rows = set()
+
+                    def stacked_chunks():
+                        for file in uploaded_files:
+                            for chunk in FileHandler.iter_chunks(file):
+                                chunk = unify_columns(chunk).reindex(columns=result_columns)
+                                if remove_duplicates:
+                                    chunk = DataProcessor.drop_seen_duplicates(chunk, kept_rows)
+                                yield chunk
+
+                    output, row_count = FileHandler.chunks_to_csv(stacked_chunks(), result_columns)
+                    st.session_state.last_merge_csv = (output, row_count)
+                    st.session_state.last_merge_result = pd.read_csv(output, encoding='utf-8-sig', nrows=1000)
+                    output.seek(0)
+                    st.session_state.last_merge_config = {
+                        'column_mapping': unified_mapping,
+                        'merge_method': merge_method,
+                        'merge_key': None,
+                        'merge_how': None,
+                        'remove_duplicates': remove_duplicates
+                    }
+                    st.session_state.merge_executed = True
+                    st.rerun()
+
+                # 即時處理：讀取完整檔案（解析結果依檔案內容快取），重命名並清理所有 DataFrame
+                cleaned_dfs = [unify_columns(FileHandler.load_file(file)).reset_index(drop=True)
+                               for file in uploaded_files]
 
                 # 執行合併
                 if merge_method == '垂直堆疊':
@@ -420,6 +455,7 @@ def render():
 
                 # 將結果與設定存入 session_state 以供區塊外使用
                 st.session_state.last_merge_result = result_df
+                st.session_state.last_merge_csv = None
                 st.session_state.last_merge_config = {
                     'column_mapping': unified_mapping,
                     'merge_method': merge_method,
@@ -436,23 +472,40 @@ def render():
     # ========== 合併結果與儲存範本區塊 (在按鈕外) ==========
     if st.session_state.get('merge_executed'):
         result_df = st.session_state.last_merge_result
-        st.success(f'✅ 合併完成！共 {len(result_df)} 筆資料，{len(result_df.columns)} 個欄位')
-        st.write('**合併結果預覽:**')
-        st.dataframe(result_df, width='stretch')
-
-        # 匯出 Excel
-        output = BytesIO()
-        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-            result_df.to_excel(writer, index=False, sheet_name='合併結果')
-        output.seek(0)
-
-        st.download_button(
-            label='📥 下載合併結果（Excel）',
-            data=output,
-            file_name=f'merged_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
-            mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-            width='stretch'
-        )
+        merge_csv = st.session_state.get('last_merge_csv')
+
+        if merge_csv is not None:
+            # 分段合併的結果只保留 CSV 與前 1000 筆預覽
+            output, row_count = merge_csv
+            st.success(f'✅ 合併完成！共 {row_count} 筆資料，{len(result_df.columns)} 個欄位')
+            st.write(f'**合併結果預覽** (前 {len(result_df)} 筆):')
+            st.dataframe(result_df, width='stretch')
+
+            st.download_button(
+                label='📥 下載合併結果（CSV）',
+                data=output,
+                file_name=f'merged_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+                mime='text/csv',
+                width='stretch'
+            )
+        else:
+            st.success(f'✅ 合併完成！共 {len(result_df)} 筆資料，{len(result_df.columns)} 個欄位')
+            st.write('**合併結果預覽:**')
+            st.dataframe(result_df, width='stretch')
+
+            # 匯出 Excel
+            output = BytesIO()
+            with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                result_df.to_excel(writer, index=False, sheet_name='合併結果')
+            output.seek(0)
+
+            st.download_button(
+                label='📥 下載合併結果（Excel）',
+                data=output,
+                file_name=f'merged_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                width='stretch'
+            )
 
         st.divider()
         st.subheader('💾 儲存此流程為範本')
@@ -2,8 +2,8 @@
 import streamlit as st
 import pandas as pd
 from core.data_processor import DataProcessor
-from core.db_manager_multiuser import DBManagerMultiUser
-from utils.file_handler import FileHandler
+from core.db_manager_multiuser import get_db_manager
+from utils.file_handler import FileHandler, STREAM_ROWS
 from io import BytesIO
 from datetime import datetime
 
@@ -21,7 +21,7 @@ def render():
     user_id = st.session_state.user_info['user_id']
 
     # 初始化範本資料庫（支援多用戶）
-    template_db = DBManagerMultiUser('workflow_templates', user_id=user_id)
+    template_db = get_db_manager('workflow_templates', user_id=user_id)
 
     # ========== 範本管理區 ==========
     st.divider()
@@ -97,14 +97,21 @@ def render():
 
     if uploaded_file:
         try:
-            df = FileHandler.load_file(uploaded_file)
+            # 大型檔案只讀入樣本設定步驟，下載時再分段清洗整個檔案
+            probe = FileHandler.probe(uploaded_file, sample_rows=1000)
+            streaming = probe['estimated_rows'] is not None and probe['estimated_rows'] > STREAM_ROWS
+            df = probe['sample'] if streaming else FileHandler.load_file(uploaded_file)
 
             if st.session_state.processor is None:
                 st.session_state.processor = DataProcessor(df)
 
             processor = st.session_state.processor
 
-            st.success(f'已載入 {len(df)} 筆資料，{len(df.columns)} 個欄位')
+            if streaming:
+                st.warning(f'大型檔案（{FileHandler.row_count_text(probe)}）：預覽與清洗步驟使用前 {len(df)} 筆樣本，'
+                           f'下載時分段清洗完整檔案')
+            else:
+                st.success(f'已載入 {len(df)} 筆資料，{len(df.columns)} 個欄位')
 
             col1, col2 = st.columns([2, 1])
 
@@ -164,7 +171,10 @@ def render():
 
             elif operation == '移除重複值':
                 subset_cols = st.multiselect('依據欄位', processor.df.columns)
-                keep = st.selectbox('保留', ['first', 'last'])
+                # 分段清洗時無法得知後面的段落是否還有重複列，只能保留第一筆
+                keep = st.selectbox('保留', ['first'] if streaming else ['first', 'last'])
+                if streaming:
+                    st.caption('大型檔案分段清洗，重複值只能保留第一筆')
                 if st.button('加入步驟', key='add_dup'):
                     st.session_state.cleaning_steps.append({
                         'action': 'remove_duplicates',
@@ -236,6 +246,7 @@ def render():
                     if st.button('執行全部步驟', type='primary', use_container_width=True):
                         for step in st.session_state.cleaning_steps:
                             processor.apply_cleaning_step(step)
+                        st.session_state.m2_stream_output = None
                         st.success('清洗完成！')
                         st.rerun()
                 with col2:
@@ -272,18 +283,37 @@ def render():
                     st.metric('清洗後空值總數', cleaned_nulls,
                              delta=cleaned_nulls - original_nulls)
 
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    processor.df.to_excel(writer, index=False, sheet_name='清洗結果')
-                output.seek(0)
-
-                st.download_button(
-                    label='下載清洗結果',
-                    data=output,
-                    file_name=f'cleaned_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
-                    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                    use_container_width=True
-                )
+                if streaming:
+                    # 逐段套用已執行的步驟並寫成 CSV，記憶體用量取決於每段的列數
+                    if st.button('分段清洗完整檔案', use_container_width=True):
+                        with st.spinner('正在清洗完整檔案...'):
+                            steps = [item['step'] for item in processor.history]
+                            output, row_count = FileHandler.chunks_to_csv(
+                                DataProcessor.clean_chunks(FileHandler.iter_chunks(uploaded_file), steps))
+                        st.session_state.m2_stream_output = output
+                        st.success(f'完整檔案清洗完成，共 {row_count} 筆')
+
+                    if st.session_state.get('m2_stream_output') is not None:
+                        st.download_button(
+                            label='下載清洗結果（CSV）',
+                            data=st.session_state.m2_stream_output,
+                            file_name=f'cleaned_{datetime.now().strftime("%Y%m%d_%H%M%S")}.csv',
+                            mime='text/csv',
+                            use_container_width=True
+                        )
+                else:
+                    output = BytesIO()
+                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                        processor.df.to_excel(writer, index=False, sheet_name='清洗結果')
+                    output.seek(0)
+
+                    st.download_button(
+                        label='下載清洗結果',
+                        data=output,
+                        file_name=f'cleaned_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                        use_container_width=True
+                    )
 
                 # ========== 儲存為範本 ==========
                 st.divider()
@@ -325,6 +355,7 @@ def render():
                 if st.button('重置為原始資料'):
                     processor.reset()
                     st.session_state.cleaning_steps = []
+                    st.session_state.m2_stream_output = None
                     st.rerun()
 
         except Exception as e:
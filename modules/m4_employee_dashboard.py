@@ -1,11 +1,21 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
 import pandas as pd
-from core.db_manager_multiuser import DBManagerMultiUser
-from utils.file_handler import FileHandler
+from core.db_manager_multiuser import get_db_manager
+from utils.file_handler import FileHandler, STREAM_ROWS
 from io import BytesIO
 from datetime import datetime
 
+# 資料庫管理分頁每頁筆數
+PAGE_SIZE = 100
+
+# 員工概況查詢時 ATTACH 的歷程資料庫
+M4_SOURCES = {
+    'performance': 'm4_performance',
+    'training': 'm4_training',
+    'separation': 'm4_separation',
+}
+
 
 def render():
     st.title('員工資料查詢')
@@ -14,15 +24,10 @@ def render():
     # 取得當前登入用戶的 user_id
     user_id = st.session_state.user_info['user_id']
 
-    # 再次確認資料庫結構（確保遷移已執行）
-    from core.db_migration import migrate_add_user_id_column
-    migrate_add_user_id_column()
-
     # 使用 M4 模組專屬資料庫（支援多用戶）
-    db_employees = DBManagerMultiUser('m4_employees', user_id=user_id)
-    db_performance = DBManagerMultiUser('m4_performance', user_id=user_id)
-    db_training = DBManagerMultiUser('m4_training', user_id=user_id)
-    db_separation = DBManagerMultiUser('m4_separation', user_id=user_id)
+    db_employees = get_db_manager('m4_employees', user_id=user_id)
+    db_performance = get_db_manager('m4_performance', user_id=user_id)
+    db_training = get_db_manager('m4_training', user_id=user_id)
 
     # 初始化查詢結果累積
     if 'accumulated_results' not in st.session_state:
@@ -46,130 +51,144 @@ def render():
             )
 
             if selected_names:
-                # 為每個選擇的員工查詢資料
+                # 先收集所有選擇的員工，再以批次查詢一次載入歷程資料
+                employees = {}
                 for name in selected_names:
-                    employees = db_employees.search_employee(name)
-
-                    if employees:
-                        for emp in employees:
-                            emp_id = emp['emp_id']
-
-                            with st.expander(f"👤 {emp['name']} ({emp_id})", expanded=True):
-                                col1, col2, col3, col4 = st.columns(4)
-                                with col1:
-                                    st.metric('工號', emp_id)
-                                with col2:
-                                    st.metric('姓名', emp['name'])
-                                with col3:
-                                    st.metric('部門', emp.get('department', 'N/A'))
-                                with col4:
-                                    status_color = '🟢' if emp.get('status') == 'active' else '🔴'
-                                    st.metric('狀態', f"{status_color} {emp.get('status', 'N/A')}")
-
-                                st.write(f"**到職日**: {emp.get('hire_date', 'N/A')}")
+                    for emp in db_employees.search_employee(name):
+                        employees.setdefault(emp['emp_id'], emp)
+
+                # 以單一連線 ATTACH 績效、訓練、離職資料庫，一次取回概況與歷程
+                profiles = db_employees.get_employee_profiles(list(employees), M4_SOURCES)
+                perf_by_emp = dict(tuple(profiles['performance'].groupby('emp_id', sort=False)))
+                training_by_emp = dict(tuple(profiles['training'].groupby('emp_id', sort=False)))
+                profile_by_emp = profiles['employees'].set_index('emp_id')
+
+                for emp_id, emp in employees.items():
+                    with st.expander(f"👤 {emp['name']} ({emp_id})", expanded=True):
+                        col1, col2, col3, col4 = st.columns(4)
+                        with col1:
+                            st.metric('工號', emp_id)
+                        with col2:
+                            st.metric('姓名', emp['name'])
+                        with col3:
+                            st.metric('部門', emp.get('department', 'N/A'))
+                        with col4:
+                            status_color = '🟢' if emp.get('status') == 'active' else '🔴'
+                            st.metric('狀態', f"{status_color} {emp.get('status', 'N/A')}")
+
+                        st.write(f"**到職日**: {emp.get('hire_date', 'N/A')}")
+
+                        # 績效歷程
+                        st.markdown('**績效歷程**')
+                        perf_df = perf_by_emp.get(emp_id)
+                        if perf_df is not None:
+                            st.dataframe(
+                                perf_df[['year', 'rating', 'score']],
+                                hide_index=True,
+                                width='stretch'
+                            )
+                            avg_score = profile_by_emp.at[emp_id, 'avg_score']
+                            st.metric('平均分數', '-' if pd.isna(avg_score) else f'{avg_score:.2f}')
+                        else:
+                            st.info('無績效紀錄')
+
+                        # 訓練紀錄
+                        st.markdown('**訓練紀錄**')
+                        training_df = training_by_emp.get(emp_id)
+                        if training_df is not None:
+                            st.dataframe(
+                                training_df[['course_name', 'course_type', 'hours', 'completion_date']],
+                                hide_index=True,
+                                width='stretch',
+                                column_config={'completion_date': st.column_config.DateColumn('completion_date')}
+                            )
+                            total_hours = profile_by_emp.at[emp_id, 'training_hours']
+                            st.metric('總完訓時數', '-' if pd.isna(total_hours) else f'{total_hours:.1f} 小時')
+                        else:
+                            st.info('無訓練紀錄')
+
+                        # 離職紀錄（依是否有離職資料列判斷，離職日期可能空白）
+                        sep_record = None
+                        if emp_id in profile_by_emp.index and profile_by_emp.at[emp_id, 'separation_count'] > 0:
+                            profile = profile_by_emp.loc[emp_id]
+                            sep_record = {
+                                'emp_id': emp_id,
+                                'separation_date': ('N/A' if pd.isna(profile['separation_date'])
+                                                    else profile['separation_date'].strftime('%Y-%m-%d')),
+                                'separation_type': profile['separation_type'],
+                                'reason': profile['reason'],
+                                'blacklist': profile['blacklist'],
+                            }
+                        if sep_record:
+                            st.markdown('**離職紀錄**')
+                            st.warning(f"**離職日期**: {sep_record.get('separation_date', 'N/A')}")
+                            st.write(f"**離職類型**: {sep_record.get('separation_type', 'N/A')}")
+                            st.write(f"**原因**: {sep_record.get('reason', 'N/A')}")
+                            if sep_record.get('blacklist'):
+                                st.error('⚠️ 此員工已列入黑名單')
+
+                        # 匯出選項
+                        st.divider()
+                        btn_col1, btn_col2 = st.columns(2)
+
+                        with btn_col1:
+                            # 單一員工匯出
+                            output_single = BytesIO()
+                            with pd.ExcelWriter(output_single, engine='openpyxl') as writer:
+                                # 基本資料
+                                basic_df = pd.DataFrame([{
+                                    '工號': emp_id,
+                                    '姓名': emp['name'],
+                                    '部門': emp.get('department', 'N/A'),
+                                    '狀態': emp.get('status', 'N/A'),
+                                    '到職日': emp.get('hire_date', 'N/A')
+                                }])
+                                basic_df.to_excel(writer, index=False, sheet_name='基本資料')
 
                                 # 績效歷程
-                                st.markdown('**績效歷程**')
-                                perf_records = db_performance.get_performance_history(emp_id)
-                                if perf_records:
-                                    perf_df = pd.DataFrame(perf_records)
-                                    st.dataframe(
-                                        perf_df[['year', 'rating', 'score']],
-                                        hide_index=True,
-                                        width='stretch'
-                                    )
-                                    avg_score = perf_df['score'].mean() if 'score' in perf_df.columns else 0
-                                    st.metric('平均分數', f'{avg_score:.2f}')
-                                else:
-                                    st.info('無績效紀錄')
+                                if perf_df is not None:
+                                    perf_df.to_excel(writer, index=False, sheet_name='績效歷程')
 
                                 # 訓練紀錄
-                                st.markdown('**訓練紀錄**')
-                                training_records = db_training.get_training_history(emp_id)
-                                if training_records:
-                                    training_df = pd.DataFrame(training_records)
-                                    st.dataframe(
-                                        training_df[['course_name', 'course_type', 'hours', 'completion_date']],
-                                        hide_index=True,
-                                        width='stretch'
-                                    )
-                                    total_hours = training_df['hours'].sum() if 'hours' in training_df.columns else 0
-                                    st.metric('總完訓時數', f'{total_hours:.1f} 小時')
-                                else:
-                                    st.info('無訓練紀錄')
+                                if training_df is not None:
+                                    training_df.to_excel(writer, index=False, sheet_name='訓練紀錄')
 
                                 # 離職紀錄
-                                sep_record = db_separation.get_separation_record(emp_id)
                                 if sep_record:
-                                    st.markdown('**離職紀錄**')
-                                    st.warning(f"**離職日期**: {sep_record.get('separation_date', 'N/A')}")
-                                    st.write(f"**離職類型**: {sep_record.get('separation_type', 'N/A')}")
-                                    st.write(f"**原因**: {sep_record.get('reason', 'N/A')}")
-                                    if sep_record.get('blacklist'):
-                                        st.error('⚠️ 此員工已列入黑名單')
-
-                                # 匯出選項
-                                st.divider()
-                                btn_col1, btn_col2 = st.columns(2)
-
-                                with btn_col1:
-                                    # 單一員工匯出
-                                    output_single = BytesIO()
-                                    with pd.ExcelWriter(output_single, engine='openpyxl') as writer:
-                                        # 基本資料
-                                        basic_df = pd.DataFrame([{
-                                            '工號': emp_id,
-                                            '姓名': emp['name'],
-                                            '部門': emp.get('department', 'N/A'),
-                                            '狀態': emp.get('status', 'N/A'),
-                                            '到職日': emp.get('hire_date', 'N/A')
-                                        }])
-                                        basic_df.to_excel(writer, index=False, sheet_name='基本資料')
-
-                                        # 績效歷程
-                                        if perf_records:
-                                            perf_df.to_excel(writer, index=False, sheet_name='績效歷程')
-
-                                        # 訓練紀錄
-                                        if training_records:
-                                            training_df.to_excel(writer, index=False, sheet_name='訓練紀錄')
-
-                                        # 離職紀錄
-                                        if sep_record:
-                                            sep_df = pd.DataFrame([sep_record])
-                                            sep_df.to_excel(writer, index=False, sheet_name='離職紀錄')
-
-                                    output_single.seek(0)
-
-                                    st.download_button(
-                                        label='📄 匯出此員工',
-                                        data=output_single,
-                                        file_name=f'{emp_id}_{emp["name"]}_{datetime.now().strftime("%Y%m%d")}.xlsx',
-                                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
-                                        key=f'export_single_{emp_id}'
-                                    )
-
-                                with btn_col2:
-                                    # 加入到累積結果
-                                    if st.button(f'加入到批次匯出', key=f'add_{emp_id}'):
-                                        # 建立完整的員工資料記錄（包含詳細資料）
-                                        full_record = {
-                                            'emp_id': emp_id,
-                                            'name': emp['name'],
-                                            'department': emp.get('department', 'N/A'),
-                                            'status': emp.get('status', 'N/A'),
-                                            'hire_date': emp.get('hire_date', 'N/A'),
-                                            'perf_records': perf_records if perf_records else [],
-                                            'training_records': training_records if training_records else [],
-                                            'sep_record': sep_record if sep_record else None
-                                        }
-
-                                        # 檢查是否已存在
-                                        if not any(r['emp_id'] == emp_id for r in st.session_state.accumulated_results):
-                                            st.session_state.accumulated_results.append(full_record)
-                                            st.success(f'已加入 {emp["name"]} 到批次匯出清單')
-                                        else:
-                                            st.warning(f'{emp["name"]} 已在批次匯出清單中')
+                                    sep_df = pd.DataFrame([sep_record])
+                                    sep_df.to_excel(writer, index=False, sheet_name='離職紀錄')
+
+                            output_single.seek(0)
+
+                            st.download_button(
+                                label='📄 匯出此員工',
+                                data=output_single,
+                                file_name=f'{emp_id}_{emp["name"]}_{datetime.now().strftime("%Y%m%d")}.xlsx',
+                                mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+                                key=f'export_single_{emp_id}'
+                            )
+
+                        with btn_col2:
+                            # 加入到累積結果
+                            if st.button(f'加入到批次匯出', key=f'add_{emp_id}'):
+                                # 建立完整的員工資料記錄（包含詳細資料）
+                                full_record = {
+                                    'emp_id': emp_id,
+                                    'name': emp['name'],
+                                    'department': emp.get('department', 'N/A'),
+                                    'status': emp.get('status', 'N/A'),
+                                    'hire_date': emp.get('hire_date', 'N/A'),
+                                    'perf_records': perf_df.to_dict('records') if perf_df is not None else [],
+                                    'training_records': training_df.to_dict('records') if training_df is not None else [],
+                                    'sep_record': sep_record if sep_record else None
+                                }
+
+                                # 檢查是否已存在
+                                if not any(r['emp_id'] == emp_id for r in st.session_state.accumulated_results):
+                                    st.session_state.accumulated_results.append(full_record)
+                                    st.success(f'已加入 {emp["name"]} 到批次匯出清單')
+                                else:
+                                    st.warning(f'{emp["name"]} 已在批次匯出清單中')
 
                 st.divider()
                 # 顯示累積結果和匯出功能
@@ -298,28 +317,49 @@ def render():
 
         if uploaded_file:
             try:
-                df = FileHandler.load_file(uploaded_file)
+                # 預覽只讀取標題列與樣本，完整讀取延後到按下匯入
+                probe = FileHandler.probe(uploaded_file)
 
                 st.write('檔案預覽:')
-                st.caption('💡 點擊右上角全螢幕按鈕可查看完整資料')
-                st.dataframe(df, width='stretch')
+                st.dataframe(probe['sample'], width='stretch')
+
+                st.info(f"{FileHandler.row_count_text(probe)}，{len(probe['columns'])} 個欄位")
+                st.write('欄位列表:', ', '.join(map(str, probe['columns'])))
 
-                st.info(f'共 {len(df)} 筆資料，{len(df.columns)} 個欄位')
-                st.write('欄位列表:', ', '.join(df.columns.tolist()))
+                incremental = st.checkbox(
+                    '增量匯入（只寫入有變動的資料）',
+                    key='m4_incremental_import',
+                    help='上傳檔視為完整資料：新增與變更的資料會寫入，檔案中沒有的資料會從資料庫刪除'
+                )
 
                 if st.button('執行匯入', type='primary', width='stretch'):
                     with st.spinner('正在匯入資料...'):
+                        # 大型檔案分段匯入（增量匯入需要完整資料比對差異）
+                        if (probe['estimated_rows'] or 0) > STREAM_ROWS and not incremental:
+                            df = FileHandler.iter_chunks(uploaded_file)
+                        else:
+                            df = FileHandler.load_file(uploaded_file)
+
                         if import_type == '員工主檔':
-                            result = db_employees.import_employee_data(df)
+                            result = db_employees.import_employee_data(df, incremental=incremental)
                         elif import_type == '績效資料':
-                            result = db_performance.import_performance_data(df)
+                            result = db_performance.import_performance_data(df, incremental=incremental)
                         elif import_type == '訓練紀錄':
-                            result = db_training.import_training_data(df)
+                            result = db_training.import_training_data(df, incremental=incremental)
                         else:
                             result = {'success': False, 'error': 'Unknown import type'}
 
-                        if result.get('success'):
+                        if result.get('success') and incremental:
+                            st.success(
+                                f"增量匯入完成！新增 {result['added']} 筆、變更 {result['changed']} 筆、"
+                                f"未變動 {result['unchanged']} 筆、刪除 {result['removed']} 筆"
+                            )
+                            if result.get('skipped'):
+                                st.warning(f"有 {result['skipped']} 筆資料缺少必填欄位，未匯入")
+                        elif result.get('success'):
                             st.success(f"匯入成功！共 {result.get('count', 0)} 筆")
+                            if result.get('skipped'):
+                                st.warning(f"有 {result['skipped']} 筆資料缺少必填欄位，未匯入")
                             st.balloons()
                         else:
                             st.error(f"匯入失敗: {result.get('error', 'Unknown error')}")
@@ -364,24 +404,47 @@ def render():
         # 根據選擇的資料庫顯示內容
         if manage_type == '員工主檔':
             db = db_employees
-            all_data = db.get_all_employees()
             table_name = 'employees'
         elif manage_type == '績效資料':
             db = db_performance
-            all_data = db.get_all_records()
             table_name = 'performance'
         else:  # 訓練紀錄
             db = db_training
-            all_data = db.get_all_records()
             table_name = 'training'
 
+        # 只讀取目前顯示的這一頁（keyset 分頁，游標堆疊存在 session_state）
+        page_key = f'm4_page_cursors_{table_name}'
+        if page_key not in st.session_state:
+            st.session_state[page_key] = [None]
+        cursors = st.session_state[page_key]
+
+        total_count = db.count_records(table_name)
+        page = db.get_page(table_name, page_size=PAGE_SIZE, after=cursors[-1])
+        if not page['records'] and len(cursors) > 1:
+            # 資料被刪除後目前頁已無資料，回到第一頁
+            st.session_state[page_key] = cursors = [None]
+            page = db.get_page(table_name, page_size=PAGE_SIZE)
+        all_data = page['records']
+
         if all_data:
-            st.info(f'資料庫中共有 {len(all_data)} 筆資料')
+            st.info(f'資料庫中共有 {total_count} 筆資料')
 
             # 顯示資料
             df_display = pd.DataFrame(all_data)
             st.dataframe(df_display, width='stretch')
 
+            nav1, nav2, nav3 = st.columns([1, 2, 1])
+            with nav1:
+                if len(cursors) > 1 and st.button('⬅️ 上一頁', key=f'prev_{table_name}'):
+                    cursors.pop()
+                    st.rerun()
+            with nav2:
+                st.caption(f'第 {len(cursors)} 頁，共 {max(1, -(-total_count // PAGE_SIZE))} 頁（每頁 {PAGE_SIZE} 筆）')
+            with nav3:
+                if page['next_cursor'] is not None and st.button('下一頁 ➡️', key=f'next_{table_name}'):
+                    cursors.append(page['next_cursor'])
+                    st.rerun()
+
             st.divider()
 
             # 刪除選項
@@ -402,18 +465,19 @@ def render():
                             st.error(f'清空失敗: {str(e)}')
 
             with col2:
-                # 匯出當前資料庫內容
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df_display.to_excel(writer, index=False, sheet_name=table_name)
-                output.seek(0)
-
-                st.download_button(
-                    label='📥 匯出資料庫內容',
-                    data=output,
-                    file_name=f'{table_name}_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
-                    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                )
+                # 匯出當前資料庫內容（按下後才逐批讀取整個資料表）
+                if st.button('📦 準備匯出檔案', key=f'prepare_export_{table_name}'):
+                    output = BytesIO()
+                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                        pd.DataFrame(db.iter_records(table_name)).to_excel(writer, index=False, sheet_name=table_name)
+                    output.seek(0)
+
+                    st.download_button(
+                        label='📥 匯出資料庫內容',
+                        data=output,
+                        file_name=f'{table_name}_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                    )
 
             # 依條件刪除
             st.divider()
@@ -421,7 +485,7 @@ def render():
 
             if manage_type == '員工主檔':
                 emp_to_delete = st.multiselect(
-                    '選擇要刪除的員工',
+                    '選擇要刪除的員工（本頁）',
                     options=[f"{emp['emp_id']} - {emp['name']}" for emp in all_data]
                 )
 
@@ -12,22 +12,34 @@ import streamlit as st
 import pandas as pd
 from datetime import datetime
 from typing import Dict, List, Any, Optional
-from core.db_manager_multiuser import DBManagerMultiUser
+from core.db_manager_multiuser import get_db_manager
+from core.db_snapshot import get_db_snapshot
+from utils.file_handler import FileHandler, STREAM_ROWS
+
+# 資料庫管理分頁每頁筆數
+PAGE_SIZE = 100
 
 
 class QualificationChecker:
     """資格檢核核心邏輯"""
 
-    def __init__(self, user_id=None):
+    def __init__(self, user_id=None, snapshot=False):
+        """
+        Args:
+            user_id: 使用者 ID
+            snapshot: 檢核查詢改由該使用者資料的記憶體快照回答（資料庫有寫入時自動重新建立）；
+                      self.db 仍指向資料庫檔案，供匯入與管理使用
+        """
         # 使用 M5 專用的單一資料庫 - 包含 4 個表 (employees, performance, training, separation)
         # 支援多用戶資料隔離
         self.user_id = user_id
-        self.db = DBManagerMultiUser('m5_qualification', user_id=user_id)
+        self.db = get_db_manager('m5_qualification', user_id=user_id)
+        reader = get_db_snapshot('m5_qualification', user_id=user_id) if snapshot else self.db
         # 為了向後兼容和程式碼可讀性，保留這些別名
-        self.db_employees = self.db
-        self.db_performance = self.db
-        self.db_training = self.db
-        self.db_separation = self.db
+        self.db_employees = reader
+        self.db_performance = reader
+        self.db_training = reader
+        self.db_separation = reader
 
     @staticmethod
     def find_column(df: pd.DataFrame, possible_names: List[str]) -> Optional[str]:
@@ -80,35 +92,79 @@ class QualificationChecker:
         Returns:
             檢核結果字典
         """
-        result = {
-            'name': name,
-            'id_number': id_number if id_number else 'N/A',
-            'checks': [],
-            'overall_status': 'PENDING',
-            'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-        }
-
         # Step 1: 查詢員工基本資料
         employee = self._find_employee_by_name(name) if not id_number else self._find_employee(id_number)
 
         if not employee:
-            result['overall_status'] = 'NOT_FOUND'
-            result['checks'].append({
-                'item': '員工資料查詢',
-                'status': 'FAIL',
-                'detail': '查無此員工記錄，可能未曾在本公司任職'
-            })
-            return result
+            return {
+                'name': name,
+                'id_number': id_number if id_number else 'N/A',
+                'checks': [{
+                    'item': '員工資料查詢',
+                    'status': 'FAIL',
+                    'detail': '查無此員工記錄，可能未曾在本公司任職'
+                }],
+                'overall_status': 'NOT_FOUND',
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+
+        # Step 2-6 與批次檢核共用同一條路徑（摘要只查詢一次）
+        result = self.check_many([employee])[employee['emp_id']]
+        result['name'] = name
+        result['id_number'] = id_number if id_number else 'N/A'
+        return result
+
+    def check_many(self, employees: List[Dict]) -> Dict[str, Dict[str, Any]]:
+        """
+        批次執行資格檢核（離職、績效、訓練摘要各只查詢一次）
 
-        result['emp_id'] = employee['emp_id']
-        result['checks'].append({
-            'item': '員工資料查詢',
-            'status': 'PASS',
-            'detail': f"工號: {employee['emp_id']}, 部門: {employee.get('department', 'N/A')}"
-        })
+        Args:
+            employees: 員工資料列表（至少包含 emp_id、name）
+
+        Returns:
+            {emp_id: 檢核結果字典}
+        """
+        emp_ids = [emp['emp_id'] for emp in employees]
+        # 同一個資料庫的摘要表已包含離職、績效、訓練欄位，相同的讀取來源只查詢一次
+        summaries = {}
+        for reader in (self.db_separation, self.db_performance, self.db_training):
+            if id(reader) not in summaries:
+                summaries[id(reader)] = reader.get_summary_many(emp_ids)
+        sep_by_emp = summaries[id(self.db_separation)]
+        perf_by_emp = summaries[id(self.db_performance)]
+        training_by_emp = summaries[id(self.db_training)]
+
+        results = {}
+        for employee in employees:
+            emp_id = employee['emp_id']
+            result = {
+                'name': employee['name'],
+                'id_number': 'N/A',
+                'emp_id': emp_id,
+                'checks': [{
+                    'item': '員工資料查詢',
+                    'status': 'PASS',
+                    'detail': f"工號: {emp_id}, 部門: {employee.get('department', 'N/A')}"
+                }],
+                'overall_status': 'PENDING',
+                'timestamp': datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+            }
+            results[emp_id] = self._evaluate(
+                result,
+                sep_by_emp[emp_id],
+                perf_by_emp[emp_id],
+                training_by_emp[emp_id]
+            )
+
+        return results
+
+    def _evaluate(self, result: Dict[str, Any], sep_summary: Optional[Dict],
+                  perf_summary: Optional[Dict], training_summary: Optional[Dict]) -> Dict[str, Any]:
+        """依已載入的離職、績效、訓練摘要（每位員工一列）完成檢核步驟 2-6"""
+        sep_record = self._latest_separation(sep_summary)
 
         # Step 2: 黑名單比對
-        blacklist_check = self._check_blacklist(employee['emp_id'])
+        blacklist_check = self._check_blacklist(sep_record)
         result['checks'].append(blacklist_check)
 
         if blacklist_check['status'] == 'FAIL':
@@ -117,15 +173,15 @@ class QualificationChecker:
             return result
 
         # Step 3: 離職紀錄查詢
-        separation_check = self._check_separation(employee['emp_id'])
+        separation_check = self._check_separation(sep_record)
         result['checks'].append(separation_check)
 
         # Step 4: 歷史績效查詢
-        performance_check = self._check_performance(employee['emp_id'])
+        performance_check = self._check_performance(perf_summary)
         result['checks'].append(performance_check)
 
         # Step 5: 訓練紀錄查詢（額外參考）
-        training_check = self._check_training(employee['emp_id'])
+        training_check = self._check_training(training_summary)
         result['checks'].append(training_check)
 
         # Step 6: 綜合判斷
@@ -182,10 +238,21 @@ class QualificationChecker:
             return dict(row)
         return None
 
-    def _check_blacklist(self, emp_id: str) -> Dict[str, Any]:
-        """黑名單檢查"""
-        sep_record = self.db_separation.get_separation_record(emp_id)
+    @staticmethod
+    def _latest_separation(summary: Optional[Dict]) -> Optional[Dict]:
+        """由離職摘要取出最近一筆離職記錄（無離職記錄時為 None）"""
+        if not summary or not summary['separation_count']:
+            return None
+        return {
+            'emp_id': summary['emp_id'],
+            'separation_date': summary['separation_date'],
+            'separation_type': summary['separation_type'],
+            'reason': summary['separation_reason'],
+            'blacklist': summary['blacklist'],
+        }
 
+    def _check_blacklist(self, sep_record: Optional[Dict]) -> Dict[str, Any]:
+        """黑名單檢查"""
         if sep_record and sep_record.get('blacklist'):
             return {
                 'item': '黑名單比對',
@@ -200,10 +267,8 @@ class QualificationChecker:
                 'detail': '未在黑名單'
             }
 
-    def _check_separation(self, emp_id: str) -> Dict[str, Any]:
+    def _check_separation(self, sep_record: Optional[Dict]) -> Dict[str, Any]:
         """離職紀錄檢查"""
-        sep_record = self.db_separation.get_separation_record(emp_id)
-
         if not sep_record:
             return {
                 'item': '離職紀錄',
@@ -231,11 +296,9 @@ class QualificationChecker:
                 'data': sep_record
             }
 
-    def _check_performance(self, emp_id: str) -> Dict[str, Any]:
+    def _check_performance(self, summary: Optional[Dict]) -> Dict[str, Any]:
         """歷史績效檢查"""
-        perf_records = self.db_performance.get_performance_history(emp_id)
-
-        if not perf_records:
+        if not summary or not summary['performance_count']:
             return {
                 'item': '歷史績效紀錄',
                 'status': 'INFO',
@@ -243,45 +306,38 @@ class QualificationChecker:
             }
 
         # 分析績效
-        df = pd.DataFrame(perf_records)
-        low_perf = df[df['rating'].isin(['C', 'D', 'E'])]
+        low_count = summary['low_rating_count']
+        avg_score = summary['avg_score'] if summary['avg_score'] is not None else 0
 
-        if len(low_perf) > 0:
-            avg_score = df['score'].mean() if 'score' in df.columns else 0
+        if low_count > 0:
             return {
                 'item': '歷史績效紀錄',
                 'status': 'WARNING',
-                'detail': f"曾有 {len(low_perf)} 次低績效紀錄（C/D/E），平均分數: {avg_score:.1f}",
-                'data': perf_records
+                'detail': f"曾有 {low_count} 次低績效紀錄（C/D/E），平均分數: {avg_score:.1f}",
+                'data': summary
             }
         else:
-            avg_score = df['score'].mean() if 'score' in df.columns else 0
             return {
                 'item': '歷史績效紀錄',
                 'status': 'PASS',
-                'detail': f"績效良好，平均分數: {avg_score:.1f}，共 {len(perf_records)} 筆記錄",
-                'data': perf_records
+                'detail': f"績效良好，平均分數: {avg_score:.1f}，共 {summary['performance_count']} 筆記錄",
+                'data': summary
             }
 
-    def _check_training(self, emp_id: str) -> Dict[str, Any]:
+    def _check_training(self, summary: Optional[Dict]) -> Dict[str, Any]:
         """訓練紀錄檢查"""
-        training_records = self.db_training.get_training_history(emp_id)
-
-        if not training_records:
+        if not summary or not summary['training_count']:
             return {
                 'item': '訓練紀錄',
                 'status': 'INFO',
                 'detail': '無訓練紀錄'
             }
 
-        df = pd.DataFrame(training_records)
-        total_hours = df['hours'].sum() if 'hours' in df.columns else 0
-
         return {
             'item': '訓練紀錄',
             'status': 'INFO',
-            'detail': f"總完訓時數: {total_hours} 小時，共 {len(training_records)} 個課程",
-            'data': training_records
+            'detail': f"總完訓時數: {summary['training_hours']} 小時，共 {summary['training_count']} 個課程",
+            'data': summary
         }
 
 
@@ -295,7 +351,7 @@ def render():
 
     # 初始化 checker（支援多用戶）
     if 'checker' not in st.session_state:
-        st.session_state.checker = QualificationChecker(user_id=user_id)
+        st.session_state.checker = QualificationChecker(user_id=user_id, snapshot=True)
 
     # 初始化檢核結果儲存（確保一定會初始化，避免 AttributeError）
     if 'check_results' not in st.session_state:
@@ -376,22 +432,14 @@ def render():
                     col1, col2, col3 = st.columns(3)
                     with col1:
                         if st.button("🔍 批次執行檢核", type="primary"):
-                            progress_bar = st.progress(0)
-                            status_text = st.empty()
-
-                            for idx, option in enumerate(selected_options):
-                                emp_id = option.split(" - ")[0]
-                                emp_name = option.split(" - ")[1].split(" (")[0]
+                            employees_by_id = {emp['emp_id']: emp for emp in all_employees}
+                            selected_employees = [employees_by_id[option.split(" - ")[0]] for option in selected_options]
 
-                                status_text.text(f"檢核中... {emp_name} ({idx + 1}/{len(selected_options)})")
+                            # 批次檢核：離職、績效、訓練紀錄各以一次查詢載入
+                            with st.spinner(f"檢核中... 共 {len(selected_employees)} 位員工"):
+                                results = st.session_state.checker.check_many(selected_employees)
+                            st.session_state.check_results.update(results)
 
-                                # 執行檢核（不需要身分證字號）
-                                result = st.session_state.checker.check(emp_name, None)
-                                st.session_state.check_results[emp_id] = result
-
-                                progress_bar.progress((idx + 1) / len(selected_options))
-
-                            status_text.text("✅ 批次檢核完成！")
                             st.success(f"已完成 {len(selected_options)} 位員工的資格檢核")
                             st.rerun()
 
@@ -630,10 +678,11 @@ def render():
 
             if emp_file:
                 try:
-                    emp_df = pd.read_excel(emp_file) if emp_file.name.endswith('xlsx') else pd.read_csv(emp_file)
+                    # 欄位驗證只需要標題列，完整讀取延後到按下匯入
+                    emp_probe = FileHandler.probe(emp_file)
+                    emp_df = emp_probe['sample']
 
-                    st.write(f"**檔案預覽** ({len(emp_df)} 筆資料):")
-                    st.caption('💡 點擊右上角全螢幕按鈕可查看完整資料')
+                    st.write(f"**檔案預覽** ({FileHandler.row_count_text(emp_probe)}，顯示前 {len(emp_df)} 筆):")
                     st.dataframe(emp_df)
 
                     # 驗證必填欄位
@@ -670,40 +719,38 @@ def render():
                             for field, col_name in col_map.items():
                                 st.text(f"  {field} → {col_name}")
 
+                        incremental = st.checkbox(
+                            "增量匯入（只寫入有變動的資料）",
+                            key='m5_incremental_import_emp',
+                            help='上傳檔視為完整名單：新增與變更的資料會寫入，檔案中沒有的員工會從資料庫刪除'
+                        )
+
                         if st.button("匯入員工資料", key='import_emp', type='primary'):
-                            success_count = 0
-                            error_count = 0
-                            errors = []
-
-                            for idx, row in emp_df.iterrows():
-                                try:
-                                    result = st.session_state.checker.db_employees.add_employee(
-                                        emp_id=row[col_map['工號']] if '工號' in col_map else None,
-                                        name=row[col_map['姓名']] if '姓名' in col_map else None,
-                                        id_number=row[col_map['身分證']] if '身分證' in col_map else None,
-                                        department=row[col_map['部門']] if '部門' in col_map else None,
-                                        hire_date=row[col_map['到職日']] if '到職日' in col_map else None,
-                                        status=row[col_map['狀態']] if '狀態' in col_map else '離職'
-                                    )
-                                    if result:
-                                        success_count += 1
-                                    else:
-                                        error_count += 1
-                                except Exception as e:
-                                    error_count += 1
-                                    errors.append(f"第 {idx+2} 列: {str(e)}")
-
-                            if success_count > 0:
-                                st.success(f"✅ 成功匯入 {success_count}/{len(emp_df)} 筆員工資料")
-                            if error_count > 0:
-                                st.warning(f"⚠️ {error_count} 筆資料匯入失敗")
-                                if errors:
-                                    with st.expander("查看錯誤詳情"):
-                                        for err in errors[:10]:  # 只顯示前10個錯誤
-                                            st.text(err)
-
-                            if success_count > 0:
+                            emp_df = FileHandler.load_file(emp_file)
+                            canonical = {'工號': 'emp_id', '姓名': 'name', '身分證': 'id_number',
+                                         '部門': 'department', '到職日': 'hire_date', '狀態': 'status'}
+                            result = st.session_state.checker.db.import_employee_data(
+                                emp_df,
+                                column_map={canonical[field]: col for field, col in col_map.items()},
+                                defaults={'status': '離職'},
+                                incremental=incremental
+                            )
+
+                            if result.get('success') and incremental:
+                                st.success(
+                                    f"✅ 增量匯入完成：新增 {result['added']} 筆、變更 {result['changed']} 筆、"
+                                    f"未變動 {result['unchanged']} 筆、刪除 {result['removed']} 筆"
+                                )
+                                if result['skipped'] > 0:
+                                    st.warning(f"⚠️ {result['skipped']} 筆資料缺少工號或姓名，未匯入")
                                 st.rerun()
+                            elif result.get('success'):
+                                st.success(f"✅ 成功匯入 {result['count']}/{len(emp_df)} 筆員工資料")
+                                if result['skipped'] > 0:
+                                    st.warning(f"⚠️ {result['skipped']} 筆資料缺少工號或姓名，未匯入")
+                                st.rerun()
+                            else:
+                                st.error(f"匯入失敗: {result.get('error')}")
                 except Exception as e:
                     st.error(f"讀取檔案失敗: {str(e)}")
 
@@ -729,7 +776,9 @@ def render():
 
             if sep_file:
                 try:
-                    sep_df = pd.read_excel(sep_file) if sep_file.name.endswith('xlsx') else pd.read_csv(sep_file)
+                    # 欄位驗證只需要標題列，完整讀取延後到按下匯入
+                    sep_probe = FileHandler.probe(sep_file)
+                    sep_df = sep_probe['sample']
 
                     # 必填欄位驗證
                     required_cols = {
@@ -758,50 +807,24 @@ def render():
                             for display_name, file_col in col_mapping.items():
                                 st.write(f"- {display_name} ← `{file_col}`")
 
-                        st.write("**檔案預覽**:")
-                        st.caption('💡 點擊右上角全螢幕按鈕可查看完整資料')
+                        st.write(f"**檔案預覽** ({FileHandler.row_count_text(sep_probe)}，顯示前 {len(sep_df)} 筆):")
                         st.dataframe(sep_df)
 
                         if st.button("匯入離職記錄", key='import_sep'):
-                            success_count = 0
-                            error_count = 0
-                            errors = []
-
-                            for idx, row in sep_df.iterrows():
-                                try:
-                                    emp_id_col = st.session_state.checker.find_column(sep_df, required_cols['工號'])
-                                    date_col = st.session_state.checker.find_column(sep_df, required_cols['離職日期'])
-                                    type_col = st.session_state.checker.find_column(sep_df, required_cols['離職類型'])
-                                    reason_col = st.session_state.checker.find_column(sep_df, required_cols['離職原因'])
-                                    blacklist_col = st.session_state.checker.find_column(sep_df, ['blacklist', '黑名單'])
-
-                                    result = st.session_state.checker.db_separation.add_separation_record(
-                                        emp_id=row[emp_id_col],
-                                        separation_date=row[date_col],
-                                        separation_type=row[type_col],
-                                        reason=row[reason_col],
-                                        blacklist=bool(row.get(blacklist_col, False)) if blacklist_col else False
-                                    )
-                                    if result:
-                                        success_count += 1
-                                    else:
-                                        error_count += 1
-                                except Exception as e:
-                                    error_count += 1
-                                    errors.append(f"第 {idx + 2} 列: {str(e)}")
+                            sep_df = FileHandler.load_file(sep_file)
+                            canonical = {'工號': 'emp_id', '離職日期': 'separation_date',
+                                         '離職類型': 'separation_type', '離職原因': 'reason'}
+                            column_map = {canonical[field]: col for field, col in col_mapping.items()}
+                            column_map['blacklist'] = st.session_state.checker.find_column(sep_df, ['blacklist', '黑名單'])
+                            result = st.session_state.checker.db.import_separation_data(sep_df, column_map=column_map)
 
                             # 顯示匯入結果
-                            if success_count > 0:
-                                st.success(f"✅ 成功匯入 {success_count} 筆離職記錄")
-                            if error_count > 0:
-                                st.warning(f"⚠️ {error_count} 筆記錄匯入失敗")
-                                if errors:
-                                    with st.expander("查看錯誤詳情"):
-                                        for err in errors[:10]:  # 最多顯示 10 個錯誤
-                                            st.text(err)
-
-                            st.info(f"📊 匯入統計：總計 {len(sep_df)} 筆，成功 {success_count} 筆，失敗 {error_count} 筆")
-                            st.rerun()
+                            if result.get('success'):
+                                st.success(f"✅ 成功匯入 {result['count']} 筆離職記錄")
+                                st.info(f"📊 匯入統計：總計 {len(sep_df)} 筆，成功 {result['count']} 筆，略過 {result['skipped']} 筆")
+                                st.rerun()
+                            else:
+                                st.error(f"匯入失敗: {result.get('error')}")
 
                 except Exception as e:
                     st.error(f"讀取檔案失敗: {str(e)}")
@@ -825,7 +848,9 @@ def render():
 
             if perf_file:
                 try:
-                    perf_df = pd.read_excel(perf_file) if perf_file.name.endswith('xlsx') else pd.read_csv(perf_file)
+                    # 欄位驗證只需要標題列，完整讀取延後到按下匯入
+                    perf_probe = FileHandler.probe(perf_file)
+                    perf_df = perf_probe['sample']
 
                     # 必填欄位驗證
                     required_cols = {
@@ -854,48 +879,24 @@ def render():
                             for display_name, file_col in col_mapping.items():
                                 st.write(f"- {display_name} ← `{file_col}`")
 
-                        st.write("**檔案預覽**:")
-                        st.caption('💡 點擊右上角全螢幕按鈕可查看完整資料')
+                        st.write(f"**檔案預覽** ({FileHandler.row_count_text(perf_probe)}，顯示前 {len(perf_df)} 筆):")
                         st.dataframe(perf_df)
 
                         if st.button("匯入績效資料", key='import_perf'):
-                            success_count = 0
-                            error_count = 0
-                            errors = []
-
-                            for idx, row in perf_df.iterrows():
-                                try:
-                                    emp_id_col = st.session_state.checker.find_column(perf_df, required_cols['工號'])
-                                    year_col = st.session_state.checker.find_column(perf_df, required_cols['年度'])
-                                    rating_col = st.session_state.checker.find_column(perf_df, required_cols['考績等級'])
-                                    score_col = st.session_state.checker.find_column(perf_df, required_cols['分數'])
-
-                                    result = st.session_state.checker.db_performance.add_performance_record(
-                                        emp_id=row[emp_id_col],
-                                        year=int(row[year_col]),
-                                        rating=row[rating_col],
-                                        score=float(row[score_col])
-                                    )
-                                    if result:
-                                        success_count += 1
-                                    else:
-                                        error_count += 1
-                                except Exception as e:
-                                    error_count += 1
-                                    errors.append(f"第 {idx + 2} 列: {str(e)}")
+                            perf_df = FileHandler.load_file(perf_file)
+                            canonical = {'工號': 'emp_id', '年度': 'year', '考績等級': 'rating', '分數': 'score'}
+                            result = st.session_state.checker.db.import_performance_data(
+                                perf_df,
+                                column_map={canonical[field]: col for field, col in col_mapping.items()}
+                            )
 
                             # 顯示匯入結果
-                            if success_count > 0:
-                                st.success(f"✅ 成功匯入 {success_count} 筆績效資料")
-                            if error_count > 0:
-                                st.warning(f"⚠️ {error_count} 筆記錄匯入失敗")
-                                if errors:
-                                    with st.expander("查看錯誤詳情"):
-                                        for err in errors[:10]:  # 最多顯示 10 個錯誤
-                                            st.text(err)
-
-                            st.info(f"📊 匯入統計：總計 {len(perf_df)} 筆，成功 {success_count} 筆，失敗 {error_count} 筆")
-                            st.rerun()
+                            if result.get('success'):
+                                st.success(f"✅ 成功匯入 {result['count']} 筆績效資料")
+                                st.info(f"📊 匯入統計：總計 {len(perf_df)} 筆，成功 {result['count']} 筆，略過 {result['skipped']} 筆")
+                                st.rerun()
+                            else:
+                                st.error(f"匯入失敗: {result.get('error')}")
 
                 except Exception as e:
                     st.error(f"讀取檔案失敗: {str(e)}")
@@ -920,7 +921,9 @@ def render():
 
             if train_file:
                 try:
-                    train_df = pd.read_excel(train_file) if train_file.name.endswith('xlsx') else pd.read_csv(train_file)
+                    # 欄位驗證只需要標題列，完整讀取延後到按下匯入
+                    train_probe = FileHandler.probe(train_file)
+                    train_df = train_probe['sample']
 
                     # 必填欄位驗證
                     required_cols = {
@@ -950,50 +953,29 @@ def render():
                             for display_name, file_col in col_mapping.items():
                                 st.write(f"- {display_name} ← `{file_col}`")
 
-                        st.write("**檔案預覽**:")
-                        st.caption('💡 點擊右上角全螢幕按鈕可查看完整資料')
+                        st.write(f"**檔案預覽** ({FileHandler.row_count_text(train_probe)}，顯示前 {len(train_df)} 筆):")
                         st.dataframe(train_df)
 
                         if st.button("匯入訓練記錄", key='import_train'):
-                            success_count = 0
-                            error_count = 0
-                            errors = []
-
-                            for idx, row in train_df.iterrows():
-                                try:
-                                    emp_id_col = st.session_state.checker.find_column(train_df, required_cols['工號'])
-                                    course_name_col = st.session_state.checker.find_column(train_df, required_cols['課程名稱'])
-                                    course_type_col = st.session_state.checker.find_column(train_df, required_cols['課程類型'])
-                                    hours_col = st.session_state.checker.find_column(train_df, required_cols['時數'])
-                                    completion_date_col = st.session_state.checker.find_column(train_df, required_cols['完訓日期'])
-
-                                    result = st.session_state.checker.db_training.add_training_record(
-                                        emp_id=row[emp_id_col],
-                                        course_name=row[course_name_col],
-                                        course_type=row[course_type_col],
-                                        hours=float(row[hours_col]),
-                                        completion_date=row[completion_date_col]
-                                    )
-                                    if result:
-                                        success_count += 1
-                                    else:
-                                        error_count += 1
-                                except Exception as e:
-                                    error_count += 1
-                                    errors.append(f"第 {idx + 2} 列: {str(e)}")
+                            # 多年度的訓練歷程可能超過記憶體，大型檔案分段匯入
+                            if (train_probe['estimated_rows'] or 0) > STREAM_ROWS:
+                                train_df = FileHandler.iter_chunks(train_file)
+                            else:
+                                train_df = FileHandler.load_file(train_file)
+                            canonical = {'工號': 'emp_id', '課程名稱': 'course_name', '課程類型': 'course_type',
+                                         '時數': 'hours', '完訓日期': 'completion_date'}
+                            result = st.session_state.checker.db.import_training_data(
+                                train_df,
+                                column_map={canonical[field]: col for field, col in col_mapping.items()}
+                            )
 
                             # 顯示匯入結果
-                            if success_count > 0:
-                                st.success(f"✅ 成功匯入 {success_count} 筆訓練記錄")
-                            if error_count > 0:
-                                st.warning(f"⚠️ {error_count} 筆記錄匯入失敗")
-                                if errors:
-                                    with st.expander("查看錯誤詳情"):
-                                        for err in errors[:10]:  # 最多顯示 10 個錯誤
-                                            st.text(err)
-
-                            st.info(f"📊 匯入統計：總計 {len(train_df)} 筆，成功 {success_count} 筆，失敗 {error_count} 筆")
-                            st.rerun()
+                            if result.get('success'):
+                                st.success(f"✅ 成功匯入 {result['count']} 筆訓練記錄")
+                                st.info(f"📊 匯入統計：總計 {result['count'] + result['skipped']} 筆，成功 {result['count']} 筆，略過 {result['skipped']} 筆")
+                                st.rerun()
+                            else:
+                                st.error(f"匯入失敗: {result.get('error')}")
 
                 except Exception as e:
                     st.error(f"讀取檔案失敗: {str(e)}")
@@ -1018,24 +1000,46 @@ def render():
 
         if "員工資料" in db_type:
             table_name = "employees"
-            all_data = db.get_all_employees()
         elif "績效資料" in db_type:
             table_name = "performance"
-            all_data = db.get_all_records(table_name='performance')
         elif "訓練資料" in db_type:
             table_name = "training"
-            all_data = db.get_all_records(table_name='training')
         else:  # 離職資料
             table_name = "separation"
-            all_data = db.get_all_records(table_name='separation')
+
+        # 只讀取目前顯示的這一頁（keyset 分頁，游標堆疊存在 session_state）
+        page_key = f"m5_page_cursors_{table_name}"
+        if page_key not in st.session_state:
+            st.session_state[page_key] = [None]
+        cursors = st.session_state[page_key]
+
+        total_count = db.count_records(table_name)
+        page = db.get_page(table_name, page_size=PAGE_SIZE, after=cursors[-1])
+        if not page['records'] and len(cursors) > 1:
+            # 資料被刪除後目前頁已無資料，回到第一頁
+            st.session_state[page_key] = cursors = [None]
+            page = db.get_page(table_name, page_size=PAGE_SIZE)
+        all_data = page['records']
 
         if all_data:
-            st.info(f"📊 {db_type} 中共有 {len(all_data)} 筆資料")
+            st.info(f"📊 {db_type} 中共有 {total_count} 筆資料")
 
             # 顯示資料
             df_display = pd.DataFrame(all_data)
             st.dataframe(df_display, use_container_width=True)
 
+            nav1, nav2, nav3 = st.columns([1, 2, 1])
+            with nav1:
+                if len(cursors) > 1 and st.button("⬅️ 上一頁", key=f"m5_prev_{table_name}"):
+                    cursors.pop()
+                    st.rerun()
+            with nav2:
+                st.caption(f"第 {len(cursors)} 頁，共 {max(1, -(-total_count // PAGE_SIZE))} 頁（每頁 {PAGE_SIZE} 筆）")
+            with nav3:
+                if page['next_cursor'] is not None and st.button("下一頁 ➡️", key=f"m5_next_{table_name}"):
+                    cursors.append(page['next_cursor'])
+                    st.rerun()
+
             st.divider()
 
             # 管理選項
@@ -1055,18 +1059,20 @@ def render():
 
             with col2:
                 st.subheader("匯出資料")
-                # 匯出資料庫內容
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df_display.to_excel(writer, index=False, sheet_name=table_name)
-                output.seek(0)
-
-                st.download_button(
-                    label="📥 下載備份檔案",
-                    data=output,
-                    file_name=f"m5_{table_name}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
-                    mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
-                )
+                # 匯出資料庫內容（按下後才逐批讀取整個資料表）
+                if st.button("📦 準備備份檔案", key=f"m5_prepare_export_{table_name}"):
+                    from io import BytesIO
+                    output = BytesIO()
+                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                        pd.DataFrame(db.iter_records(table_name)).to_excel(writer, index=False, sheet_name=table_name)
+                    output.seek(0)
+
+                    st.download_button(
+                        label="📥 下載備份檔案",
+                        data=output,
+                        file_name=f"m5_{table_name}_backup_{datetime.now().strftime('%Y%m%d_%H%M%S')}.xlsx",
+                        mime="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+                    )
 
             # 依條件刪除
             st.divider()
@@ -1074,19 +1080,19 @@ def render():
 
             if "員工資料" in db_type:
                 emp_to_delete = st.multiselect(
-                    "選擇要刪除的員工",
+                    "選擇要刪除的員工（本頁）",
                     options=[f"{emp['emp_id']} - {emp['name']}" for emp in all_data]
                 )
 
                 if emp_to_delete and st.button("刪除選定員工", type="primary"):
                     emp_ids = [e.split(" - ")[0] for e in emp_to_delete]
-                    try:
-                        for emp_id in emp_ids:
-                            db.delete_employee(emp_id)
-                        st.success(f"已刪除 {len(emp_ids)} 位員工")
+                    # 單一交易刪除，並一併刪除這些員工的績效、訓練、離職記錄
+                    result = db.delete_many('employees', emp_ids)
+                    if result['success']:
+                        st.success(f"已刪除 {result['count']} 位員工")
                         st.rerun()
-                    except Exception as e:
-                        st.error(f"刪除失敗: {str(e)}")
+                    else:
+                        st.error(f"刪除失敗: {result['error']}")
             else:
                 # 其他資料庫提供依工號刪除
                 emp_id_to_delete = st.text_input("輸入要刪除的工號")
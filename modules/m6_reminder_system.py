@@ -1,10 +1,13 @@
 # -*- coding: utf-8 -*-
 import streamlit as st
 import pandas as pd
-from core.db_manager_multiuser import DBManagerMultiUser
+from core.db_manager_multiuser import get_db_manager
 from utils.file_handler import FileHandler
 from datetime import datetime, timedelta
 
+# 資料庫管理分頁每頁筆數
+PAGE_SIZE = 100
+
 
 def render():
     st.title('到期提醒系統')
@@ -14,34 +17,33 @@ def render():
     user_id = st.session_state.user_info['user_id']
 
     # 使用 M6 模組專屬資料庫（支援多用戶）
-    db_reminders = DBManagerMultiUser('m6_reminders', user_id=user_id)
-    db_employees = DBManagerMultiUser('m6_reminders', user_id=user_id)  # M6 使用同一個資料庫，包含 employees 和 reminders 表
+    db_reminders = get_db_manager('m6_reminders', user_id=user_id)
+    db_employees = db_reminders  # M6 使用同一個資料庫，包含 employees 和 reminders 表
 
     today = datetime.now().date()
     seven_days_later = (today + timedelta(days=7)).strftime('%Y-%m-%d')
 
-    # 獲取所有待處理提醒用於儀表板
-    all_pending_reminders = db_reminders.get_reminders_by_range('2000-01-01', '2099-12-31', status='pending')
+    # 獲取所有待處理提醒用於儀表板（直接建成 DataFrame，due_date 為 datetime）
+    pending_df = db_reminders.get_reminders_frame('2000-01-01', '2099-12-31', status='pending')
 
     # ===== 儀表板區域 =====
     st.subheader('📊 提醒儀表板')
 
-    if all_pending_reminders and len(all_pending_reminders) > 0:
+    if not pending_df.empty:
         import plotly.express as px
 
         chart_col1, chart_col2 = st.columns(2)
 
         with chart_col1:
             # 狀態分布圓餅圖
-            status_counts = {'已逾期': 0, '即將到期': 0, '未來提醒': 0}
-            for reminder in all_pending_reminders:
-                due_date = reminder.get('due_date', '')
-                if due_date < today.strftime('%Y-%m-%d'):
-                    status_counts['已逾期'] += 1
-                elif due_date <= seven_days_later:
-                    status_counts['即將到期'] += 1
-                else:
-                    status_counts['未來提醒'] += 1
+            due = pending_df['due_date']
+            overdue_mask = due < pd.Timestamp(today)
+            soon_mask = ~overdue_mask & (due <= pd.Timestamp(seven_days_later))
+            status_counts = {
+                '已逾期': int(overdue_mask.sum()),
+                '即將到期': int(soon_mask.sum()),
+                '未來提醒': int((~overdue_mask & ~soon_mask).sum())
+            }
 
             status_df = pd.DataFrame({
                 '狀態': list(status_counts.keys()),
@@ -57,15 +59,12 @@ def render():
 
         with chart_col2:
             # 提醒類型分布長條圖
-            type_counts = {}
-            for reminder in all_pending_reminders:
-                rtype = reminder.get('reminder_type', '其他')
-                type_counts[rtype] = type_counts.get(rtype, 0) + 1
-
-            type_df = pd.DataFrame({
-                '提醒類型': list(type_counts.keys()),
-                '數量': list(type_counts.values())
-            })
+            type_df = (
+                pending_df['reminder_type'].astype(object).fillna('其他')
+                .value_counts(sort=False)
+                .rename_axis('提醒類型')
+                .reset_index(name='數量')
+            )
 
             fig2 = px.bar(type_df, x='提醒類型', y='數量',
                          color='數量',
@@ -75,25 +74,17 @@ def render():
             st.plotly_chart(fig2, use_container_width=True)
 
         # 時間軸圖表
-        timeline_data = []
-        for reminder in all_pending_reminders:
-            due_date = reminder.get('due_date', '')
-            if due_date:
-                timeline_data.append({
-                    '到期日': due_date,
-                    '工號': reminder.get('emp_id'),
-                    '姓名': reminder.get('emp_name', 'N/A'),
-                    '類型': reminder.get('reminder_type', '其他')
-                })
-
-        if timeline_data:
-            timeline_df = pd.DataFrame(timeline_data)
-            timeline_df['到期日'] = pd.to_datetime(timeline_df['到期日'])
-            timeline_df = timeline_df.sort_values('到期日')
+        timeline_df = pending_df.dropna(subset=['due_date'])
 
+        if not timeline_df.empty:
             # 按月份統計
-            timeline_df['月份'] = timeline_df['到期日'].dt.to_period('M').astype(str)
-            monthly_counts = timeline_df.groupby('月份').size().reset_index(name='提醒數量')
+            monthly_counts = (
+                timeline_df['due_date'].dt.to_period('M').astype(str)
+                .value_counts()
+                .sort_index()
+                .rename_axis('月份')
+                .reset_index(name='提醒數量')
+            )
 
             fig3 = px.line(monthly_counts, x='月份', y='提醒數量',
                           markers=True,
@@ -230,6 +221,14 @@ def render():
             key=lambda x: (x.get('due_date', '9999-12-31'))
         )
 
+        if sorted_items and st.button(f'✅ 全部標記完成（{len(sorted_items)} 筆）', key='complete_all'):
+            result = db_reminders.update_status_many('reminders', [i['id'] for i in sorted_items], 'completed')
+            if result['success']:
+                st.success(f"已標記 {result['count']} 筆完成")
+                st.rerun()
+            else:
+                st.error(f"標記失敗: {result['error']}")
+
         for item in sorted_items:
             due_date = item.get('due_date', '')
 
@@ -296,6 +295,15 @@ def render():
         else:
             st.warning('目前無員工資料，請先在「員工查詢」模組匯入員工資料或使用批次匯入功能')
 
+        if st.button('🔄 從員工查詢模組同步員工', key='sync_m4_employees'):
+            # 以 INSERT ... SELECT 直接由 M4 員工資料庫複製，不經過 DataFrame
+            result = db_employees.copy_from('m4_employees', 'employees')
+            if result['success']:
+                st.success(f"已同步 {result['count']} 位員工")
+                st.rerun()
+            else:
+                st.error(f"同步失敗: {result['error']}")
+
         reminder_type = st.selectbox('類型', ['試用期滿', '合約到期', '其他'])
 
         # 自動計算到期日
@@ -351,15 +359,15 @@ def render():
 
         if upload:
             try:
-                df = FileHandler.load_file(upload)
+                # 欄位識別只需要標題列，完整讀取延後到按下匯入
+                probe = FileHandler.probe(upload)
                 st.write('檔案預覽:')
-                st.caption('💡 點擊右上角全螢幕按鈕可查看完整資料')
-                st.dataframe(df, use_container_width=True)
-                st.info(f'共 {len(df)} 筆資料，{len(df.columns)} 個欄位')
+                st.dataframe(probe['sample'], use_container_width=True)
+                st.info(f"{FileHandler.row_count_text(probe)}，{len(probe['columns'])} 個欄位")
 
                 # 檢查欄位名稱
                 col_map = {}
-                for col in df.columns:
+                for col in probe['columns']:
                     col_lower = str(col).lower().replace(' ', '')
                     if 'emp_id' in col_lower or '工號' in col or '員工編號' in col:
                         col_map['emp_id'] = col
@@ -368,82 +376,55 @@ def render():
 
                 if 'emp_id' not in col_map or 'hire_date' not in col_map:
                     st.error(f'找不到必要欄位！請確認檔案包含「工號」和「到職日」欄位')
-                    st.write(f'檔案欄位: {list(df.columns)}')
+                    st.write(f"檔案欄位: {probe['columns']}")
                 else:
                     st.success(f'✓ 已識別欄位：工號={col_map["emp_id"]}, 到職日={col_map["hire_date"]}')
 
                     if st.button('執行匯入', type='primary', key='import_reminders_btn'):
-                        success_count = 0
-                        error_count = 0
-                        error_messages = []
-
-                        progress_bar = st.progress(0)
-                        status_text = st.empty()
-
-                        total_rows = len(df)
-
-                        for idx, row in df.iterrows():
-                            progress_bar.progress((idx + 1) / total_rows)
-                            status_text.text(f'處理中: {idx + 1}/{total_rows}')
-
-                            emp_id = row.get(col_map['emp_id'])
-                            hire_date = row.get(col_map['hire_date'])
-                            emp_name = row.get('姓名', row.get('Name', ''))
-                            dept = row.get('部門', row.get('Department', ''))
-
-                            if emp_id and hire_date:
-                                try:
-                                    # 先確保員工資料存在於兩個資料庫
-                                    if emp_name:
-                                        # 存入員工主資料庫
-                                        db_employees.add_employee(
-                                            str(emp_id),
-                                            str(emp_name),
-                                            None,  # national_id
-                                            str(dept) if dept else None,
-                                            hire_date.strftime('%Y-%m-%d') if isinstance(hire_date, pd.Timestamp) else str(hire_date)
-                                        )
-                                        # 存入提醒資料庫的員工表
-                                        db_reminders.add_employee(
-                                            str(emp_id),
-                                            str(emp_name),
-                                            None,
-                                            str(dept) if dept else None,
-                                            hire_date.strftime('%Y-%m-%d') if isinstance(hire_date, pd.Timestamp) else str(hire_date)
-                                        )
-
-                                    # 計算試用期滿日
-                                    if isinstance(hire_date, str):
-                                        hire_date = pd.to_datetime(hire_date)
-
-                                    due_date = hire_date + pd.DateOffset(months=probation_months)
-
-                                    # 新增提醒
-                                    if db_reminders.add_reminder(
-                                        str(emp_id),
-                                        str(emp_name) if emp_name else str(emp_id),
-                                        '試用期滿',
-                                        datetime.now().strftime('%Y-%m-%d'),
-                                        due_date.strftime('%Y-%m-%d'),
-                                        f'到職日: {hire_date.strftime("%Y-%m-%d")}'
-                                    ):
-                                        success_count += 1
-                                    else:
-                                        error_count += 1
-                                        error_messages.append(f'工號 {emp_id}: 新增提醒失敗')
-                                except Exception as e:
-                                    error_count += 1
-                                    error_messages.append(f'工號 {emp_id}: {str(e)}')
-                                    continue
+                        with st.spinner('正在匯入資料...'):
+                            df = FileHandler.load_file(upload)
+                            name_col = next((c for c in ['姓名', 'Name'] if c in df.columns), None)
+                            dept_col = next((c for c in ['部門', 'Department'] if c in df.columns), None)
+
+                            # 一次計算所有試用期滿日
+                            hire_dates = pd.to_datetime(df[col_map['hire_date']], errors='coerce', format='mixed')
+                            due_dates = hire_dates + pd.DateOffset(months=probation_months)
+                            # Excel 的數字工號會讀成浮點數（1001.0），先轉成與其他模組一致的文字工號
+                            emp_ids = df[col_map['emp_id']]
+                            if pd.api.types.is_float_dtype(emp_ids) and (emp_ids.dropna() % 1 == 0).all():
+                                emp_ids = emp_ids.astype('Int64')
+                            emp_ids = emp_ids.astype('string').str.strip().replace('', pd.NA)
+                            emp_names = df[name_col] if name_col else pd.Series(pd.NA, index=df.index)
+                            valid = emp_ids.notna() & hire_dates.notna()
+
+                            # 有姓名的人員同時寫入員工表
+                            employees_df = pd.DataFrame({
+                                'emp_id': emp_ids,
+                                'name': emp_names,
+                                'department': df[dept_col] if dept_col else None,
+                                'hire_date': hire_dates,
+                            })[valid]
+                            employee_result = db_employees.import_employee_data(employees_df)
+
+                            reminders_df = pd.DataFrame({
+                                'emp_id': emp_ids,
+                                'emp_name': emp_names.fillna(emp_ids.astype(str)),
+                                'reminder_type': '試用期滿',
+                                'created_date': datetime.now().strftime('%Y-%m-%d'),
+                                'due_date': due_dates,
+                                'notes': '到職日: ' + hire_dates.dt.strftime('%Y-%m-%d'),
+                            })[valid]
+                            if employee_result.get('success'):
+                                result = db_reminders.import_reminders(reminders_df)
                             else:
-                                error_count += 1
-                                error_messages.append(f'第 {idx + 1} 列: 缺少工號或到職日')
+                                result = {'success': False, 'error': f"員工資料匯入失敗: {employee_result.get('error')}"}
 
-                        progress_bar.empty()
-                        status_text.empty()
+                        error_count = int((~valid).sum())
+                        error_messages = [f'第 {idx + 1} 列: 缺少工號或到職日' for idx in range(len(df)) if not valid.iloc[idx]]
 
-                        if success_count > 0:
-                            st.success(f'匯入成功！共 {success_count} 筆提醒已建立')
+                        if result.get('success') and result['count'] > 0:
+                            st.success(f"匯入成功！共 {result['count']} 筆提醒已建立，"
+                                       f"{employee_result['count']} 筆員工資料已更新")
                             if error_count > 0:
                                 st.warning(f'有 {error_count} 筆資料匯入失敗')
                                 with st.expander('查看錯誤詳情'):
@@ -452,7 +433,7 @@ def render():
                             st.balloons()
                             st.rerun()
                         else:
-                            st.error(f'匯入失敗！所有資料都無法匯入')
+                            st.error(f"匯入失敗！{result.get('error', '所有資料都無法匯入')}")
                             with st.expander('查看錯誤詳情'):
                                 for msg in error_messages[:10]:
                                     st.text(msg)
@@ -464,16 +445,38 @@ def render():
     with st.expander('🗄️ 資料庫管理'):
         st.warning('⚠️ 請謹慎操作，刪除後無法復原！')
 
-        # 顯示資料庫內容
-        all_reminders_data = db_reminders.get_all_records()
+        # 顯示資料庫內容：只讀取目前顯示的這一頁（keyset 分頁，游標堆疊存在 session_state）
+        if 'm6_page_cursors' not in st.session_state:
+            st.session_state.m6_page_cursors = [None]
+        cursors = st.session_state.m6_page_cursors
+
+        total_count = db_reminders.count_records('reminders')
+        page = db_reminders.get_page('reminders', page_size=PAGE_SIZE, after=cursors[-1])
+        if not page['records'] and len(cursors) > 1:
+            # 資料被刪除後目前頁已無資料，回到第一頁
+            st.session_state.m6_page_cursors = cursors = [None]
+            page = db_reminders.get_page('reminders', page_size=PAGE_SIZE)
+        all_reminders_data = page['records']
 
         if all_reminders_data:
-            st.info(f'提醒資料庫中共有 {len(all_reminders_data)} 筆資料')
+            st.info(f'提醒資料庫中共有 {total_count} 筆資料')
 
             # 顯示資料
             df_display = pd.DataFrame(all_reminders_data)
             st.dataframe(df_display, width='stretch')
 
+            nav1, nav2, nav3 = st.columns([1, 2, 1])
+            with nav1:
+                if len(cursors) > 1 and st.button('⬅️ 上一頁', key='m6_prev_page'):
+                    cursors.pop()
+                    st.rerun()
+            with nav2:
+                st.caption(f'第 {len(cursors)} 頁，共 {max(1, -(-total_count // PAGE_SIZE))} 頁（每頁 {PAGE_SIZE} 筆）')
+            with nav3:
+                if page['next_cursor'] is not None and st.button('下一頁 ➡️', key='m6_next_page'):
+                    cursors.append(page['next_cursor'])
+                    st.rerun()
+
             st.divider()
 
             # 管理選項
@@ -493,19 +496,20 @@ def render():
 
             with col2:
                 st.subheader('匯出資料')
-                # 匯出資料庫內容
-                from io import BytesIO
-                output = BytesIO()
-                with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                    df_display.to_excel(writer, index=False, sheet_name='提醒資料')
-                output.seek(0)
-
-                st.download_button(
-                    label='📥 匯出資料庫內容',
-                    data=output,
-                    file_name=f'reminders_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
-                    mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-                )
+                # 匯出資料庫內容（按下後才逐批讀取整個資料表）
+                if st.button('📦 準備匯出檔案', key='m6_prepare_export'):
+                    from io import BytesIO
+                    output = BytesIO()
+                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+                        pd.DataFrame(db_reminders.iter_records('reminders')).to_excel(writer, index=False, sheet_name='提醒資料')
+                    output.seek(0)
+
+                    st.download_button(
+                        label='📥 匯出資料庫內容',
+                        data=output,
+                        file_name=f'reminders_backup_{datetime.now().strftime("%Y%m%d_%H%M%S")}.xlsx',
+                        mime='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+                    )
 
             st.divider()
 
@@ -529,20 +533,19 @@ def render():
 
             elif delete_option == '依提醒ID刪除':
                 reminder_ids = st.multiselect(
-                    '選擇要刪除的提醒',
+                    '選擇要刪除的提醒（本頁）',
                     options=[f"ID {r['id']}: {r['emp_id']} - {r['reminder_type']} ({r['due_date']})" for r in all_reminders_data],
                     key='delete_reminder_ids'
                 )
 
                 if reminder_ids and st.button('刪除選定提醒', type='primary', key='delete_by_ids'):
-                    try:
-                        for reminder_str in reminder_ids:
-                            reminder_id = int(reminder_str.split(':')[0].replace('ID ', ''))
-                            db_reminders.delete_reminder_by_id(reminder_id)
-                        st.success(f'已刪除 {len(reminder_ids)} 筆提醒')
+                    ids = [int(reminder_str.split(':')[0].replace('ID ', '')) for reminder_str in reminder_ids]
+                    result = db_reminders.delete_many('reminders', ids)
+                    if result['success']:
+                        st.success(f"已刪除 {result['count']} 筆提醒")
                         st.rerun()
-                    except Exception as e:
-                        st.error(f'刪除失敗: {str(e)}')
+                    else:
+                        st.error(f"刪除失敗: {result['error']}")
 
             else:  # 依狀態批量刪除
                 status_to_delete = st.selectbox(
@@ -550,22 +553,18 @@ def render():
                     ['completed', 'pending']
                 )
 
-                status_count = len([r for r in all_reminders_data if r.get('status') == status_to_delete])
+                status_count = db_reminders.count_reminders_by_status(status_to_delete)
                 st.info(f'將刪除 {status_count} 筆狀態為「{status_to_delete}」的提醒')
 
                 if st.button(f'刪除所有「{status_to_delete}」提醒', type='primary', key='delete_by_status'):
                     confirm_batch = st.checkbox(f'我確認要刪除 {status_count} 筆提醒')
                     if confirm_batch:
-                        try:
-                            conn = db_reminders._get_connection()
-                            cursor = conn.cursor()
-                            cursor.execute("DELETE FROM reminders WHERE status = ?", (status_to_delete,))
-                            conn.commit()
-                            conn.close()
-                            st.success(f'已刪除 {status_count} 筆提醒')
+                        result = db_reminders.delete_by_status(status_to_delete)
+                        if result['success']:
+                            st.success(f"已刪除 {result['count']} 筆提醒")
                             st.rerun()
-                        except Exception as e:
-                            st.error(f'刪除失敗: {str(e)}')
+                        else:
+                            st.error(f"刪除失敗: {result['error']}")
 
         else:
             st.info('提醒資料庫中無資料')
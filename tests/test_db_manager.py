@@ -0,0 +1,924 @@
+# -*- coding: utf-8 -*-
+"""
+資料庫存取層測試（連線池、匯入、查詢）
+"""
+import sys
+import json
+import os
+import tempfile
+import threading
+import hashlib
+import sqlite3
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pandas as pd
+from core.db_manager import DBManager, _pool
+from core.db_manager_multiuser import DBManagerMultiUser, get_db_manager
+from core.db_writer import get_write_queue, shutdown_write_queues
+from core.query_cache import QueryCache, query_cache
+from core.query_stats import query_stats
+from core.db_migration import migrate_database, get_schema_version, MIGRATIONS, SCHEMA_VERSION
+
+
+def _in_temp_dir(func):
+    """在暫存目錄執行測試，避免動到 data/ 內的正式資料庫"""
+    def wrapper():
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                func()
+            finally:
+                shutdown_write_queues()
+                _pool.close_all()
+                os.chdir(cwd)
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+
+@_in_temp_dir
+def test_connection_pool():
+    """測試連線池：同一執行緒重用連線、WAL 模式"""
+    print('\n=== Testing Connection Pool ===')
+    db = DBManagerMultiUser('m4_employees', user_id=1)
+
+    conn1 = db._get_connection()
+    conn1.close()
+    conn2 = db._get_connection()
+    assert conn1._conn is conn2._conn
+    assert conn2.execute('PRAGMA journal_mode').fetchone()[0] == 'wal'
+    conn2.close()
+    print('OK - Same thread reuses one connection in WAL mode')
+
+    other = []
+    t = threading.Thread(target=lambda: other.append(db._get_connection()._conn))
+    t.start()
+    t.join()
+    assert other[0] is not conn1._conn
+    print('OK - Other thread gets its own connection')
+
+    assert db.add_employee('E001', '王小明', None, 'IT', '2023-01-15')
+    assert len(db.get_all_employees()) == 1
+    print('OK - Read/write through pooled connection')
+
+
+
+
+@_in_temp_dir
+def test_bulk_import():
+    """測試批次匯入：中英文欄位別名、身分證雜湊、缺漏列略過"""
+    print('\n=== Testing Bulk Import ===')
+    db = DBManagerMultiUser('m5_qualification', user_id=7)
+
+    employees = pd.DataFrame({
+        '工號': [1001, 1002, None],
+        '姓名': ['王小明', '李小華', '無工號'],
+        '身分證字號': ['A123456789', None, 'B1'],
+        '到職日': pd.to_datetime(['2023-01-15', '2023-02-01', '2023-03-01']),
+    })
+    result = db.import_employee_data(employees, defaults={'status': '離職'})
+    assert result == {'success': True, 'count': 2, 'skipped': 1}, result
+    rows = {r['emp_id']: r for r in db.get_all_employees()}
+    assert set(rows) == {'1001', '1002'}
+    assert rows['1001']['hire_date'] == '2023-01-15'
+    assert rows['1001']['status'] == '離職'
+    assert rows['1001']['user_id'] == 7
+    assert rows['1001']['id_number_hash'] == hashlib.sha256(b'A123456789').hexdigest()
+    print(f'OK - Imported {result["count"]} employees, skipped {result["skipped"]}')
+
+    performance = pd.DataFrame({'EMP_ID': ['1001', '1001'], 'Year': [2022, 2023],
+                                'rating': ['A', 'C'], 'score': [90, 70.5]})
+    result = db.import_performance_data(performance)
+    assert result['count'] == 2
+    history = db.get_performance_history('1001')
+    assert [h['year'] for h in history] == [2023, 2022]
+    print('OK - Case-insensitive column aliases')
+
+
+@_in_temp_dir
+def test_schema_migration():
+    """測試版本化遷移：舊資料庫補上 user_id 與索引，之後不再重複執行"""
+    print('\n=== Testing Schema Migration ===')
+    os.makedirs('data', exist_ok=True)
+    conn = sqlite3.connect('data/m4_performance.db')
+    conn.execute("CREATE TABLE performance (id INTEGER PRIMARY KEY AUTOINCREMENT, emp_id TEXT, year INTEGER, rating TEXT, score REAL, updated_at TIMESTAMP)")
+    conn.execute("INSERT INTO performance (emp_id, year, rating, score) VALUES ('E001', 2023, 'A', 90)")
+    conn.commit()
+    conn.close()
+
+    assert migrate_database('data/m4_performance.db') == len(MIGRATIONS)
+    assert get_schema_version('data/m4_performance.db') == SCHEMA_VERSION
+    print(f'OK - Legacy database migrated to version {SCHEMA_VERSION}')
+
+    assert migrate_database('data/m4_performance.db') == 0
+    db = DBManagerMultiUser('m4_performance', user_id=None)
+    assert db.get_performance_history('E001')[0]['user_id'] is None
+    indexes = {row[1] for row in db._get_connection().execute("PRAGMA index_list(performance)")}
+    assert 'idx_performance_user_emp' in indexes
+    print('OK - Already-current database is skipped')
+
+
+@_in_temp_dir
+def test_db_registry():
+    """測試同一個資料庫檔案在行程內只初始化一次，並共用使用者範圍的物件"""
+    print('\n=== Testing DBManager Registry ===')
+
+    calls = []
+    original = DBManager._init_database
+    DBManager._init_database = lambda self: (calls.append(self.db_path), original(self))[1]
+    try:
+        for _ in range(5):
+            DBManagerMultiUser('m4_training', user_id=1)
+        assert calls == ['data/m4_training.db'], calls
+        print('OK - Schema initialized once for repeated instantiation')
+
+        a = get_db_manager('m4_training', user_id=1)
+        assert get_db_manager('m4_training', user_id=1) is a
+        b = get_db_manager('m4_training', user_id=2)
+        assert b is not a and b.user_id == 2
+        assert len(calls) == 1
+        print('OK - Handles cached per (db_name, user_id)')
+    finally:
+        DBManager._init_database = original
+
+    a.add_training_record('E001', '新人訓', '必修', 3, '2024-01-01')
+    assert len(a.get_training_history('E001')) == 1
+    assert b.get_training_history('E001') == []
+    print('OK - Cached handles stay scoped to their user')
+
+
+@_in_temp_dir
+def test_batch_fetch():
+    """測試多員工批次查詢與逐筆查詢結果一致，且以分段 IN 查詢完成"""
+    print('\n=== Testing Batch Fetch ===')
+
+    db = DBManagerMultiUser('m5_qualification', user_id=1)
+    db.BATCH_FETCH_CHUNK = 7
+    emp_ids = [f'E{i:03d}' for i in range(20)]
+    db.import_performance_data(pd.DataFrame({
+        'emp_id': emp_ids * 2, 'year': [2023] * 20 + [2024] * 20, 'rating': 'A', 'score': 90}))
+    db.import_training_data(pd.DataFrame({
+        'emp_id': emp_ids[::2], 'course_name': '新人訓', 'hours': 3, 'completion_date': '2024-01-01'}))
+    db.import_separation_data(pd.DataFrame({
+        'emp_id': ['E001', 'E001'], 'separation_date': ['2023-01-01', '2024-06-30'], 'separation_type': '自願離職'}))
+    DBManagerMultiUser('m5_qualification', user_id=2).add_performance_record('E000', 2024, 'E', 10)
+
+    statements = []
+    db._get_connection().set_trace_callback(statements.append)
+    lookup = emp_ids + ['E404', 'E000']
+    perf = db.get_performance_history_many(lookup)
+    training = db.get_training_history_many(lookup)
+    separation = db.get_separation_record_many(lookup)
+    db._get_connection().set_trace_callback(None)
+    assert len([sql for sql in statements if sql.startswith('SELECT')]) == 9, statements
+    print('OK - 21 employees fetched with 3 chunked queries per table')
+
+    for emp_id in lookup:
+        assert perf[emp_id] == db.get_performance_history(emp_id)
+        assert training[emp_id] == db.get_training_history(emp_id)
+        assert separation[emp_id] == db.get_separation_record(emp_id)
+    assert [r['year'] for r in perf['E000']] == [2024, 2023]
+    assert perf['E404'] == [] and separation['E404'] is None
+    assert separation['E001']['separation_date'] == '2024-06-30'
+    assert db.get_performance_history_many([]) == {}
+    print('OK - Batch results match per-employee queries')
+
+    from modules.m5_qualification_check import QualificationChecker
+    checker = QualificationChecker(user_id=1)
+    db.import_employee_data(pd.DataFrame({'emp_id': emp_ids, 'name': [f'員工{i}' for i in range(20)]}))
+    employees = db.get_all_employees()
+    batch = checker.check_many(employees)
+    for emp in employees:
+        single = checker.check(emp['name'])
+        assert batch[emp['emp_id']]['overall_status'] == single['overall_status']
+        assert [c['detail'] for c in batch[emp['emp_id']]['checks']] == [c['detail'] for c in single['checks']]
+    print('OK - QualificationChecker.check_many matches check')
+
+
+@_in_temp_dir
+def test_search_index():
+    """測試員工搜尋使用 FTS5 trigram 索引，並由觸發器保持同步"""
+    print('\n=== Testing Employee Search Index ===')
+
+    db = DBManagerMultiUser('m4_employees', user_id=1)
+    db.import_employee_data(pd.DataFrame({
+        'emp_id': ['E001', 'E002', 'E003', 'E004'],
+        'name': ['王小明', '王明', '陳小明', '李大華'],
+        'department': ['研發部', '人資部', '研發部', 'R&D_Lab'],
+    }))
+    DBManagerMultiUser('m4_employees', user_id=2).add_employee('E900', '王小明華', department='研發部')
+
+    statements = []
+    db._get_connection().set_trace_callback(statements.append)
+    assert [r['emp_id'] for r in db.search_employee('王小明')] == ['E001']
+    assert any('employees_fts MATCH' in sql for sql in statements)
+    db._get_connection().set_trace_callback(None)
+    assert {r['emp_id'] for r in db.search_employee('研發部')} == {'E001', 'E003'}
+    assert [r['emp_id'] for r in db.search_employee('E003')] == ['E003']
+    print('OK - Trigram search matches name, department and emp_id within user')
+
+    assert [r['emp_id'] for r in db.search_employee('王明')] == ['E002']
+    assert {r['emp_id'] for r in db.search_employee('小明')} == {'E001', 'E003'}
+    assert [r['emp_id'] for r in db.search_employee('D_')] == ['E004']
+    assert len(db.search_employee('')) == 4
+    assert len(db.search_employee('E00', limit=2)) == 2
+    print('OK - Short keywords fall back to LIKE; empty keyword lists all')
+
+    db.add_employee('E001', '王大明', department='財務部')
+    assert db.search_employee('王小明') == []
+    assert [r['emp_id'] for r in db.search_employee('王大明')] == ['E001']
+    db.delete_employee('E003')
+    assert db.search_employee('陳小明') == []
+    conn = db._get_connection()
+    conn.execute("UPDATE employees SET name = '李中華' WHERE emp_id = 'E004'")
+    conn.commit()
+    assert [r['emp_id'] for r in db.search_employee('李中華')] == ['E004']
+    conn.execute("INSERT INTO employees_fts (employees_fts) VALUES ('integrity-check')")  # 不一致時會拋出例外
+    print('OK - Index stays in sync through replace, delete and update')
+
+
+@_in_temp_dir
+def test_pagination():
+    """測試 keyset 分頁與串流讀取"""
+    print('\n=== Testing Keyset Pagination ===')
+
+    db = DBManagerMultiUser('m5_qualification', user_id=1)
+    emp_ids = [f'E{i:03d}' for i in range(25)]
+    db.import_employee_data(pd.DataFrame({'emp_id': emp_ids[::-1], 'name': 'x'}))
+    db.import_performance_data(pd.DataFrame({'emp_id': emp_ids, 'year': 2024}))
+    other = DBManagerMultiUser('m5_qualification', user_id=2)
+    other.import_performance_data(pd.DataFrame({'emp_id': emp_ids[:5], 'year': 2024}))
+
+    seen, after = [], None
+    while True:
+        page = db.get_page('employees', page_size=10, after=after)
+        assert len(page['records']) <= 10
+        seen += [r['emp_id'] for r in page['records']]
+        after = page['next_cursor']
+        if after is None:
+            break
+    assert seen == emp_ids
+    assert db.get_page('employees', page_size=25)['next_cursor'] is None
+    print('OK - Employees paged by emp_id with an exact last page')
+
+    first = db.get_page('performance', page_size=20)
+    second = db.get_page('performance', page_size=20, after=first['next_cursor'])
+    assert len(first['records']) == 20 and len(second['records']) == 5
+    assert all(r['user_id'] == 1 for r in first['records'] + second['records'])
+    assert db.count_records('performance') == 25 and other.count_records('performance') == 5
+    print('OK - Record pages keyed by id and scoped to user')
+
+    records = db.iter_records('performance', batch_size=7)
+    assert not isinstance(records, list)
+    assert [r['emp_id'] for r in records] == emp_ids
+    try:
+        db.get_page('sqlite_master')
+        assert False, 'unknown table should be rejected'
+    except ValueError:
+        pass
+    print('OK - iter_records streams every row in batches')
+
+
+@_in_temp_dir
+def test_fetch_frame():
+    """測試 fetch_frame 直接由游標建立具型別的 DataFrame"""
+    print('\n=== Testing fetch_frame ===')
+
+    db = DBManagerMultiUser('m5_qualification', user_id=1)
+    db.import_employee_data(pd.DataFrame({
+        'emp_id': ['E001', 'E002', 'E003'],
+        'name': ['王小明', '陳小華', '李大同'],
+        'department': ['研發部', '研發部', None],
+        'hire_date': ['2024-01-15', '2023/7/1', None],
+    }))
+    df = db.fetch_frame("SELECT emp_id, department, status, hire_date FROM employees ORDER BY emp_id")
+    assert list(df.columns) == ['emp_id', 'department', 'status', 'hire_date']
+    assert isinstance(df['department'].dtype, pd.CategoricalDtype)
+    assert isinstance(df['status'].dtype, pd.CategoricalDtype)
+    assert pd.api.types.is_datetime64_any_dtype(df['hire_date'])
+    assert df['hire_date'].iloc[1] == pd.Timestamp('2023-07-01') and pd.isna(df['hire_date'].iloc[2])
+    raw = db.fetch_frame("SELECT hire_date FROM employees WHERE emp_id = ?", ('E001',), dtypes={'hire_date': None})
+    assert raw['hire_date'].tolist() == ['2024-01-15']
+    empty = db.fetch_frame("SELECT emp_id, hire_date FROM employees WHERE 0")
+    assert empty.empty and list(empty.columns) == ['emp_id', 'hire_date']
+    print('OK - Categorical, datetime and raw columns built from the cursor')
+
+    db.BATCH_FETCH_CHUNK = 2
+    db.import_training_data(pd.DataFrame({
+        'emp_id': ['E001', 'E002', 'E003', 'E001'],
+        'course_name': ['A', 'B', 'C', 'D'],
+        'hours': [1, 2, 3, 4],
+        'completion_date': ['2024-01-01', '2024-02-01', '2024-03-01', '2024-04-01'],
+    }))
+    DBManagerMultiUser('m5_qualification', user_id=2).add_training_record('E001', 'X', '必修', 9, '2024-05-01')
+    frame = db.get_history_frame('training', ['E001', 'E002', 'E003'])
+    assert len(frame) == 4 and frame['hours'].sum() == 10
+    assert frame[frame['emp_id'] == 'E001']['course_name'].tolist() == ['D', 'A']
+    assert pd.api.types.is_datetime64_any_dtype(frame['completion_date'])
+    assert db.get_history_frame('training', []).empty
+    print('OK - History frames are chunked, ordered and scoped to user')
+
+
+@_in_temp_dir
+def test_write_queue():
+    """測試單一寫入者佇列：併發寫入不遺失、group commit、單一工作失敗不影響同批"""
+    print('\n=== Testing Write Queue ===')
+
+    db = DBManagerMultiUser('m6_reminders', user_id=1)
+
+    def worker(n):
+        handle = DBManagerMultiUser('m6_reminders', user_id=1)
+        for i in range(50):
+            assert handle.add_reminder(f'E{n}-{i}', 'x', '試用期滿', '2024-01-01', '2024-04-01')
+
+    threads = [threading.Thread(target=worker, args=(n,)) for n in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert db.count_records('reminders') == 400
+    print('OK - 8 concurrent writers, no lost rows')
+
+    # 第一個工作卡住寫入執行緒，其餘工作排隊後應合併成同一個交易
+    started, release = threading.Event(), threading.Event()
+    blocker = db.submit_write(lambda conn: (started.set(), release.wait(5)))
+    started.wait(5)
+    statements = []
+    get_write_queue(db.db_path, None)._conn.set_trace_callback(statements.append)
+
+    def failing(conn):
+        conn.execute("INSERT INTO reminders (emp_id, reminder_type, created_date, due_date) VALUES ('BAD', 'x', '2024-01-01', '2024-01-01')")
+        raise ValueError('boom')
+
+    futures = [db.submit_write(lambda conn, i=i: conn.execute(
+        "INSERT INTO reminders (emp_id, reminder_type, created_date, due_date, user_id) VALUES (?, 'x', '2024-01-01', '2024-01-01', 1)",
+        (f'G{i}',)).lastrowid) for i in range(5)]
+    bad = db.submit_write(failing)
+    release.set()
+    blocker.result()
+    assert all(isinstance(f.result(), int) for f in futures)
+    try:
+        bad.result()
+        assert False, 'failing job should raise'
+    except ValueError:
+        pass
+    get_write_queue(db.db_path, None)._conn.set_trace_callback(None)
+    assert statements.count('BEGIN IMMEDIATE') == 1, statements
+    assert db.count_records('reminders') == 405
+    assert db._get_connection().execute("SELECT COUNT(*) FROM reminders WHERE emp_id = 'BAD'").fetchone()[0] == 0
+    print('OK - Queued writes group-committed; failed job rolled back alone')
+
+
+@_in_temp_dir
+def test_query_cache():
+    """測試查詢快取：重複讀取命中、寫入後失效、依 user_id 隔離、超過上限淘汰"""
+    print('\n=== Testing Query Cache ===')
+
+    db = DBManagerMultiUser('m6_reminders', user_id=1)
+    other = DBManagerMultiUser('m6_reminders', user_id=2)
+    db.add_employee('E001', '王小明', department='研發部')
+    other.add_employee('E900', '外部人員')
+
+    hits = query_cache.hits
+    first = db.get_all_employees()
+    first[0]['name'] = '被修改'
+    assert db.get_all_employees()[0]['name'] == '王小明'
+    assert query_cache.hits == hits + 1
+    assert [e['emp_id'] for e in other.get_all_employees()] == ['E900']
+    print('OK - Repeated read served from cache as a copy, scoped per user')
+
+    db.add_reminder('E001', '王小明', '試用期滿', '2024-01-01', '2024-03-01')
+    assert len(db.get_reminders_by_range('2024-01-01', '2024-12-31')) == 1
+    db.add_reminder('E001', '王小明', '合約到期', '2024-01-01', '2024-06-01')
+    assert len(db.get_reminders_by_range('2024-01-01', '2024-12-31')) == 2
+    assert len(db.get_reminders_frame('2024-01-01', '2024-12-31', status='pending')) == 2
+    reminder_id = db.get_reminders_by_range('2024-01-01', '2024-12-31')[0]['id']
+    db.mark_reminder_completed(reminder_id)
+    assert len(db.get_reminders_frame('2024-01-01', '2024-12-31', status='pending')) == 1
+
+    # 寫入 reminders 不影響 employees 的快取
+    hits = query_cache.hits
+    db.get_all_employees()
+    assert query_cache.hits == hits + 1
+    db.submit_write(lambda conn: conn.execute("DELETE FROM employees WHERE emp_id = 'E001'")).result()
+    assert db.get_all_employees() == []
+    print('OK - Writes invalidate only the tables they touch')
+
+    templates = get_db_manager('workflow_templates', user_id=1)
+    assert templates.get_all_templates('M1') == []
+    templates.save_template('M1', '月報', {'a': 1})
+    assert [t['template_name'] for t in templates.get_all_templates('M1')] == ['月報']
+    templates.delete_template('M1', '月報')
+    assert templates.get_all_templates('M1') == []
+
+    cache = QueryCache(max_bytes=4000)
+    for i in range(20):
+        cache.get_or_load('x.db', ('t',), ('q', i), lambda i=i: [{'value': 'x' * 200, 'i': i}])
+    stats = cache.stats()
+    assert 0 < stats['entries'] < 20 and stats['bytes'] <= 4000
+    loads = []
+    cache.get_or_load('x.db', ('t',), ('q', 0), lambda: loads.append(1) or [])
+    assert loads == [1]
+    cache.get_or_load('x.db', ('t',), ('q', 19), lambda: loads.append(2) or [])
+    assert loads == [1]
+
+    # 大型鍵（整批工號）計入大小上限
+    cache = QueryCache(max_bytes=64 * 1024)
+    cache.get_or_load('x.db', ('t',), ('batch', tuple(f'E{i:05d}' for i in range(5000))), lambda: {})
+    assert cache.stats()['entries'] == 0
+    cache.get_or_load('x.db', ('t',), ('batch', tuple(f'E{i:05d}' for i in range(500))), lambda: {})
+    assert cache.stats()['entries'] == 1 and cache.stats()['bytes'] > 500 * 50
+    print('OK - Least recently used entries evicted under the memory cap, keys included')
+
+
+@_in_temp_dir
+def test_cross_process_cache():
+    """測試其他行程寫入後，本行程的查詢快取會失效"""
+    print('\n=== Testing Cross-Process Cache Coherence ===')
+    import subprocess
+
+    db = DBManagerMultiUser('m6_reminders', user_id=1)
+    db.add_employee('E001', '王小明')
+    assert [e['name'] for e in db.get_all_employees()] == ['王小明']
+    write_queue = get_write_queue(db.db_path, None)
+    db.add_employee('E002', '陳小華')
+    assert not write_queue.poll_external(), 'own queued writes must not count as external'
+    assert len(db.get_all_employees()) == 2
+
+    subprocess.run([sys.executable, '-c', (
+        "import sqlite3, sys; conn = sqlite3.connect(sys.argv[1]); "
+        "conn.execute(\"UPDATE employees SET name = '王大明' WHERE emp_id = 'E001'\"); conn.commit()"
+    ), db.db_path], check=True)
+
+    hits = query_cache.hits
+    assert db.get_all_employees()[0]['name'] == '王大明'
+    assert query_cache.hits == hits
+    db.get_all_employees()
+    assert query_cache.hits == hits + 1
+    print('OK - Commit from another process invalidated the cached result')
+
+
+@_in_temp_dir
+def test_attached_queries():
+    """測試 ATTACH 跨模組查詢：單一連線組出員工概況、INSERT ... SELECT 複製員工"""
+    print('\n=== Testing Attached Cross-Module Queries ===')
+
+    employees = DBManagerMultiUser('m4_employees', user_id=1)
+    employees.import_employee_data(pd.DataFrame({
+        'emp_id': ['E001', 'E002'], 'name': ['王小明', '陳小華'],
+        'department': ['研發部', '業務部'], 'hire_date': ['2020-01-01', '2021-01-01'],
+    }))
+    DBManagerMultiUser('m4_employees', user_id=2).add_employee('E900', '外部人員')
+    performance = DBManagerMultiUser('m4_performance', user_id=1)
+    performance.add_performance_record('E001', 2022, 'A', 90)
+    performance.add_performance_record('E001', 2023, 'B', 80)
+    DBManagerMultiUser('m4_performance', user_id=2).add_performance_record('E001', 2023, 'C', 10)
+    DBManagerMultiUser('m4_training', user_id=1).add_training_record('E002', '安全', '必修', 3, '2024-01-01')
+    separation = DBManagerMultiUser('m4_separation', user_id=1)
+    separation.add_separation_record('E002', '2023-01-01', '自願', '舊', False)
+    separation.add_separation_record('E002', '2024-06-30', '非自願', '新', True)
+
+    sources = {'performance': 'm4_performance', 'training': 'm4_training', 'separation': 'm4_separation'}
+    profiles = employees.get_employee_profiles(['E001', 'E002', 'E404'], sources)
+    profile = profiles['employees'].set_index('emp_id')
+    assert list(profile.index) == ['E001', 'E002']
+    assert profile.at['E001', 'performance_count'] == 2 and profile.at['E001', 'avg_score'] == 85
+    assert pd.isna(profile.at['E001', 'separation_date']) and profile.at['E001', 'separation_count'] == 0
+    assert pd.isna(profile.at['E002', 'avg_score']) and profile.at['E002', 'separation_count'] == 2
+    assert profile.at['E002', 'training_hours'] == 3
+    assert profile.at['E002', 'separation_date'] == pd.Timestamp('2024-06-30')
+    assert profile.at['E002', 'reason'] == '新' and profile.at['E002', 'blacklist'] == 1
+    assert profiles['performance']['year'].tolist() == [2023, 2022]
+    assert profiles['training']['course_name'].tolist() == ['安全']
+    print('OK - Profile with history assembled over one attached connection')
+
+    reminders = DBManagerMultiUser('m6_reminders', user_id=1)
+    assert reminders.get_all_employees() == []
+    result = reminders.copy_from('m4_employees', 'employees')
+    assert result == {'success': True, 'count': 2}, result
+    copied = reminders.get_all_employees()
+    assert [(e['emp_id'], e['name'], e['hire_date']) for e in copied] == [
+        ('E001', '王小明', '2020-01-01'), ('E002', '陳小華', '2021-01-01')]
+    assert reminders.copy_from('m4_employees', 'employees')['count'] == 2
+    assert len(reminders.get_all_employees()) == 2
+    assert not reminders.copy_from('m4_employees', 'sqlite_master')['success']
+    writer = get_write_queue(reminders.db_path, _pool._open)
+    databases = writer.submit(lambda conn: [row[1] for row in conn.execute("PRAGMA database_list")]).result()
+    assert databases == ['main'], databases
+    print('OK - Employees seeded from M4 with INSERT ... SELECT, source detached afterwards')
+
+
+@_in_temp_dir
+def test_natural_key_upsert():
+    """測試自然鍵：舊資料去重、重複匯入改為更新、只有值改變的列才會寫入"""
+    print('\n=== Testing Natural Key Upsert ===')
+    os.makedirs('data', exist_ok=True)
+    conn = sqlite3.connect('data/m4_performance.db')
+    conn.execute("CREATE TABLE performance (id INTEGER PRIMARY KEY AUTOINCREMENT, emp_id TEXT, year INTEGER, rating TEXT, score REAL, updated_at TIMESTAMP)")
+    conn.executemany("INSERT INTO performance (emp_id, year, rating, score) VALUES (?, ?, ?, ?)",
+                     [('E001', 2023, 'A', 90), ('E001', 2023, 'B', 80), ('E001', 2022, 'A', 95), ('E002', 2023, 'C', 60)])
+    conn.commit()
+    conn.close()
+
+    db = DBManagerMultiUser('m4_performance', user_id=None)
+    rows = db.get_performance_history('E001')
+    assert [(r['year'], r['rating']) for r in rows] == [(2023, 'B'), (2022, 'A')], rows
+    print('OK - Legacy duplicates collapsed to the latest row')
+
+    db = DBManagerMultiUser('m4_performance', user_id=1)
+    df = pd.DataFrame({'emp_id': ['E001', 'E002', 'E003'], 'year': [2023, 2023, 2023],
+                       'rating': ['A', 'B', 'C'], 'score': [90, 80, 70]})
+    assert db.import_performance_data(df)['success']
+    first = {r['emp_id']: r for r in db.get_all_records('performance')}
+    df.loc[1, 'score'] = 85
+    assert db.import_performance_data(df)['success']
+    second = {r['emp_id']: r for r in db.get_all_records('performance')}
+    assert len(second) == 3 and db.count_records('performance') == 3
+    assert second['E002']['score'] == 85 and second['E002']['id'] == first['E002']['id']
+    assert second['E001']['updated_at'] == first['E001']['updated_at']
+    print('OK - Re-import updates changed rows in place and skips unchanged ones')
+
+    DBManagerMultiUser('m4_performance', user_id=2).add_performance_record('E001', 2023, 'C', 10)
+    db.add_performance_record('E001', 2023, 'S', 99)
+    assert [r['rating'] for r in db.get_performance_history('E001')] == ['S']
+    assert [r['rating'] for r in db.get_performance_history('E001', user_id=2)] == ['C']
+
+    training = DBManagerMultiUser('m4_training', user_id=1)
+    for hours in (3, 4):
+        training.add_training_record('E001', '新人訓', '必修', hours, '2024-01-01')
+    training.add_training_record('E001', '新人訓', '必修', 2, '2024-06-01')
+    assert [r['hours'] for r in training.get_training_history('E001')] == [2, 4]
+    print('OK - Natural keys scoped per user')
+
+
+@_in_temp_dir
+def test_incremental_import():
+    """測試增量匯入：依內容雜湊只寫入新增、變更與刪除的資料"""
+    print('\n=== Testing Incremental Import ===')
+
+    db = DBManagerMultiUser('m5_qualification', user_id=1)
+    other = DBManagerMultiUser('m5_qualification', user_id=2)
+    other.import_performance_data(pd.DataFrame({'emp_id': ['X001'], 'year': [2023], 'score': [50]}))
+
+    roster = pd.DataFrame({
+        'emp_id': ['E001', 'E002', 'E003', 'E004'],
+        'name': ['王小明', '陳小華', '李大同', '林小美'],
+        'department': ['研發部', '業務部', '研發部', '人資部'],
+    })
+    result = db.import_employee_data(roster, incremental=True)
+    assert (result['added'], result['changed'], result['unchanged'], result['removed']) == (4, 0, 0, 0), result
+
+    result = db.import_employee_data(roster, incremental=True)
+    assert (result['added'], result['changed'], result['unchanged'], result['removed']) == (0, 0, 4, 0), result
+    assert result['count'] == 0
+    print('OK - Unchanged re-upload writes nothing')
+
+    updated = roster[roster['emp_id'] != 'E004'].copy()
+    updated.loc[updated['emp_id'] == 'E002', 'department'] = '財務部'
+    updated = pd.concat([updated, pd.DataFrame({'emp_id': ['E005'], 'name': ['張新人']})], ignore_index=True)
+    result = db.import_employee_data(updated, incremental=True)
+    assert (result['added'], result['changed'], result['unchanged'], result['removed']) == (1, 1, 2, 1), result
+    employees = {e['emp_id']: e for e in db.get_all_employees()}
+    assert sorted(employees) == ['E001', 'E002', 'E003', 'E005']
+    assert employees['E002']['department'] == '財務部'
+    print('OK - Added, changed and removed rows applied')
+
+    # 完整匯入也會寫入 row_hash，之後的增量匯入可以直接比對
+    perf = pd.DataFrame({'emp_id': ['E001', 'E002'], 'year': [2023, 2023], 'score': [90, 80]})
+    db.import_performance_data(perf)
+    result = db.import_performance_data(perf.assign(score=[90, 85]), incremental=True)
+    assert (result['added'], result['changed'], result['unchanged'], result['removed']) == (0, 1, 1, 0), result
+    assert db.count_records('performance') == 2
+    assert other.count_records('performance') == 1
+
+    reminders = pd.DataFrame({'emp_id': ['E001'], 'reminder_type': ['其他'],
+                              'created_date': ['2024-01-01'], 'due_date': ['2024-02-01']})
+    result = DBManagerMultiUser('m6_reminders', user_id=1).bulk_import('reminders', reminders, incremental=True)
+    assert not result['success'] and '增量' in result['error'], result
+    print('OK - Incremental import scoped per user after a full import')
+
+
+@_in_temp_dir
+def test_employee_summary():
+    """測試觸發器維護的員工歷程摘要：回填舊資料、新增、更新、刪除，並依使用者分開"""
+    print('\n=== Testing Employee Summary ===')
+    os.makedirs('data', exist_ok=True)
+    conn = sqlite3.connect('data/m5_qualification.db')
+    conn.execute("CREATE TABLE performance (id INTEGER PRIMARY KEY AUTOINCREMENT, emp_id TEXT, year INTEGER, rating TEXT, score REAL, updated_at TIMESTAMP)")
+    conn.executemany("INSERT INTO performance (emp_id, year, rating, score) VALUES (?, ?, ?, ?)",
+                     [('E001', 2022, 'A', 90), ('E001', 2023, 'C', 60), ('E002', 2023, 'B', None)])
+    conn.commit()
+    conn.close()
+
+    db = DBManagerMultiUser('m5_qualification', user_id=None)
+    summary = db.get_summary_many(['E001', 'E002', 'E404'])
+    assert summary['E404'] is None
+    assert (summary['E001']['performance_count'], summary['E001']['low_rating_count']) == (2, 1)
+    assert summary['E001']['avg_score'] == 75 and summary['E002']['avg_score'] is None
+    print('OK - Legacy history backfilled')
+
+    db = DBManagerMultiUser('m5_qualification', user_id=1)
+    db.add_performance_record('E001', 2023, 'A', 80)
+    db.add_performance_record('E001', 2024, 'D', 40)
+    db.add_performance_record('E001', 2024, 'B', 70)  # 同一年度：更新既有記錄
+    db.add_training_record('E001', '新人訓', '必修', 3, '2024-01-01')
+    db.add_training_record('E001', '資安', '必修', 1.5, '2024-02-01')
+    db.add_separation_record('E001', '2023-01-31', '自願離職', '進修')
+    db.add_separation_record('E001', '2024-06-30', '開除', '違紀', blacklist=True)
+    DBManagerMultiUser('m5_qualification', user_id=2).add_performance_record('E001', 2024, 'E', 10)
+
+    summary = db.get_summary_many(['E001'])['E001']
+    assert (summary['performance_count'], summary['low_rating_count'], summary['avg_score']) == (2, 0, 75)
+    assert (summary['training_count'], summary['training_hours']) == (2, 4.5)
+    assert summary['separation_count'] == 2
+    assert (summary['separation_date'], summary['separation_type'], summary['blacklist']) == ('2024-06-30', '開除', 1)
+    print('OK - Inserts and upserts maintain the summary per user')
+
+    db.delete_by_emp_id('E001', 'separation')
+    summary = db.get_summary_many(['E001'])['E001']
+    assert summary['separation_count'] == 0 and summary['separation_type'] is None
+    other = DBManagerMultiUser('m5_qualification', user_id=2).get_summary_many(['E001'])['E001']
+    assert (other['performance_count'], other['low_rating_count']) == (1, 1)
+    print('OK - Deletes update the summary')
+
+
+@_in_temp_dir
+def test_row_counters():
+    """測試觸發器維護的資料列計數：回填舊資料、新增、取代、刪除、狀態變更，並依使用者分開"""
+    print('\n=== Testing Row Counters ===')
+    os.makedirs('data', exist_ok=True)
+    conn = sqlite3.connect('data/m5_qualification.db')
+    conn.execute("CREATE TABLE performance (id INTEGER PRIMARY KEY AUTOINCREMENT, emp_id TEXT, year INTEGER, rating TEXT, score REAL, updated_at TIMESTAMP)")
+    conn.executemany("INSERT INTO performance (emp_id, year) VALUES (?, ?)", [('E001', 2022), ('E001', 2023)])
+    conn.commit()
+    conn.close()
+
+    legacy = DBManagerMultiUser('m5_qualification', user_id=None)
+    assert legacy.get_database_stats()['performance_records'] == 2
+    print('OK - Legacy rows backfilled')
+
+    db = DBManagerMultiUser('m5_qualification', user_id=1)
+    other = DBManagerMultiUser('m5_qualification', user_id=2)
+    roster = pd.DataFrame({'emp_id': ['E001', 'E002', 'E003'], 'name': ['王小明', '陳小華', '李大同'],
+                           'status': ['active', 'active', 'inactive']})
+    db.import_employee_data(roster)
+    db.import_employee_data(roster)  # INSERT OR REPLACE 不可重複計數
+    db.add_performance_record('E001', 2023, 'A', 90)
+    db.add_performance_record('E001', 2023, 'B', 80)
+    other.add_performance_record('X001', 2023, 'A', 90)
+    assert db.get_database_stats() == {'active_employees': 2, 'performance_records': 1,
+                                       'training_records': 0, 'separation_records': 0}
+    assert other.get_database_stats()['performance_records'] == 1
+    assert legacy.get_database_stats(user_id=None)['performance_records'] == 4
+    print('OK - Counters scoped per user')
+
+    db.delete_employee('E001')
+    db.add_employee('E003', '李大同', status='active')
+    db.delete_by_emp_id('E001', 'performance')
+    stats = db.get_database_stats()
+    assert (stats['active_employees'], stats['performance_records']) == (2, 0), stats
+
+    conn = sqlite3.connect('data/m5_qualification.db')
+    counted = conn.execute("SELECT name, user_id, count FROM row_counts ORDER BY name, user_id").fetchall()
+    actual = conn.execute("""SELECT 'employees', user_id, COUNT(*) FROM employees GROUP BY user_id
+                             UNION ALL SELECT 'performance', user_id, COUNT(*) FROM performance GROUP BY user_id""").fetchall()
+    conn.close()
+    assert {row for row in counted if row[0] in ('employees', 'performance') and row[2]} == set(actual), counted
+    print('OK - Counters follow deletes and status changes')
+
+
+@_in_temp_dir
+def test_bulk_delete_and_status():
+    """測試批次刪除（含歷程連帶刪除）與批次更新狀態：單一交易，依使用者分開"""
+    print('\n=== Testing Bulk Delete And Status Update ===')
+    db = DBManagerMultiUser('m5_qualification', user_id=1)
+    other = DBManagerMultiUser('m5_qualification', user_id=2)
+    emp_ids = [f'E{i:04d}' for i in range(1200)]
+    db.import_employee_data(pd.DataFrame({'emp_id': emp_ids, 'name': emp_ids}))
+    db.import_performance_data(pd.DataFrame({'emp_id': emp_ids, 'year': 2023, 'rating': 'A', 'score': 90}))
+    other.add_performance_record('E0000', 2023, 'A', 90)
+
+    result = db.update_status_many('employees', emp_ids[:700], 'inactive')
+    assert result == {'success': True, 'count': 700}, result
+    assert db.get_database_stats()['active_employees'] == 500
+
+    result = db.delete_many('employees', emp_ids[:1000] + ['E404'])
+    assert result == {'success': True, 'count': 1000}, result
+    assert db.count_records('employees') == 200 and db.count_records('performance') == 200
+    assert other.get_summary_many(['E0000'])['E0000']['performance_count'] == 1
+    print('OK - Employees and their history deleted in one call')
+
+    reminders = DBManagerMultiUser('m6_reminders', user_id=1)
+    for i in range(5):
+        reminders.add_reminder(f'E{i}', f'員工{i}', '試用期', '2024-01-01', '2024-02-01')
+    ids = [r['id'] for r in reminders.get_reminders_by_range('2024-01-01', '2024-12-31')]
+    assert reminders.update_status_many('reminders', ids[:3], 'completed')['count'] == 3
+    assert reminders.get_database_stats()['pending_reminders'] == 2
+    assert reminders.update_status_many('reminders', ids[:1], 'pending')['count'] == 1
+    assert reminders.delete_many('reminders', ids[3:])['count'] == 2
+    rows = reminders.get_reminders_by_range('2024-01-01', '2024-12-31')
+    assert [(r['status'], r['completed_date'] is None) for r in rows] == [
+        ('pending', True), ('completed', False), ('completed', False)], rows
+    assert not reminders.update_status_many('performance', ids, 'x')['success']
+    print('OK - Reminders completed and deleted in bulk')
+
+    other_reminders = DBManagerMultiUser('m6_reminders', user_id=2)
+    other_reminders.add_reminder('E9', '外部人員', '試用期', '2024-01-01', '2024-02-01')
+    other_id = other_reminders.get_reminders_by_range('2024-01-01', '2024-12-31')[0]['id']
+    other_reminders.update_status_many('reminders', [other_id], 'completed')
+    assert reminders.count_reminders_by_status('completed') == 2
+    assert other_reminders.count_reminders_by_status('completed') == 1
+    print('OK - Reminder counts by status only include the current user')
+
+    assert reminders.delete_by_status('completed') == {'success': True, 'count': 2}
+    assert reminders.count_reminders_by_status('completed') == 0
+    assert other_reminders.count_reminders_by_status('completed') == 1
+    print('OK - Deleting by status leaves other users\' reminders')
+
+
+@_in_temp_dir
+def test_tenant_purge_and_vacuum():
+    """測試依使用者清空資料、背景 incremental_vacuum 縮小檔案，以及舊檔案由全量重整轉換"""
+    print('\n=== Testing Tenant Purge And Vacuum ===')
+    os.makedirs('data', exist_ok=True)
+    conn = sqlite3.connect('data/m4_employees.db')
+    conn.execute("CREATE TABLE employees (emp_id TEXT PRIMARY KEY, name TEXT NOT NULL, id_number_hash TEXT, department TEXT, hire_date DATE, status TEXT DEFAULT 'active', updated_at TIMESTAMP)")
+    conn.execute("INSERT INTO employees (emp_id, name) VALUES ('E001', '王小明')")
+    conn.commit()
+    conn.close()
+
+    db = DBManagerMultiUser('m4_employees', user_id=1)
+    assert get_schema_version(db.db_path) == SCHEMA_VERSION
+    check = sqlite3.connect(db.db_path)
+    assert check.execute("PRAGMA auto_vacuum").fetchone()[0] == 0
+    check.close()
+    assert db.compact()['success']
+    check = sqlite3.connect(db.db_path)
+    assert check.execute("PRAGMA auto_vacuum").fetchone()[0] == 2
+    assert [e['emp_id'] for e in DBManagerMultiUser('m4_employees').search_employee('王小明')] == ['E001']
+    print('OK - Legacy file left as is on open, converted to auto_vacuum=INCREMENTAL by compact()')
+
+    other = DBManagerMultiUser('m4_employees', user_id=2)
+    other.add_employee('X001', '陳小華')
+    emp_ids = [f'E{i:05d}' for i in range(20000)]
+    assert db.import_employee_data(pd.DataFrame({'emp_id': emp_ids, 'name': emp_ids, 'department': '研發部' * 20}))['success']
+    db.reclaim_space().result()
+    size_full = os.path.getsize(db.db_path)
+
+    assert db.clear_all_data()
+    free_pages = db.reclaim_space().result()
+    assert free_pages == 0
+    assert os.path.getsize(db.db_path) < size_full / 4, (size_full, os.path.getsize(db.db_path))
+    assert db.count_records('employees') == 0
+    assert [e['emp_id'] for e in other.get_all_employees()] == ['X001']
+    assert check.execute("SELECT COUNT(*) FROM employees WHERE user_id IS NULL").fetchone()[0] == 1
+    check.close()
+    print('OK - Purge removes only the tenant\'s rows and the file shrinks')
+
+    result = db.compact()
+    assert result['success'] and result['size_after'] <= result['size_before'], result
+    assert [e['emp_id'] for e in other.search_employee('陳小華')] == ['X001']
+    print('OK - Full compaction keeps the search index in sync')
+
+
+@_in_temp_dir
+def test_query_stats():
+    """測試查詢量測：依方法與使用者彙總、百分位數、慢查詢紀錄與查詢計畫"""
+    print('\n=== Testing Query Stats ===')
+    db = DBManagerMultiUser('m5_qualification', user_id=7)
+    db.import_employee_data(pd.DataFrame({'emp_id': ['E001', 'E002'], 'name': ['王小明', '陳小華']}))
+
+    query_stats.reset()
+    db.get_performance_history('E001')
+    assert query_stats.sample_rate == 0 and query_stats.summary() == []
+    print('OK - Instrumentation off unless HR_QUERY_STATS is set')
+
+    slow_ms, sample_rate = query_stats.slow_ms, query_stats.sample_rate
+    query_stats.slow_ms, query_stats.sample_rate = 0, 1
+    try:
+        for emp_id in ('E001', 'E002', 'E003'):
+            db.get_performance_history(emp_id)
+        conn = db._get_connection()
+        assert len(conn.execute("SELECT * FROM employees WHERE name LIKE '%小%'").fetchall()) == 2
+        conn.close()
+        db.add_employee('E003', '林小美', user_id=8)
+    finally:
+        query_stats.slow_ms, query_stats.sample_rate = slow_ms, sample_rate
+
+    by_method = {item['method']: item for item in query_stats.summary()}
+    history = by_method['DBManagerMultiUser.get_performance_history']
+    assert history['count'] == 3 and history['users'] == [7] and history['rows'] == 0
+    assert by_method['DBManagerMultiUser.add_employee']['users'] == [8]
+    assert history['p50_ms'] <= history['p95_ms'] <= history['p99_ms'] <= history['max_ms']
+    assert not history['full_scan'] and 'USING INDEX' in history['plan'][0], history['plan']
+    scan = by_method['test_query_stats']
+    assert scan['rows'] == 2 and scan['full_scan'], scan
+    print('OK - Queries grouped per calling method with percentiles and plans')
+
+    slow_methods = [entry['method'] for entry in query_stats.slow_queries()]
+    assert slow_methods.count('DBManagerMultiUser.get_performance_history') == 3
+    assert 'test_query_stats' in slow_methods and 'DBManagerMultiUser.add_employee' in slow_methods
+    with open('data/slow_queries.jsonl', encoding='utf-8') as f:
+        logged = [json.loads(line) for line in f]
+    assert [entry['method'] for entry in logged] == list(reversed(slow_methods))
+    with open(query_stats.dump(), encoding='utf-8') as f:
+        assert len(f.readlines()) == len(query_stats.summary())
+    print('OK - Slow queries logged and summary dumped as JSONL')
+
+
+@_in_temp_dir
+def test_db_snapshot():
+    """測試唯讀記憶體快照：只含該使用者的資料、結果與磁碟一致、資料有變更才重新建立"""
+    print('\n=== Testing DB Snapshot ===')
+    from modules.m5_qualification_check import QualificationChecker
+    from core.db_snapshot import DBSnapshot
+
+    db = DBManagerMultiUser('m5_qualification', user_id=1)
+    emp_ids = [f'E{i:03d}' for i in range(10)]
+    db.import_employee_data(pd.DataFrame({'emp_id': emp_ids, 'name': [f'員工{i}' for i in range(10)]}))
+    db.import_performance_data(pd.DataFrame({'emp_id': emp_ids, 'year': 2023, 'rating': ['A', 'C'] * 5, 'score': 80}))
+    db.add_separation_record('E001', '2024-06-30', '開除', '違紀', blacklist=True)
+    DBManagerMultiUser('m5_qualification', user_id=2).add_employee('X001', '其他人')
+
+    snapshot = DBSnapshot('m5_qualification', user_id=1)
+    checker = QualificationChecker(user_id=1)
+    cached = QualificationChecker(user_id=1, snapshot=True)
+    employees = db.get_all_employees()
+    for _ in range(3):
+        batch = cached.check_many(employees)
+    for emp in employees:
+        expected = checker.check(emp['name'])
+        actual = cached.check(emp['name'])
+        assert [c['detail'] for c in actual['checks']] == [c['detail'] for c in expected['checks']]
+        assert batch[emp['emp_id']]['overall_status'] == expected['overall_status']
+    assert cached.db_employees.refreshes == 1
+    assert cached.check('其他人')['overall_status'] == 'NOT_FOUND'
+    print('OK - Repeated checks served from one snapshot with the same results')
+
+    query_stats.reset()
+    query_stats.sample_rate = 1
+    try:
+        cached.check('員工1')
+    finally:
+        query_stats.sample_rate = 0
+    summary_reads = sum(item['count'] for item in query_stats.summary() if 'employee_summary' in item['sql'])
+    assert summary_reads == 1, query_stats.summary()
+    print('OK - A single check reads the employee summary once')
+
+    db.add_performance_record('E000', 2024, 'E', 20)
+    result = cached.check('員工0')
+    assert result['overall_status'] == 'REVIEW_REQUIRED' and cached.db_employees.refreshes == 2
+    assert not snapshot.add_employee('E999', '快照')
+    assert snapshot.get_all_employees()[-1]['emp_id'] == 'E009'
+    snapshot.close()
+    print('OK - Snapshot refreshed after a write and stays read-only')
+
+
+@_in_temp_dir
+def test_chunked_import():
+    """測試分段匯入：多個 DataFrame 段落寫入同一交易，任一段失敗全部回復"""
+    print('\n=== Testing Chunked Import ===')
+    db = DBManagerMultiUser('m5_qualification', user_id=1)
+    training = pd.DataFrame({'工號': [f'E{i:03d}' for i in range(250)],
+                             '課程名稱': [f'課程{i % 7}' for i in range(250)], '時數': 2.5})
+    training.loc[10, '工號'] = None
+
+    chunks = (training.iloc[start:start + 100] for start in range(0, len(training), 100))
+    result = db.import_training_data(chunks)
+    assert result == {'success': True, 'count': 249, 'skipped': 1}, result
+    assert db.fetch_frame("SELECT COUNT(*) AS n, SUM(hours) AS hours FROM training").iloc[0].tolist() == [249, 622.5]
+    print('OK - Chunks imported with skipped rows counted across chunks')
+
+    def failing_chunks():
+        yield training.iloc[:100].assign(工號=lambda df: df['工號'] + 'X')
+        raise OSError('讀取中斷')
+
+    result = db.import_training_data(failing_chunks())
+    assert not result['success'] and '讀取中斷' in result['error'], result
+    assert db.fetch_frame("SELECT COUNT(*) AS n FROM training").iloc[0, 0] == 249
+    assert not db.import_training_data(iter([training]), incremental=True)['success']
+    print('OK - A failing chunk rolls back the whole import; incremental needs the full frame')
+
+
+if __name__ == '__main__':
+    test_connection_pool()
+    test_bulk_import()
+    test_schema_migration()
+    test_db_registry()
+    test_batch_fetch()
+    test_search_index()
+    test_pagination()
+    test_fetch_frame()
+    test_write_queue()
+    test_query_cache()
+    test_cross_process_cache()
+    test_attached_queries()
+    test_natural_key_upsert()
+    test_incremental_import()
+    test_employee_summary()
+    test_row_counters()
+    test_bulk_delete_and_status()
+    test_tenant_purge_and_vacuum()
+    test_query_stats()
+    test_db_snapshot()
+    test_chunked_import()
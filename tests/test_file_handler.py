@@ -0,0 +1,199 @@
+# -*- coding: utf-8 -*-
+"""
+上傳檔案讀取測試（解析結果快取）
+"""
+import sys
+import os
+import io
+import tempfile
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+import pandas as pd
+from core.data_processor import DataProcessor
+from utils.encoding import sniff_encoding
+from utils.file_handler import FileHandler, ParsedFileCache, parsed_file_cache
+
+
+class _Upload(io.BytesIO):
+    """模擬 Streamlit UploadedFile（有 name 與 getvalue）"""
+
+    def __init__(self, name, data):
+        super().__init__(data)
+        self.name = name
+
+
+def _in_temp_dir(func):
+    """在暫存目錄執行測試，避免暫存檔寫到 data/"""
+    def wrapper():
+        cwd = os.getcwd()
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            try:
+                func()
+            finally:
+                parsed_file_cache.clear()
+                os.chdir(cwd)
+    wrapper.__name__ = func.__name__
+    return wrapper
+
+
+def _excel_bytes(df):
+    buffer = io.BytesIO()
+    df.to_excel(buffer, index=False)
+    return buffer.getvalue()
+
+
+@_in_temp_dir
+def test_parsed_file_cache():
+    """測試相同內容的上傳重用解析結果，且回傳的是可修改的副本"""
+    print('\n=== Testing Parsed File Cache ===')
+    source = pd.DataFrame({'工號': ['E001', 'E002'], '姓名': ['王小明', '陳小華'], '分數': [90, 85]})
+    data = _excel_bytes(source)
+    stats = parsed_file_cache.stats()
+
+    first = FileHandler.load_file(_Upload('a.xlsx', data))
+    first.loc[0, '姓名'] = '已修改'
+    second = FileHandler.load_file(_Upload('renamed.xlsx', data))
+    assert second.equals(source), second
+    assert parsed_file_cache.stats()['hits'] == stats['hits'] + 1
+    print('OK - Same content parsed once, callers get independent copies')
+
+    header_only = FileHandler.load_file(_Upload('a.xlsx', data), nrows=1)
+    assert len(header_only) == 1
+    changed = source.assign(分數=[60, 70])
+    assert FileHandler.load_file(_Upload('a.xlsx', _excel_bytes(changed))).equals(changed)
+    print('OK - Read options and content changes miss the cache')
+
+
+@_in_temp_dir
+def test_cache_spill():
+    """測試記憶體上限：被淘汰的結果溢出到 Parquet 暫存檔並可讀回"""
+    print('\n=== Testing Cache Spill ===')
+    cache = ParsedFileCache(max_bytes=100_000, spill_dir='upload_cache')
+    frames = {f'f{i}': pd.DataFrame({'emp_id': [f'E{i}{j:05d}' for j in range(2000)], 'hours': float(i)})
+              for i in range(3)}
+    for name, df in frames.items():
+        cache.put((name, ''), df)
+
+    stats = cache.stats()
+    assert stats['bytes'] <= 100_000 and stats['spilled'] >= 1, stats
+    assert len(os.listdir('upload_cache')) == stats['spilled']
+    for name, df in frames.items():
+        assert cache.get((name, '')).equals(df), name
+    assert cache.get(('missing', '')) is None
+    cache.clear()
+    assert os.listdir('upload_cache') == []
+    print('OK - Evicted frames spilled to Parquet and read back')
+
+
+@_in_temp_dir
+def test_probe():
+    """測試只讀取標題列與樣本：欄名、型別與完整讀取一致，並預估筆數"""
+    print('\n=== Testing Header Probe ===')
+    source = pd.DataFrame({'工號': [f'E{i:05d}' for i in range(3000)], '分數': range(3000),
+                           '到職日': pd.Timestamp('2024-01-01'), '備註': None})
+    source.columns = ['工號', '分數', '到職日', '工號']
+    upload = _Upload('emp.xlsx', _excel_bytes(source))
+
+    probe = FileHandler.probe(upload, sample_rows=5)
+    assert upload.tell() == 0
+    full = FileHandler.load_file(upload, use_cache=False)
+    assert probe['columns'] == full.columns.tolist() == ['工號', '分數', '到職日', '工號.1'], probe['columns']
+    assert probe['dtypes']['分數'] == 'int64' and probe['dtypes']['到職日'].startswith('datetime64'), probe['dtypes']
+    assert probe['sample'].iloc[:, :3].equals(full.head(5).iloc[:, :3])
+    assert probe['estimated_rows'] == 3000 and not probe['exact']
+    print('OK - Excel header matches the full read, row count from sheet dimension')
+
+    csv = _Upload('emp.csv', source.to_csv(index=False).encode('big5'))
+    probe = FileHandler.probe(csv, sample_rows=5, sample_bytes=4096)
+    assert probe['columns'] == ['工號', '分數', '到職日', '工號.1'] and len(probe['sample']) == 5
+    assert abs(probe['estimated_rows'] - 3000) < 300 and not probe['exact'], probe['estimated_rows']
+    small = FileHandler.probe(_Upload('small.csv', '工號,姓名\nE001,王小明\nE002,陳小華\n'.encode('utf-8-sig')))
+    assert small['columns'] == ['工號', '姓名'] and small['estimated_rows'] == 2 and small['exact']
+    print('OK - CSV probed from the first bytes, Big5 and BOM handled')
+
+
+@_in_temp_dir
+def test_iter_chunks():
+    """測試分段讀取：各段合起來與完整讀取相同，並可逐段清洗後寫成 CSV"""
+    print('\n=== Testing Chunked Reader ===')
+    source = pd.DataFrame({'工號': [f'E{i % 900:04d}' for i in range(1000)], '時數': [i % 9 for i in range(1000)],
+                           '備註': [' 線上 ' if i % 2 else '實體' for i in range(1000)]})
+
+    for upload in (_Upload('train.xlsx', _excel_bytes(source)),
+                   _Upload('train.csv', source.to_csv(index=False).encode('big5'))):
+        chunks = list(FileHandler.iter_chunks(upload, chunksize=300))
+        assert [len(chunk) for chunk in chunks] == [300, 300, 300, 100], upload.name
+        assert pd.concat(chunks).equals(FileHandler.load_file(upload)), upload.name
+    print('OK - Excel and CSV chunks match the full read')
+
+    steps = [{'action': 'trim_whitespace', 'column': '備註'},
+             {'action': 'remove_duplicates', 'subset': ['工號'], 'keep': 'first'},
+             {'action': 'drop_column', 'column': '時數'}]
+    cleaned = DataProcessor.clean_chunks(FileHandler.iter_chunks(upload, chunksize=300), steps)
+    output, rows = FileHandler.chunks_to_csv(cleaned)
+
+    expected = DataProcessor(source)
+    for step in steps:
+        expected.apply_cleaning_step(step)
+    result = pd.read_csv(output, encoding='utf-8-sig')
+    assert rows == 900 and result.equals(expected.df.reset_index(drop=True)), result
+    print('OK - Cleaning steps streamed chunk by chunk, duplicates removed across chunks')
+
+    # 各段各自推斷型別：同一列在 int64 段與含 NaN 的 float64 段仍視為重複
+    chunks = [pd.DataFrame({'id': [1, 2], 'v': [10, 20]}), pd.DataFrame({'id': [1, 3], 'v': [10, None]})]
+    streamed = pd.concat(DataProcessor.clean_chunks(chunks, [{'action': 'remove_duplicates'}]))
+    assert streamed.equals(pd.concat(chunks).drop_duplicates()), streamed
+    print('OK - Duplicates detected across chunks with different dtypes')
+
+
+@_in_temp_dir
+def test_encoding_sniffer():
+    """測試編碼偵測：BOM、UTF-8、CP950、UTF-16，CSV 只解析一次；混用編碼改以轉碼讀取"""
+    print('\n=== Testing Encoding Sniffer ===')
+    text = '工號,姓名,部門\nE001,王小明,資訊部\nE002,陳小華,人資部\n'
+    assert sniff_encoding(text.encode('utf-8-sig')) == 'utf-8-sig'
+    assert sniff_encoding(text.encode('utf-16')) == 'utf-16'
+    assert sniff_encoding('emp_id,name\nE001,Amy\n'.encode('utf-16-le')) == 'utf-16-le'
+    assert sniff_encoding(text.encode('utf-8')[:-5]) == 'utf-8'
+    assert sniff_encoding(text.encode('cp950'), complete=True) == 'cp950'
+    assert sniff_encoding(text.encode('utf-8') + text.encode('cp950'), complete=True) is None
+    print('OK - BOM, UTF-16, truncated UTF-8, CP950 and mixed samples detected')
+
+    expected = pd.DataFrame({'工號': ['E001', 'E002'], '姓名': ['王小明', '陳小華'], '部門': ['資訊部', '人資部']})
+    calls = []
+    read_csv = pd.read_csv
+    pd.read_csv = lambda *args, **kwargs: calls.append(kwargs.get('encoding')) or read_csv(*args, **kwargs)
+    try:
+        for encoding in ('utf-8', 'utf-8-sig', 'cp950', 'utf-16'):
+            upload = _Upload('emp.csv', text.encode(encoding))
+            upload.read()  # 已被讀過的上傳物件
+            calls.clear()
+            assert FileHandler.load_file(upload, use_cache=False).equals(expected), encoding
+            assert len(calls) == 1, (encoding, calls)
+    finally:
+        pd.read_csv = read_csv
+    print('OK - Each encoding parsed once, uploads rewound')
+
+    rows = pd.DataFrame({'工號': [f'E{i:05d}' for i in range(6000)], '姓名': '王小明', '部門': '資訊部'})
+    mixed = (rows.iloc[:4000].to_csv(index=False).encode('utf-8')
+             + rows.iloc[4000:].to_csv(index=False, header=False).encode('cp950'))
+    upload = _Upload('mixed.csv', mixed)
+    pd.read_csv = lambda *args, **kwargs: calls.append(kwargs.get('encoding')) or read_csv(*args, **kwargs)
+    try:
+        calls.clear()
+        assert FileHandler.load_file(upload, use_cache=False).equals(rows)
+        assert len(calls) == 1, calls
+    finally:
+        pd.read_csv = read_csv
+    assert pd.concat(FileHandler.iter_chunks(upload, chunksize=2500)).equals(rows)
+    assert FileHandler.probe(upload)['columns'] == ['工號', '姓名', '部門']
+    print('OK - Mixed UTF-8 / CP950 file parsed once through the transcoder')
+
+
+if __name__ == '__main__':
+    test_parsed_file_cache()
+    test_cache_spill()
+    test_probe()
+    test_iter_chunks()
+    test_encoding_sniffer()
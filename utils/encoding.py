@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""
+CSV 編碼偵測與轉碼讀取
+
+sniff_encoding() 只看檔案開頭的位元組樣本決定編碼，不需要先整份解析失敗再重讀：
+- BOM：UTF-8 / UTF-16
+- 沒有 BOM 的 UTF-16：ASCII 字元的高位元組為 0，奇數或偶數位置會出現大量 NUL
+- UTF-8 是否有效（樣本結尾被截斷的多位元組字元不算錯誤）
+- 繁體中文 Windows 匯出的 CP950（Big5 的擴充），再來是 Big5-HKSCS
+
+同一份檔案混用多種編碼時（例如合併多個來源的 CSV），TranscodingReader 以區塊解碼，
+區塊無法以主要編碼解碼時才逐列改用其他編碼，整份檔案仍只讀取一次。
+"""
+
+import io
+import codecs
+
+
+# 沒有 BOM 時依序嘗試的編碼
+CANDIDATE_ENCODINGS = ('utf-8', 'cp950', 'big5hkscs')
+
+_BOMS = (
+    (codecs.BOM_UTF8, 'utf-8-sig'),
+    (codecs.BOM_UTF16_LE, 'utf-16'),
+    (codecs.BOM_UTF16_BE, 'utf-16'),
+)
+
+
+def _decodes(sample, encoding, final):
+    """sample 能否以 encoding 解碼（final=False 時結尾不完整的字元不算錯誤）"""
+    try:
+        codecs.getincrementaldecoder(encoding)().decode(sample, final=final)
+        return True
+    except UnicodeDecodeError:
+        return False
+
+
+def _utf16_without_bom(sample):
+    """ASCII 為主的 UTF-16 文字：高位元組（LE 在奇數位置、BE 在偶數位置）幾乎都是 0"""
+    pairs = len(sample) // 2
+    if pairs < 4:
+        return None
+    even_zeros = sample[0:pairs * 2:2].count(0)
+    odd_zeros = sample[1:pairs * 2:2].count(0)
+    if odd_zeros > pairs * 0.2 and even_zeros < pairs * 0.05:
+        return 'utf-16-le'
+    if even_zeros > pairs * 0.2 and odd_zeros < pairs * 0.05:
+        return 'utf-16-be'
+    return None
+
+
+def sniff_encoding(sample, complete=False):
+    """
+    依位元組樣本判斷編碼
+
+    Args:
+        sample: 檔案開頭的位元組
+        complete: sample 是否為整份檔案（否則忽略結尾被截斷的字元）
+
+    Returns:
+        編碼名稱；樣本中混用多種編碼或無法判斷時回傳 None（改用 TranscodingReader）
+    """
+    for bom, encoding in _BOMS:
+        if sample.startswith(bom):
+            return encoding
+
+    utf16 = _utf16_without_bom(sample)
+    if utf16:
+        return utf16
+
+    for encoding in CANDIDATE_ENCODINGS:
+        if _decodes(sample, encoding, final=complete):
+            return encoding
+    return None
+
+
+class TranscodingReader(io.TextIOBase):
+    """
+    把位元組串流逐區塊解碼成文字的唯讀檔案物件（可直接交給 pd.read_csv）
+
+    每個區塊（切在換行處）先以第一個編碼解碼；失敗時該區塊逐列嘗試 encodings，
+    都無法解碼的列以第一個編碼解碼並把錯誤位元組取代為 U+FFFD。
+    """
+
+    def __init__(self, raw, encodings=CANDIDATE_ENCODINGS, block_size=1024 * 1024):
+        """
+        Args:
+            raw: 二進位檔案物件（從目前位置開始讀取）
+            encodings: 依序嘗試的編碼，第一個為主要編碼
+            block_size: 每次讀取的位元組數
+        """
+        self._raw = raw
+        self._encodings = tuple(dict.fromkeys(encodings))
+        self._block_size = block_size
+        self._pending = b''
+        self._buffer = ''
+        self._first = True
+        self._eof = False
+        self.fallback_lines = 0
+
+    def readable(self):
+        return True
+
+    def _decode_line(self, line):
+        for encoding in self._encodings:
+            try:
+                return line.decode(encoding)
+            except UnicodeDecodeError:
+                continue
+        return line.decode(self._encodings[0], errors='replace')
+
+    def _decode_block(self, block):
+        try:
+            return block.decode(self._encodings[0])
+        except UnicodeDecodeError:
+            pass
+        lines = block.splitlines(keepends=True)
+        text = []
+        for line in lines:
+            try:
+                text.append(line.decode(self._encodings[0]))
+            except UnicodeDecodeError:
+                self.fallback_lines += 1
+                text.append(self._decode_line(line))
+        return ''.join(text)
+
+    def _fill(self):
+        """讀取下一個區塊並解碼到 _buffer；已讀完時回傳 False"""
+        if self._eof:
+            return False
+        data = self._raw.read(self._block_size)
+        if data:
+            data = self._pending + data
+            cut = data.rfind(b'\n') + 1
+            if cut == 0:
+                self._pending = data
+                return True
+            block, self._pending = data[:cut], data[cut:]
+        else:
+            self._eof = True
+            block, self._pending = self._pending, b''
+        if self._first:
+            self._first = False
+            if block.startswith(codecs.BOM_UTF8):
+                block = block[len(codecs.BOM_UTF8):]
+        self._buffer += self._decode_block(block)
+        return True
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            while self._fill():
+                pass
+            text, self._buffer = self._buffer, ''
+            return text
+        while len(self._buffer) < size and self._fill():
+            pass
+        text, self._buffer = self._buffer[:size], self._buffer[size:]
+        return text
+
+    def readline(self, size=-1):
+        while '\n' not in self._buffer and self._fill():
+            pass
+        end = self._buffer.find('\n') + 1 or len(self._buffer)
+        if size is not None and 0 <= size < end:
+            end = size
+        line, self._buffer = self._buffer[:end], self._buffer[end:]
+        return line
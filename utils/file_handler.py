@@ -1,32 +1,505 @@
 # -*- coding: utf-8 -*-
-import pandas as pd
+"""
+上傳檔案讀取
+
+Streamlit 每次 rerun 都會重新執行 load_file。解析結果依「檔案內容雜湊 + 讀取參數」快取：
+- 內容相同的上傳（即使是不同的 UploadedFile 物件）直接取回已解析的 DataFrame
+- 記憶體中以 LRU 保留，超過上限時被淘汰的結果寫成 Parquet 暫存檔（需要 pyarrow），
+  之後再讀取時從暫存檔載入，不重新解析 Excel / CSV
+
+欄位對應畫面只需要欄位名稱時以 probe() 讀取標題列與少量樣本（Excel 以唯讀模式讀前幾列、
+CSV 只讀前幾 KB），完整讀取延後到使用者確認匯入時。
+
+超過記憶體的檔案以 iter_chunks() 分段讀取（CSV 使用 chunksize、Excel 以唯讀模式逐列讀取），
+記憶體用量取決於每段的列數而非檔案大小。
+
+CSV 的編碼由開頭的位元組樣本判斷一次（utils.encoding.sniff_encoding），再經過
+TranscodingReader 以該編碼優先逐區塊解碼，樣本之後才混入其他編碼的檔案也只解析一次。
+"""
+
+import io
 import os
+import codecs
+import atexit
+import hashlib
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from itertools import islice
+
+import pandas as pd
+
+from utils.encoding import CANDIDATE_ENCODINGS, TranscodingReader, sniff_encoding
+
+# 預估筆數超過此值的上傳改以 iter_chunks() 分段處理
+STREAM_ROWS = 200_000
+
+
+def _content_digest(source):
+    """上傳物件或檔案路徑內容的雜湊（不改變上傳物件的讀取位置）"""
+    digest = hashlib.blake2b(digest_size=16)
+    if hasattr(source, 'getvalue'):
+        digest.update(source.getvalue())
+    elif hasattr(source, 'read'):
+        position = source.tell()
+        source.seek(0)
+        for block in iter(lambda: source.read(1024 * 1024), b''):
+            digest.update(block)
+        source.seek(position)
+    else:
+        with open(source, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def _source_size(source):
+    """上傳物件或檔案路徑的位元組數"""
+    if hasattr(source, 'getvalue'):
+        return len(source.getbuffer()) if hasattr(source, 'getbuffer') else len(source.getvalue())
+    if hasattr(source, 'seek'):
+        position = source.tell()
+        size = source.seek(0, os.SEEK_END)
+        source.seek(position)
+        return size
+    return os.path.getsize(source)
+
+
+def _head_bytes(source, size):
+    """讀取開頭 size 個位元組（上傳物件讀完後回到開頭）"""
+    if hasattr(source, 'read'):
+        source.seek(0)
+        data = source.read(size)
+        source.seek(0)
+        return data
+    with open(source, 'rb') as f:
+        return f.read(size)
+
+
+def _csv_encoding(source, sample_bytes=64 * 1024):
+    """依開頭的位元組樣本判斷 CSV 編碼；混用多種編碼時為 None"""
+    head = _head_bytes(source, sample_bytes)
+    return sniff_encoding(head, complete=len(head) < sample_bytes)
+
+
+def _transcoded(encoding):
+    """TranscodingReader 的編碼順序：偵測到的編碼優先（UTF-16 無法逐區塊轉碼時回傳 None）"""
+    if encoding is None:
+        return CANDIDATE_ENCODINGS
+    if encoding.startswith('utf-16'):
+        return None
+    return ('utf-8' if encoding == 'utf-8-sig' else encoding, *CANDIDATE_ENCODINGS)
+
+
+@contextmanager
+def _open_binary(source):
+    """以二進位模式從頭讀取上傳物件或檔案路徑"""
+    if hasattr(source, 'read'):
+        source.seek(0)
+        yield source
+    else:
+        with open(source, 'rb') as f:
+            yield f
+
+
+def _column_names(header):
+    """與 pd.read_excel 相同的欄名：空白標題為 Unnamed: i，重複的標題加上 .1、.2"""
+    names = []
+    counts = {}
+    for idx, value in enumerate(header):
+        name = f'Unnamed: {idx}' if value is None or value == '' else value
+        base = name
+        while name in counts:
+            counts[base] += 1
+            name = f'{base}.{counts[base]}'
+        counts.setdefault(base, 0)
+        counts[name] = 0
+        names.append(name)
+    return names
+
+
+class ParsedFileCache:
+    """已解析上傳檔的 LRU 快取，記憶體不足時溢出到 Parquet 暫存檔"""
+
+    def __init__(self, max_bytes=512 * 1024 * 1024, spill_dir='data/upload_cache', max_spill_bytes=2 * 1024 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: 記憶體中保留的 DataFrame 總大小上限
+            spill_dir: 溢出暫存檔目錄（行程結束時刪除本行程寫入的檔案）；None 表示不溢出
+            max_spill_bytes: 暫存檔總大小上限
+        """
+        self.max_bytes = max_bytes
+        self.spill_dir = spill_dir
+        self.max_spill_bytes = max_spill_bytes
+        self._memory = OrderedDict()  # key -> (DataFrame, size)
+        self._spilled = OrderedDict()  # key -> (path, size)
+        self._size = 0
+        self._spill_size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def key(source, options):
+        """快取鍵：檔案內容雜湊與讀取參數"""
+        return _content_digest(source), repr(sorted(options.items()))
+
+    def get(self, key):
+        """取得已解析的 DataFrame（副本）；不存在時回傳 None"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return entry[0].copy()
+            spilled = self._spilled.pop(key, None)
+            if spilled is None:
+                self.misses += 1
+                return None
+            self._spill_size -= spilled[1]
+
+        try:
+            df = pd.read_parquet(spilled[0])
+        except Exception:
+            with self._lock:
+                self.misses += 1
+            return None
+        finally:
+            self._remove(spilled[0])
+        with self._lock:
+            self.hits += 1
+        self.put(key, df)
+        return df.copy()
+
+    def put(self, key, df):
+        """存入解析結果（呼叫端之後修改 df 不影響快取內容）"""
+        size = int(df.memory_usage(index=True, deep=True).sum())
+        evicted = []
+        with self._lock:
+            old = self._memory.pop(key, None)
+            if old is not None:
+                self._size -= old[1]
+            if size > self.max_bytes:
+                evicted.append((key, df, size))
+            else:
+                self._memory[key] = (df.copy(), size)
+                self._size += size
+                while self._size > self.max_bytes:
+                    evicted_key, (evicted_df, evicted_size) = self._memory.popitem(last=False)
+                    self._size -= evicted_size
+                    evicted.append((evicted_key, evicted_df, evicted_size))
+
+        for evicted_key, evicted_df, _ in evicted:
+            self._spill(evicted_key, evicted_df)
+
+    def _spill(self, key, df):
+        """把被淘汰的結果寫成 Parquet；無法寫入（未安裝 pyarrow、欄位型別混雜）時直接捨棄"""
+        if not self.spill_dir:
+            return
+        path = os.path.join(self.spill_dir, f"{hashlib.blake2b(repr(key).encode(), digest_size=16).hexdigest()}.parquet")
+        try:
+            os.makedirs(self.spill_dir, exist_ok=True)
+            df.to_parquet(path)
+        except Exception:
+            self._remove(path)
+            return
+
+        size = os.path.getsize(path)
+        removed = []
+        with self._lock:
+            self._spilled[key] = (path, size)
+            self._spill_size += size
+            while self._spill_size > self.max_spill_bytes and self._spilled:
+                _, (old_path, old_size) = self._spilled.popitem(last=False)
+                self._spill_size -= old_size
+                removed.append(old_path)
+        for old_path in removed:
+            self._remove(old_path)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def clear(self):
+        """清除記憶體中的結果與暫存檔"""
+        with self._lock:
+            paths = [path for path, _ in self._spilled.values()]
+            self._memory.clear()
+            self._spilled.clear()
+            self._size = 0
+            self._spill_size = 0
+        for path in paths:
+            self._remove(path)
+
+    def stats(self):
+        """快取統計"""
+        with self._lock:
+            return {'entries': len(self._memory), 'bytes': self._size,
+                    'spilled': len(self._spilled), 'spilled_bytes': self._spill_size,
+                    'hits': self.hits, 'misses': self.misses}
+
+
+# 行程共用的快取
+parsed_file_cache = ParsedFileCache()
+atexit.register(parsed_file_cache.clear)
+
 
 class FileHandler:
     @staticmethod
-    def load_file(file_path, **kwargs):
+    def load_file(file_path, use_cache=True, **kwargs):
+        """
+        讀取 Excel / CSV（Streamlit UploadedFile 或檔案路徑）
+
+        Args:
+            file_path: UploadedFile 或檔案路徑
+            use_cache: 依檔案內容與讀取參數重用已解析的結果
+            **kwargs: 傳給 pd.read_excel / pd.read_csv 的參數
+
+        Returns:
+            DataFrame（每次呼叫都是獨立的副本，可自由修改）
+        """
         # Handle Streamlit UploadedFile objects
         if hasattr(file_path, 'name'):
             # It's a Streamlit UploadedFile object
             file_name = file_path.name
-            ext = os.path.splitext(file_name)[1].lower()
-
-            if ext in ['.xlsx', '.xls']:
-                return pd.read_excel(file_path, **kwargs)
-            elif ext == '.csv':
-                try:
-                    return pd.read_csv(file_path, encoding='utf-8', **kwargs)
-                except UnicodeDecodeError:
-                    return pd.read_csv(file_path, encoding='big5', **kwargs)
-            raise ValueError(f"Unsupported file type: {ext}")
         else:
             # It's a regular file path string
-            ext = os.path.splitext(file_path)[1].lower()
-            if ext in ['.xlsx', '.xls']:
-                return pd.read_excel(file_path, **kwargs)
-            elif ext == '.csv':
-                try:
-                    return pd.read_csv(file_path, encoding='utf-8', **kwargs)
-                except UnicodeDecodeError:
-                    return pd.read_csv(file_path, encoding='big5', **kwargs)
+            file_name = file_path
+        ext = os.path.splitext(file_name)[1].lower()
+        if ext not in ['.xlsx', '.xls', '.csv']:
             raise ValueError(f"Unsupported file type: {ext}")
+
+        if not use_cache:
+            return FileHandler._read(file_path, ext, kwargs)
+
+        key = parsed_file_cache.key(file_path, dict(kwargs, ext=ext))
+        df = parsed_file_cache.get(key)
+        if df is None:
+            df = FileHandler._read(file_path, ext, kwargs)
+            parsed_file_cache.put(key, df)
+        return df
+
+    @staticmethod
+    def probe(file_path, sample_rows=20, sample_bytes=64 * 1024):
+        """
+        只讀取標題列與少量樣本，供欄位驗證與欄位對應畫面使用
+
+        Args:
+            file_path: UploadedFile 或檔案路徑
+            sample_rows: 樣本列數
+            sample_bytes: CSV 最多讀取的位元組數
+
+        Returns:
+            {'columns': 欄位名稱, 'dtypes': {欄位: 推斷的型別}, 'estimated_rows': 預估資料筆數,
+             'exact': 筆數是否為實際值, 'sample': 樣本 DataFrame}
+        """
+        file_name = file_path.name if hasattr(file_path, 'name') else file_path
+        ext = os.path.splitext(file_name)[1].lower()
+        if ext not in ['.xlsx', '.xls', '.csv']:
+            raise ValueError(f"Unsupported file type: {ext}")
+
+        if ext == '.xlsx':
+            sample, estimated_rows, exact = FileHandler._probe_xlsx(file_path, sample_rows)
+        elif ext == '.xls':
+            # xlrd 沒有唯讀串流模式，以 nrows 限制解析的列數
+            if hasattr(file_path, 'seek'):
+                file_path.seek(0)
+            sample = pd.read_excel(file_path, nrows=sample_rows)
+            estimated_rows, exact = None, False
+        else:
+            sample, estimated_rows, exact = FileHandler._probe_csv(file_path, sample_rows, sample_bytes)
+
+        if hasattr(file_path, 'seek'):
+            file_path.seek(0)
+        return {
+            'columns': sample.columns.tolist(),
+            'dtypes': {col: str(dtype) for col, dtype in sample.dtypes.items()},
+            'estimated_rows': estimated_rows,
+            'exact': exact,
+            'sample': sample,
+        }
+
+    @staticmethod
+    def row_count_text(probe):
+        """probe() 結果的筆數說明（顯示用）"""
+        if probe['estimated_rows'] is None:
+            return '筆數待讀取時計算'
+        if probe['exact']:
+            return f"{probe['estimated_rows']} 筆資料"
+        return f"約 {probe['estimated_rows']} 筆資料"
+
+    @staticmethod
+    def _probe_xlsx(file_path, sample_rows):
+        from openpyxl import load_workbook
+
+        if hasattr(file_path, 'seek'):
+            file_path.seek(0)
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            sheet = workbook.worksheets[0]
+            rows = [list(row) for row in islice(sheet.iter_rows(values_only=True), sample_rows + 1)]
+            # 唯讀模式的列數取自工作表的 dimension 標記，可能不存在或包含空白列
+            max_row = sheet.max_row
+        finally:
+            workbook.close()
+
+        # 與 pd.read_excel 相同：略過結尾的空白列與空白欄
+        while rows and all(value is None for value in rows[-1]):
+            rows.pop()
+        if not rows:
+            return pd.DataFrame(), 0, True
+        width = max((idx + 1 for row in rows for idx, value in enumerate(row) if value is not None), default=0)
+        rows = [row[:width] + [None] * (width - len(row)) for row in rows]
+
+        sample = pd.DataFrame(rows[1:], columns=_column_names(rows[0])).infer_objects()
+        if len(rows) <= sample_rows:
+            return sample, len(sample), True
+        if max_row is None:
+            return sample, None, False
+        return sample, max(max_row - 1, len(sample)), False
+
+    @staticmethod
+    def _probe_csv(file_path, sample_rows, sample_bytes):
+        size = _source_size(file_path)
+        head = _head_bytes(file_path, sample_bytes)
+        complete = len(head) >= size
+
+        encoding = sniff_encoding(head, complete=complete)
+        if encoding is None:
+            text = TranscodingReader(io.BytesIO(head)).read()
+        else:
+            text = codecs.getincrementaldecoder(encoding)(errors='replace').decode(head, final=complete)
+        if not complete:
+            # 只保留完整的列，避免截斷在欄位中間
+            text = text[:text.rfind('\n') + 1] or text
+
+        parsed = pd.read_csv(io.StringIO(text))
+        sample = parsed.head(sample_rows)
+        if complete:
+            return sample, len(parsed), True
+        # 依樣本每列平均位元組數推估全檔筆數
+        return sample, max(len(parsed), round(len(parsed) * size / len(head))), False
+
+    @staticmethod
+    def iter_chunks(file_path, chunksize=50_000, **kwargs):
+        """
+        分段讀取 Excel / CSV，每次產生最多 chunksize 列的 DataFrame（不經過解析結果快取）
+
+        CSV 以 pd.read_csv(chunksize=...) 讀取，經過 TranscodingReader 以指定或開頭判斷的編碼優先解碼，
+        後段才出現其他編碼也不會中斷；Excel 以唯讀模式的 openpyxl 逐列讀取，欄名與 pd.read_excel
+        相同，完全空白的列會略過。各段的型別分別推斷。
+
+        Args:
+            file_path: UploadedFile 或檔案路徑
+            chunksize: 每段的列數
+            **kwargs: 傳給 pd.read_csv 的參數（Excel 不支援）
+
+        Yields:
+            DataFrame（index 延續前一段）
+        """
+        file_name = file_path.name if hasattr(file_path, 'name') else file_path
+        ext = os.path.splitext(file_name)[1].lower()
+        if ext == '.xlsx':
+            if kwargs:
+                raise TypeError(f"Excel 分段讀取不支援參數: {', '.join(kwargs)}")
+            yield from FileHandler._iter_xlsx(file_path, chunksize)
+        elif ext == '.xls':
+            # xlrd 沒有唯讀串流模式，只能整份讀入後再分段
+            df = FileHandler.load_file(file_path)
+            for offset in range(0, len(df), chunksize):
+                yield df.iloc[offset:offset + chunksize]
+        elif ext == '.csv':
+            encoding = kwargs.pop('encoding', None) or _csv_encoding(file_path)
+            encodings = _transcoded(encoding)
+            with _open_binary(file_path) as raw:
+                if encodings is None:
+                    reader = pd.read_csv(raw, encoding=encoding, chunksize=chunksize, **kwargs)
+                else:
+                    reader = pd.read_csv(TranscodingReader(raw, encodings), chunksize=chunksize, **kwargs)
+                with reader:
+                    yield from reader
+        else:
+            raise ValueError(f"Unsupported file type: {ext}")
+
+    @staticmethod
+    def chunks_to_csv(chunks, columns=None):
+        """
+        把分段的 DataFrame 依序寫成一份 CSV（UTF-8 含 BOM，Excel 可直接開啟）
+
+        Args:
+            chunks: DataFrame 的 iterable
+            columns: 輸出欄位（各段缺少的欄位留空）；None 表示沿用第一段的欄位
+
+        Returns:
+            (BytesIO, 總列數)
+        """
+        output = io.BytesIO()
+        output.write(codecs.BOM_UTF8)
+        rows = 0
+        header = True
+        for chunk in chunks:
+            if columns is not None:
+                chunk = chunk.reindex(columns=columns)
+            output.write(chunk.to_csv(index=False, header=header).encode('utf-8'))
+            rows += len(chunk)
+            header = False
+        if header and columns is not None:
+            output.write(pd.DataFrame(columns=columns).to_csv(index=False).encode('utf-8'))
+        output.seek(0)
+        return output, rows
+
+    @staticmethod
+    def _iter_xlsx(file_path, chunksize):
+        from openpyxl import load_workbook
+
+        if hasattr(file_path, 'seek'):
+            file_path.seek(0)
+        workbook = load_workbook(file_path, read_only=True, data_only=True)
+        try:
+            rows = workbook.worksheets[0].iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            while header and header[-1] is None:
+                header.pop()
+            columns = _column_names(header)
+            width = len(columns)
+
+            start = 0
+            batch = []
+            for row in rows:
+                row = list(row[:width])
+                if all(value is None for value in row):
+                    continue
+                batch.append(row + [None] * (width - len(row)))
+                if len(batch) == chunksize:
+                    yield FileHandler._frame(batch, columns, start)
+                    start += len(batch)
+                    batch = []
+            if batch:
+                yield FileHandler._frame(batch, columns, start)
+        finally:
+            workbook.close()
+
+    @staticmethod
+    def _frame(rows, columns, start):
+        return pd.DataFrame(rows, columns=columns, index=pd.RangeIndex(start, start + len(rows))).infer_objects()
+
+    @staticmethod
+    def _read(file_path, ext, kwargs):
+        if hasattr(file_path, 'seek'):
+            file_path.seek(0)
+        if ext in ['.xlsx', '.xls']:
+            return pd.read_excel(file_path, **kwargs)
+        if 'encoding' in kwargs:
+            return pd.read_csv(file_path, **kwargs)
+
+        # 樣本之後仍可能出現其他編碼（ASCII 標題與工號之後才是中文姓名），
+        # 除了 UTF-16 之外都從頭經過 TranscodingReader，整份檔案只解析一次
+        encoding = _csv_encoding(file_path)
+        encodings = _transcoded(encoding)
+        with _open_binary(file_path) as raw:
+            if encodings is None:
+                return pd.read_csv(raw, encoding=encoding, **kwargs)
+            return pd.read_csv(TranscodingReader(raw, encodings), **kwargs)